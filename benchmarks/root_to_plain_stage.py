@@ -0,0 +1,110 @@
+"""
+ROOTToPlain stage of the benchmarks.
+
+Converts the synthetic ntuples of a channel with their friends into a filtered Arrow
+dataset, as done per subprocess in trainings/create_training_dataset.py. The cuts and
+weights of the process selections are defined as common columns and the events passing
+any of the cuts are kept. The cache directories are removed beforehand, so the full
+conversion is timed.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trainings"))
+
+from src.dataset_manipulation import ROOTToPlain  # noqa: E402
+from src.helper import TRAINING_VARIABLES  # noqa: E402
+
+from benchmarks.synthetic_ntuples import TREE_NAME, branch_names  # noqa: E402
+from config.logging_setup_configs import setup_logging  # noqa: E402
+from config.shapes.file_names import files  # noqa: E402
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+
+def common_definitions(channel, era):
+    """Unique cuts and weights of the process selections as (name, expression) definitions."""
+    import config.shapes.process_selection as process_selection
+    from config.shapes.channel_selection import channel_selection
+
+    kwargs = dict(channel=channel, era=era, vs_jet_wp="Tight", vs_ele_wp="VVLoose", apply_wps=True)
+    selections = [channel_selection(**kwargs)]
+    for name in sorted(dir(process_selection)):
+        if name.endswith("_process_selection"):
+            try:
+                selections.append(getattr(process_selection, name)(**kwargs))
+            except Exception as e:  # not every process is defined for every channel
+                logger.debug(f"Skipping {name} for {channel}: {e}")
+
+    cuts, weights = {}, {}
+    for selection in selections:
+        for cut in selection.cuts:
+            cuts.setdefault(cut.expression, f"__common__cut__{len(cuts)}__")
+        for weight in selection.weights:
+            weights.setdefault(weight.expression, f"__common__weight__{len(weights)}__")
+    return [(name, f"(bool)({expression})") for expression, name in cuts.items()] + [
+        (name, f"(float)({expression})") for expression, name in weights.items()
+    ]
+
+
+def any_cut(df):
+    return df[[it for it in df.columns if it.startswith("__common__cut__")]].any(axis=1)
+
+
+def run(directory, friend_directory, era, channel, output_folder, max_workers=8):
+    """Convert the ntuples of a channel, returns the number of selected events."""
+    ntuple_branches, _, _ = branch_names(channel, era)
+    samples = sorted({sample for names in files[era][channel].values() for sample in names})
+    tree_and_filepaths = []
+    for sample in samples:
+        sample_directory = os.path.join(directory, era, sample, channel)
+        if not os.path.isdir(sample_directory):
+            continue
+        for filename in sorted(os.listdir(sample_directory)):
+            tree_and_filepaths.append(
+                (
+                    TREE_NAME,
+                    os.path.join(sample_directory, filename),
+                    os.path.join(friend_directory, era, sample, channel, filename),
+                )
+            )
+
+    raw_path = os.path.join(output_folder, f"{channel}_{era}_raw")
+    filtered_path = os.path.join(output_folder, f"{channel}_{era}_filtered")
+    for path in (raw_path, filtered_path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    columns = [it for it in TRAINING_VARIABLES if it in ntuple_branches] + ["event"]
+    table = (
+        ROOTToPlain(raw_path=raw_path, filtered_path=filtered_path, dtype="arrow")
+        .setup_raw_dataframe(
+            tree_and_filepaths=tree_and_filepaths,
+            definitions=common_definitions(channel, era),
+            additional_columns=columns,
+            max_workers=max_workers,
+            description=f"{channel}_{era}",
+        )
+        .filter_dataframe(filter_function=any_cut)
+        .dataframe
+    )
+    logger.info(f"Converted {len(tree_and_filepaths)} files of {channel} into {table.num_rows} events")
+    return table.num_rows
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Run the ROOTToPlain conversion on synthetic ntuples.")
+    parser.add_argument("--era", default="2018", type=str, help="Era of the samples.")
+    parser.add_argument("--channel", required=True, type=str, help="Channel to be converted.")
+    parser.add_argument("--directory", required=True, type=str, help="Directory of the ntuples.")
+    parser.add_argument("--friend-directory", required=True, type=str, help="Directory of the friend trees.")
+    parser.add_argument("--output-folder", required=True, type=str, help="Folder of the dataset caches.")
+    parser.add_argument("--max-workers", default=8, type=int, help="Number of conversion workers.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    run(args.directory, args.friend_directory, args.era, args.channel, args.output_folder, args.max_workers)
@@ -0,0 +1,405 @@
+"""
+End-to-end benchmarks of the shape production and training dataset stages on synthetic ntuples.
+
+The synthetic ntuples (see synthetic_ntuples.py) are generated once per configuration in the
+work directory and reused by later runs. Every stage is run as a separate process from the
+repository root, exactly as from the command line, and its wall time, CPU time and peak
+memory are measured. The results of a run are appended as a single JSON line to the history
+file. A stage regresses if its wall time exceeds the median of the last successful runs with
+the same configuration on the same host by more than the threshold factor.
+
+Usage:
+    python benchmarks/run_benchmarks.py --channels mt,tt --events 20000 --workdir /tmp/smhtt_benchmarks
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from config.logging_setup_configs import setup_logging
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# stages in order of execution, a stage is skipped if one of its dependencies failed
+STAGES = {
+    "produce_shapes_graphs": (),
+    "produce_shapes": (),
+    "do_estimations": ("produce_shapes",),
+    "convert_to_synced_shapes": ("do_estimations",),
+    "gof_binning": (),
+    "root_to_plain": (),
+}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmarks on synthetic ntuples.")
+    parser.add_argument("--era", default="2018", type=str, help="Era of the synthetic samples.")
+    parser.add_argument(
+        "--channels",
+        default=["et", "mt", "tt", "em"],
+        type=lambda channels: channels.split(","),
+        help="Channels, separated by a comma.",
+    )
+    parser.add_argument("--events", default=10000, type=int, help="Number of events per synthetic file.")
+    parser.add_argument("--files-per-sample", default=1, type=int, help="Number of synthetic files per sample.")
+    parser.add_argument(
+        "--workdir", default="benchmark_workdir", type=str, help="Directory of the synthetic ntuples and outputs."
+    )
+    parser.add_argument(
+        "--history",
+        default=os.path.join(REPOSITORY, "benchmarks", "history.jsonl"),
+        type=str,
+        help="JSON lines file the results are appended to.",
+    )
+    parser.add_argument(
+        "--stages",
+        default=list(STAGES),
+        type=lambda stages: stages.split(","),
+        help=f"Stages to run, separated by a comma. Available: {','.join(STAGES)}",
+    )
+    parser.add_argument("--num-processes", default=1, type=int, help="Number of processes of the stages.")
+    parser.add_argument("--num-threads", default=1, type=int, help="Number of threads of the stages.")
+    parser.add_argument(
+        "--threshold",
+        default=1.2,
+        type=float,
+        help="Allowed ratio of the wall time of a stage to its baseline.",
+    )
+    parser.add_argument(
+        "--stage-threshold",
+        default=[],
+        action="append",
+        help="Threshold of a single stage as stage=ratio, can be given multiple times.",
+    )
+    parser.add_argument(
+        "--baseline-runs",
+        default=5,
+        type=int,
+        help="Number of previous successful runs the baseline median is taken from.",
+    )
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate the synthetic ntuples.")
+    parser.add_argument("--no-record", action="store_true", help="Do not append the results to the history.")
+    return parser.parse_args()
+
+
+def git_state():
+    """Commit of the repository and whether the working tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPOSITORY, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=REPOSITORY,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def root_version():
+    try:
+        return subprocess.run(
+            ["root-config", "--version"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stage(name, commands, log_dir, cwd=REPOSITORY):
+    """Run the commands of a stage one after another and measure them together.
+
+    Returns:
+        dict: status, wall time [s], CPU time [s] and peak RSS [MB] of the stage
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPOSITORY, os.environ.get("PYTHONPATH")])))
+    log_file = os.path.join(log_dir, f"{name}.log")
+    status, cpu, max_rss = "ok", 0.0, 0
+    start = time.perf_counter()
+    with open(log_file, "w") as log:
+        for command in commands:
+            log.write(f"$ {' '.join(command)}\n")
+            log.flush()
+            process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+            # the resource usage of the process includes its (forked) workers
+            _, wait_status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(wait_status)
+            cpu += usage.ru_utime + usage.ru_stime
+            max_rss = max(max_rss, usage.ru_maxrss)
+            if process.returncode != 0:
+                status = "failed"
+                break
+    result = {
+        "status": status,
+        "wall": round(time.perf_counter() - start, 3),
+        "cpu": round(cpu, 3),
+        # ru_maxrss is given in kB on Linux
+        "max_rss_mb": round(max_rss / 1024.0, 1),
+    }
+    (logger.info if status == "ok" else logger.error)(
+        f"{name}: {status} in {result['wall']:.1f} s (cpu {result['cpu']:.1f} s, log {log_file})"
+    )
+    return result
+
+
+def friend_arguments(channels, friend_directory):
+    return [it for channel in channels for it in (f"--{channel}-friend-directory", friend_directory)]
+
+
+def stage_commands(args, directory, friend_directory):
+    """Commands of the stages, keyed by stage name, with the working directory."""
+    python, era, channels = sys.executable, args.era, args.channels
+    workdir = os.path.abspath(args.workdir)
+    common = [
+        "--era", era,
+        "--channels", ",".join(channels),
+        "--directory", directory,
+        *friend_arguments(channels, friend_directory),
+        "--vs-jet-wp", "Tight",
+        "--vs-ele-wp", "VVLoose",
+        "--skip-systematic-variations",
+        "--num-threads", str(args.num_threads),
+    ]
+    shapes = os.path.join(workdir, "shapes.root")
+    estimations = os.path.join(workdir, "estimations.root")
+    return {
+        "produce_shapes_graphs": (
+            [
+                [
+                    python, "shapes/produce_shapes.py", *common,
+                    "--output-file", os.path.join(workdir, "graphs"),
+                    "--only-create-graphs",
+                    "--graph-dir", os.path.join(workdir, "graphs"),
+                ]
+            ],
+            REPOSITORY,
+        ),
+        "produce_shapes": (
+            [
+                [
+                    python, "shapes/produce_shapes.py", *common,
+                    "--output-file", shapes,
+                    "--num-processes", str(args.num_processes),
+                ]
+            ],
+            REPOSITORY,
+        ),
+        "do_estimations": (
+            [
+                [
+                    python, "shapes/do_estimations.py",
+                    "-i", estimations,
+                    "-e", era,
+                    "--do-emb-tt",
+                    "--do-qcd",
+                    "-n", str(args.num_processes),
+                ]
+            ],
+            REPOSITORY,
+        ),
+        "convert_to_synced_shapes": (
+            [
+                [
+                    python, "shapes/convert_to_synced_shapes.py",
+                    "-e", era,
+                    "-i", estimations,
+                    "-o", os.path.join(workdir, "synced"),
+                    "-n", str(args.num_processes),
+                ]
+            ],
+            REPOSITORY,
+        ),
+        # build_binning writes its log file to the working directory
+        "gof_binning": (
+            [
+                [
+                    python, os.path.join(REPOSITORY, "gof", "build_binning.py"),
+                    "--era", era,
+                    "--channel", channel,
+                    "--directory", directory,
+                    *friend_arguments([channel], friend_directory),
+                    "--variables", "m_vis", "pt_1", "pt_2",
+                    "--num-threads", str(args.num_threads),
+                    "--output-folder", os.path.join(workdir, "gof_binning"),
+                ]
+                for channel in channels
+            ],
+            os.path.join(workdir, "logs"),
+        ),
+        "root_to_plain": (
+            [
+                [
+                    python, "benchmarks/root_to_plain_stage.py",
+                    "--era", era,
+                    "--channel", channel,
+                    "--directory", directory,
+                    "--friend-directory", friend_directory,
+                    "--output-folder", os.path.join(workdir, "root_to_plain"),
+                    "--max-workers", str(args.num_processes),
+                ]
+                for channel in channels
+            ],
+            REPOSITORY,
+        ),
+    }
+
+
+def prepare_stage(name, args):
+    """Untimed preparation of a stage, i.e. do_estimations modifies its input file in place."""
+    workdir = os.path.abspath(args.workdir)
+    if name == "do_estimations":
+        shutil.copyfile(os.path.join(workdir, "shapes.root"), os.path.join(workdir, "estimations.root"))
+    elif name == "convert_to_synced_shapes":
+        shutil.rmtree(os.path.join(workdir, "synced"), ignore_errors=True)
+        os.makedirs(os.path.join(workdir, "synced"))
+    elif name == "gof_binning":
+        os.makedirs(os.path.join(workdir, "gof_binning"), exist_ok=True)
+    elif name == "produce_shapes_graphs":
+        os.makedirs(os.path.join(workdir, "graphs"), exist_ok=True)
+
+
+def ensure_synthetic_ntuples(args, directory, friend_directory):
+    """Generate the synthetic ntuples unless they exist for the same configuration."""
+    manifest_path = os.path.join(args.workdir, "synthetic_ntuples.json")
+    manifest = {
+        "era": args.era,
+        "channels": sorted(args.channels),
+        "events": args.events,
+        "files_per_sample": args.files_per_sample,
+    }
+    if not args.regenerate and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                logger.info(f"Reusing synthetic ntuples in {directory}")
+                return
+
+    from benchmarks.synthetic_ntuples import generate
+
+    for path in (directory, friend_directory, manifest_path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    start = time.perf_counter()
+    generate(directory, friend_directory, args.era, args.channels, args.events, args.files_per_sample)
+    logger.info(f"Generated synthetic ntuples in {time.perf_counter() - start:.1f} s")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_regressions(record, history, thresholds, default_threshold, baseline_runs):
+    """Compare the wall times of the stages with the median of the previous runs.
+
+    Returns:
+        list: (stage, wall time, baseline, ratio, threshold) of the regressed stages
+    """
+    regressions = []
+    previous = [it for it in history if it["config"] == record["config"] and it["host"] == record["host"]]
+    for stage, result in record["stages"].items():
+        if result["status"] != "ok":
+            continue
+        walls = [it["stages"][stage]["wall"] for it in previous if it["stages"].get(stage, {}).get("status") == "ok"]
+        walls = walls[-baseline_runs:]
+        if not walls:
+            logger.info(f"{stage}: no baseline yet")
+            continue
+        baseline = statistics.median(walls)
+        ratio = result["wall"] / baseline if baseline > 0 else 1.0
+        threshold = thresholds.get(stage, default_threshold)
+        logger.info(f"{stage}: {result['wall']:.2f} s, baseline {baseline:.2f} s of {len(walls)} runs, ratio {ratio:.2f}")
+        if ratio > threshold:
+            regressions.append((stage, result["wall"], baseline, ratio, threshold))
+    return regressions
+
+
+def main(args):
+    unknown = [it for it in args.stages if it not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages {unknown}, available: {list(STAGES)}")
+    thresholds = {}
+    for it in args.stage_threshold:
+        stage, value = it.split("=")
+        thresholds[stage] = float(value)
+
+    args.workdir = os.path.abspath(args.workdir)
+    directory = os.path.join(args.workdir, "ntuples")
+    friend_directory = os.path.join(args.workdir, "friends", "synthetic")
+    log_dir = os.path.join(args.workdir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    ensure_synthetic_ntuples(args, directory, friend_directory)
+
+    commands = stage_commands(args, directory, friend_directory)
+    results = {}
+    for stage in STAGES:
+        if stage not in args.stages:
+            continue
+        if any(results.get(it, {"status": "ok"})["status"] != "ok" for it in STAGES[stage]):
+            logger.warning(f"{stage}: skipped, a dependency failed")
+            results[stage] = {"status": "skipped"}
+            continue
+        if any(it not in args.stages for it in STAGES[stage]):
+            logger.info(f"{stage}: using outputs of previous runs for {STAGES[stage]}")
+        prepare_stage(stage, args)
+        stage_commands_, cwd = commands[stage]
+        results[stage] = run_stage(stage, stage_commands_, log_dir, cwd=cwd)
+
+    commit, dirty = git_state()
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "root": root_version(),
+        "config": {
+            "era": args.era,
+            "channels": sorted(args.channels),
+            "events": args.events,
+            "files_per_sample": args.files_per_sample,
+            "num_processes": args.num_processes,
+            "num_threads": args.num_threads,
+        },
+        "stages": results,
+    }
+
+    regressions = check_regressions(
+        record, read_history(args.history), thresholds, args.threshold, args.baseline_runs
+    )
+    if not args.no_record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+        logger.info(f"Results appended to {args.history}")
+
+    for stage, wall, baseline, ratio, threshold in regressions:
+        logger.error(f"Regression in {stage}: {wall:.2f} s vs. {baseline:.2f} s ({ratio:.2f} > {threshold:.2f})")
+    failed = [stage for stage, result in results.items() if result["status"] != "ok"]
+    if failed:
+        logger.error(f"Failed or skipped stages: {failed}")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_arguments()))
@@ -0,0 +1,195 @@
+"""
+Synthetic CROWN-like ntuples and friend trees for local benchmarks.
+
+The samples of config/shapes/file_names.py are written in the CROWN layout
+{directory}/{era}/{sample}/{channel}/{sample}_{i}.root with the tree 'ntuple'. The branches
+are the identifiers used in the channel, process and category selections and the control
+binning of a channel, so the shape production can be booked and run on them without grid
+access. Cross section weights, fake factors and NN scores are written to friend trees of the
+same layout, entry by entry aligned with the ntuples.
+"""
+import argparse
+import logging
+import os
+import re
+import zlib
+
+import ROOT
+
+from config.logging_setup_configs import setup_logging
+from config.shapes.expressions import ExpressionError, parse
+from config.shapes.file_names import files
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+TREE_NAME = "ntuple"
+CHANNELS = ("et", "mt", "tt", "em")
+
+# branches of the friend trees, the NN scores of the categories are added per channel
+FRIEND_BRANCHES = re.compile(
+    r"^(crossSectionPerEventWeight|numberGeneratedEventsWeight|negative_events_fraction|fake_factor\w*|raw_ff\w*|ff_\w*)$"
+)
+
+# (pattern, generator) of the synthetic values, the first matching pattern is used
+BRANCH_RULES = [
+    (r"^(event|run|lumi)$", "(ULong64_t)(rdfentry_ + {offset})"),
+    (r"_max_index$", "(int)gRandom->Integer({n_classes})"),
+    (r"_max_score$", "(float)gRandom->Uniform(1. / {n_classes}, 1.)"),
+    (r"^gen_match_\d$", "(int)gRandom->Integer(6) + 1"),
+    (r"^q_\d$", "gRandom->Rndm() < 0.5 ? -1 : 1"),
+    (r"^(tau_)?decaymode_\d$", "(int)(gRandom->Rndm() < 0.5 ? 0 : gRandom->Rndm() < 0.5 ? 1 : 10)"),
+    (r"^HTXS_stage1_2_cat_pTjet30GeV$", "(int)(gRandom->Rndm() < 0.6 ? 100 + gRandom->Integer(17) : 200 + gRandom->Integer(11))"),
+    (r"^(njets|nbtag|npartons|nprebjets)$", "(int)gRandom->Poisson(1.5)"),
+    (r"^genWeight$", "gRandom->Rndm() < 0.05 ? -1.f : 1.f"),
+    (r"(weight|Weight|wgt|_sf|SF|fraction|fake_factor|ff_)", "(float)gRandom->Gaus(1., 0.05)"),
+    (r"^(is_|trg_|id_|flag|Flag_|extra|dimuon_veto|dilepton_veto|muon_veto|electron_veto)", "gRandom->Rndm() < 0.8"),
+    (r"^(j|b)?eta", "(float)gRandom->Uniform(-2.4, 2.4)"),
+    (r"phi", "(float)gRandom->Uniform(-3.14159, 3.14159)"),
+    (r"^iso_", "(float)gRandom->Exp(0.05)"),
+    (r"^(deltaR|dR)", "(float)gRandom->Uniform(0.5, 5.)"),
+    (r"^(pt|jpt|bpt|met|pfmet|puppimet|m_|mt_\d|mt_tot|mass_|mjj|genboson|mTdilepton)", "(float)(20. + gRandom->Exp(30.))"),
+]
+DEFAULT_RULE = "(float)gRandom->Rndm()"
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_]\w*$")
+_KEYWORDS = {"true", "false", "nullptr"}
+
+
+def _strings(obj, seen):
+    """All strings in the (nested) attributes of the selection and binning objects, except their names."""
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            yield from _strings(value, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for value in obj:
+            yield from _strings(value, seen)
+    elif hasattr(obj, "__dict__") and id(obj) not in seen:
+        seen.add(id(obj))
+        yield from _strings({key: value for key, value in vars(obj).items() if key != "name"}, seen)
+
+
+def _identifiers(tree):
+    if tree[0] == "atom":
+        return {tree[1]} if _IDENTIFIER.match(tree[1]) and tree[1] not in _KEYWORDS else set()
+    return set().union(*(_identifiers(it) for it in tree[1:] if isinstance(it, tuple)))
+
+
+def branch_names(channel, era):
+    """Names of the branches used in the selections and control binning of a channel.
+
+    Returns:
+        tuple: (ntuple branches, friend branches, number of NN classes), sorted
+    """
+    import config.shapes.process_selection as process_selection
+    from config.shapes.category_selection import categorization, category_mapping
+    from config.shapes.channel_selection import channel_selection
+    from config.shapes.control_binning import control_binning
+
+    kwargs = dict(
+        channel=channel,
+        era=era,
+        special=None,
+        vs_jet_wp="Tight",
+        vs_ele_wp="VVLoose",
+        selection_option="CR",
+        apply_wps=True,
+    )
+    # the control binning is keyed by the plotted expressions
+    objects = [channel_selection(**kwargs), categorization.get(channel), list(control_binning.get(channel, {}))]
+    for name in sorted(dir(process_selection)):
+        if name.endswith("_process_selection"):
+            try:
+                objects.append(getattr(process_selection, name)(**kwargs))
+            except Exception as e:  # not every process is defined for every channel
+                logger.debug(f"Skipping {name} for {channel}: {e}")
+
+    names = {"event", "run", "lumi"}
+    for text in _strings(objects, set()):
+        try:
+            names |= _identifiers(parse(text))
+        except ExpressionError:
+            continue
+
+    classes = category_mapping.get(channel, {})
+    scores = {f"{channel}_{it}" for it in classes} | {f"{channel}_max_score", f"{channel}_max_index"}
+    friends = {it for it in names if FRIEND_BRANCHES.match(it)} | scores
+    return sorted(names - friends), sorted(friends), max(len(classes), 1)
+
+
+def value_expression(name, offset=0, n_classes=1):
+    """Generator expression of the synthetic values of a branch."""
+    for pattern, expression in BRANCH_RULES:
+        if re.search(pattern, name):
+            return expression.format(offset=offset, n_classes=n_classes)
+    return DEFAULT_RULE
+
+
+def write_tree(path, branches, n_events, seed, offset=0, n_classes=1):
+    """Write a tree with synthetic values of the branches, reproducible for the same seed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ROOT.gRandom.SetSeed(seed)
+    df = ROOT.RDataFrame(n_events)
+    for name in branches:
+        df = df.Define(name, value_expression(name, offset, n_classes))
+    df.Snapshot(TREE_NAME, path, branches)
+
+
+def generate(directory, friend_directory, era, channels, n_events, files_per_sample=1):
+    """Write the ntuples and friend trees of all samples of the given channels.
+
+    Returns:
+        int: number of written ntuple files
+    """
+    written = 0
+    for channel in channels:
+        ntuple_branches, friend_branches, n_classes = branch_names(channel, era)
+        logger.info(
+            f"{channel}: {len(ntuple_branches)} ntuple and {len(friend_branches)} friend branches, "
+            f"{n_events} events per file"
+        )
+        samples = sorted({sample for names in files[era][channel].values() for sample in names})
+        for sample in samples:
+            for index in range(files_per_sample):
+                filename = f"{sample}_{index}.root"
+                seed = zlib.crc32(f"{era}/{sample}/{channel}/{index}".encode("utf-8"))
+                write_tree(
+                    os.path.join(directory, era, sample, channel, filename),
+                    ntuple_branches,
+                    n_events,
+                    seed,
+                    offset=index * n_events,
+                    n_classes=n_classes,
+                )
+                write_tree(
+                    os.path.join(friend_directory, era, sample, channel, filename),
+                    friend_branches,
+                    n_events,
+                    seed + 1,
+                    n_classes=n_classes,
+                )
+                written += 1
+    logger.info(f"Written {written} synthetic ntuples with friends")
+    return written
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Write synthetic CROWN-like ntuples and friend trees.")
+    parser.add_argument("--era", default="2018", type=str, help="Era of the samples.")
+    parser.add_argument(
+        "--channels",
+        default=list(CHANNELS),
+        type=lambda channels: channels.split(","),
+        help="Channels, separated by a comma.",
+    )
+    parser.add_argument("--directory", required=True, type=str, help="Output directory of the ntuples.")
+    parser.add_argument("--friend-directory", required=True, type=str, help="Output directory of the friend trees.")
+    parser.add_argument("--events", default=10000, type=int, help="Number of events per file.")
+    parser.add_argument("--files-per-sample", default=1, type=int, help="Number of files per sample.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    generate(args.directory, args.friend_directory, args.era, args.channels, args.events, args.files_per_sample)
@@ -10,7 +10,6 @@ from itertools import product
 from typing import Any, Dict, Iterable, Tuple, Union
 
 import numpy as np
-import pandas as pd
 import uproot
 import yaml
 from tqdm import tqdm
@@ -177,23 +176,91 @@ class PreserveROOTPathsAsStrings(yaml.Dumper):
 
 
 # requiered to be defined globally
-def pandas_df_from_root(args: Tuple[str, Iterable, str]) -> pd.DataFrame:
+def stxs_partial_sums(args: Tuple[str, str, str, str, str]) -> Tuple[str, dict]:
     """
-    Helper function to read a ROOT file and return a pandas DataFrame.
+    Helper function reading the generator weight and STXS bin of a ROOT file in chunks
+    and summing them up per STXS bin.
 
     Parameters
     ----------
-    args : Tuple[str, Iterable, str]
-        A tuple containing the file path, a list of branches to read, and the tree name
+    args : Tuple[str, str, str, str, str]
+        A tuple containing the file path, the weight branch, the STXS bin branch,
+        the tree name and the step size used for reading.
 
     Returns
     -------
-    pd.DataFrame
-        A pandas DataFrame containing the specified branches from the ROOT file.
+    Tuple[str, dict]
+        The file path and a dictionary with the number of events, the number of events
+        with negative weight and the sum of weights per bin ('bins') as well as the total
+        sum of weights ('sumw').
     """
-    file, branches, tree = args
+    file, weight_branch, cat_branch, tree, step_size = args
+    sums = defaultdict(lambda: [0, 0, 0.0])
+    total = 0.0
     with uproot.open(file) as f:
-        return f[tree].arrays(branches, library="pd")
+        for chunk in f[tree].iterate([weight_branch, cat_branch], step_size=step_size, library="np"):
+            weights = chunk[weight_branch]
+            bins, inverse = np.unique(chunk[cat_branch], return_inverse=True)
+            n_events = np.bincount(inverse, minlength=len(bins))
+            n_negative = np.bincount(inverse, weights=weights < 0, minlength=len(bins))
+            sumw = np.bincount(inverse, weights=weights, minlength=len(bins))
+            for b, _n, _neg, _sumw in zip(bins, n_events, n_negative, sumw):
+                sums[str(int(b))][0] += int(_n)
+                sums[str(int(b))][1] += int(_neg)
+                sums[str(int(b))][2] += float(_sumw)
+            total += float(weights.sum())
+    return file, {"bins": dict(sums), "sumw": total}
+
+
+class STXSPartialSumCache:
+    """
+    JSON cache of the per file partial sums of stxs_partial_sums.
+
+    Entries of local files are keyed by path, size and modification time. Remote
+    files (root://) are keyed by path only, since files on the grid storage are
+    not modified in place.
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file holding the cache.
+    """
+
+    version = 1
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    content = json.load(f)
+                if content.get("version") == self.version:
+                    self.entries = content["files"]
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable STXS cache {path}: {e}")
+
+    @staticmethod
+    def stamp(file: str) -> Union[None, list]:
+        if "://" in str(file):
+            return None
+        stat = os.stat(file)
+        return [stat.st_size, stat.st_mtime]
+
+    def get(self, file: str, branches: list) -> Union[None, dict]:
+        entry = self.entries.get(str(file))
+        if entry is None or entry["branches"] != branches or entry["stamp"] != self.stamp(file):
+            return None
+        return entry["sums"]
+
+    def put(self, file: str, branches: list, sums: dict) -> None:
+        self.entries[str(file)] = {"stamp": self.stamp(file), "branches": branches, "sums": sums}
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version, "files": self.entries}, f)
+        os.replace(tmp_path, self.path)
 
 
 def calculate_stxs_N_and_negative_fractions(
@@ -204,6 +271,8 @@ def calculate_stxs_N_and_negative_fractions(
     specific_process: Union[None, Iterable[str]] = ("ggh_htautau", "vbf_htautau"),
     specific_era: Union[None, Iterable[str]] = ("2018", "2017", "2016preVFP", "2016postVFP"),
     n_workers: int = 20,
+    cache_path: Union[None, str] = None,
+    step_size: str = "100 MB",
 ) -> dict:
     """
     Create a YAML file with the number of events, negative fractions, and xsec fractions
@@ -225,6 +294,12 @@ def calculate_stxs_N_and_negative_fractions(
         If provided, only eras matching these names will be processed.
     n_workers: int
         Number of worker processes to use for parallel processing.
+    cache_path: Union[None, str]
+        Path of the cache of the per file partial sums, defaults to the output path
+        with suffix '.partial_sums.json' (ignored by git). Only files not contained in the
+        cache or changed since are read, so adding samples only reads the new files.
+    step_size: str
+        Size of the chunks the branches are read in.
 
     Returns
     -------
@@ -293,51 +368,53 @@ def calculate_stxs_N_and_negative_fractions(
             N_events[process][era][b] = []
             negative_fractions[process][era][b] = []
 
+    branches = [KEYS["weight"], KEYS["cat"][stage][granularity]]
+    samples = []
     for process, era in filter(should_keep_process_and_era, product(BINS.keys(), ERAS)):
-        for file in (pathlib.Path(database_path) / era / process).glob("*.json"):
+        for file in sorted((pathlib.Path(database_path) / era / process).glob("*.json")):
             with open(file=file) as f:
-                files = json.load(f)["filelist"]
-
-            with mp.Pool(processes=n_workers) as pool:
-                results_iterator = pool.imap_unordered(
-                    pandas_df_from_root,
-                    [
-                        (
-                            file,
-                            [KEYS["weight"]] + [KEYS["cat"][stage][granularity]],
-                            "Events",
-                        )
-                        for file in files
-                    ],
-                )
-                df = pd.concat(
-                    list(
-                        tqdm(
-                            results_iterator,
-                            total=len(files),
-                            desc=f"Processing files of {file.name} ",
-                        )
-                    ),
-                    ignore_index=True
-                )
-
-            for b in BINS[process][stage][granularity]:
-                _df = df[df[KEYS["cat"][stage][granularity]] == b]
-
-                if not _df.empty and should_process_bin(b, file.name):
-                    n_events = _df.shape[0]
-                    positive = np.count_nonzero(_df[KEYS["weight"]] >= 0)
-                    negative = np.count_nonzero(_df[KEYS["weight"]] < 0)
-                    frac = 1.0 - 2.0 * (negative / (negative + positive))
-                    if "_Bin" not in file.name:  # is inclusive
-                        N_events[process][era][b].insert(0, n_events)
-                        negative_fractions[process][era][b].insert(0, frac)
-                        xsec_fractions[process][era][b] = (
-                            _df[KEYS["weight"]].sum() / df[KEYS["weight"]].sum()
-                        ).item()
-                    else:
-                        N_events[process][era][b].append(n_events)
-                        negative_fractions[process][era][b].append(frac)
+                samples.append((process, era, file, json.load(f)["filelist"]))
+
+    if cache_path is None:
+        cache_path = pathlib.Path(output_path).with_suffix(".partial_sums.json")
+    cache = STXSPartialSumCache(cache_path)
+    all_files = sorted({_file for *_, files in samples for _file in files})
+    missing = [_file for _file in all_files if cache.get(_file, branches) is None]
+    logger.info(f"{len(all_files) - len(missing)} of {len(all_files)} files taken from cache {cache_path}")
+    if missing:
+        with mp.Pool(processes=n_workers) as pool:
+            results_iterator = pool.imap_unordered(
+                stxs_partial_sums,
+                [(_file, *branches, "Events", step_size) for _file in missing],
+            )
+            for i, (_file, sums) in enumerate(tqdm(results_iterator, total=len(missing), desc="Reading STXS bins")):
+                cache.put(_file, branches, sums)
+                if i % 100 == 99:  # keep the progress of long runs
+                    cache.save()
+        cache.save()
+
+    for process, era, file, files in samples:
+        # sum up the partial sums of all files of the sample
+        sample_sums, sample_sumw = defaultdict(lambda: [0, 0, 0.0]), 0.0
+        for _file in files:
+            sums = cache.get(_file, branches)
+            sample_sumw += sums["sumw"]
+            for b, values in sums["bins"].items():
+                for i, value in enumerate(values):
+                    sample_sums[int(b)][i] += value
+
+        for b in BINS[process][stage][granularity]:
+            n_events, negative, sumw = sample_sums.get(b, (0, 0, 0.0))
+
+            if n_events > 0 and should_process_bin(b, file.name):
+                frac = 1.0 - 2.0 * (negative / n_events)
+                if "_Bin" not in file.name:  # is inclusive
+                    N_events[process][era][b].insert(0, n_events)
+                    negative_fractions[process][era][b].insert(0, frac)
+                    xsec_fractions[process][era][b] = sumw / sample_sumw
+                else:
+                    N_events[process][era][b].append(n_events)
+                    negative_fractions[process][era][b].append(frac)
 
     info = NestedDefaultDict(
         {
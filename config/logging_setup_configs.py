@@ -1,8 +1,14 @@
+import functools
 import logging
+import logging.handlers
+import multiprocessing
+import os
 import shutil
 import textwrap
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Generator, Union
+from typing import Any, Callable, Generator, Union
 
 
 __LOG_FILENAME__ = "routine_output.log"
@@ -16,8 +22,35 @@ BOLD_RED = "\x1b[31;1m"
 RESET = "\x1b[0m"
 
 
+_TERMINAL_WIDTH_REFRESH = 1.0  # seconds
+_terminal_width_cache = [80, float("-inf")]
+
+
+def _terminal_width() -> int:
+    """Terminal width (default 80 columns), looked up at most once per _TERMINAL_WIDTH_REFRESH."""
+    now = time.monotonic()
+    if now - _terminal_width_cache[1] > _TERMINAL_WIDTH_REFRESH:
+        try:
+            _terminal_width_cache[0] = shutil.get_terminal_size(fallback=(80, 20)).columns
+        except Exception:
+            _terminal_width_cache[0] = 80
+        _terminal_width_cache[1] = now
+    return _terminal_width_cache[0]
+
+
+def _wrap(text: str, width: int) -> list:
+    # textwrap is only needed for long lines or lines with whitespace it would change
+    if len(text) <= width and text == text.strip() and not any(c in text for c in "\t\r\v\f"):
+        return [text]
+    return textwrap.wrap(text, width=width) or [""]
+
+
 class CustomFormatter(logging.Formatter):
-    """Logging colored formatter, adapted from https://stackoverflow.com/a/56944256/3638629"""
+    """Logging colored formatter, adapted from https://stackoverflow.com/a/56944256/3638629
+
+    The layout of a record is computed once and shared by all handlers writing it,
+    i.e. the colored console and the plain file output.
+    """
     def __init__(self, use_color: bool = True) -> None:
         super().__init__()
         self.use_color = use_color
@@ -30,90 +63,98 @@ class CustomFormatter(logging.Formatter):
         }
 
     def format(self, record: logging.LogRecord) -> str:
+        term_width = _terminal_width()
+        cached = record.__dict__.get("_layout")
+        if cached is not None and cached[0] == term_width:
+            formatted = cached[1]
+        else:
+            formatted = self._layout(record, term_width)
+            record.__dict__["_layout"] = (term_width, formatted)
+        return self.FORMATS[record.levelno](formatted) if self.use_color else formatted
+
+    def _layout(self, record: logging.LogRecord, term_width: int) -> str:
         # Build the fixed parts.
         asctime = self.formatTime(record)
         left_part = f"{asctime} | {record.name} | "
         right_part = f" {record.filename}: L{record.lineno:4d}"
         mid_prefix = f"{record.levelname}: "
 
-        try:  # Determine terminal width (default to 80 columns).
-            term_width = shutil.get_terminal_size(fallback=(80, 20)).columns
-        except Exception:
-            term_width = 80
-
         # Compute lengths.
         left_len = len(left_part)
         right_len = len(right_part)
         level_len = len(mid_prefix)
         avail_mid = max(10, term_width - left_len - level_len - right_len)
+        indent = " " * (left_len + level_len)
 
-        raw_message = record.getMessage()
-        # Check if the message already contains newlines.
-        if "\n" in raw_message:
-            raw_lines = raw_message.split("\n")
-            # Process the first line specially.
-            if len(raw_lines[0]) <= avail_mid:
-                first_line_text = raw_lines[0]
-                pad_first = avail_mid - len(first_line_text)
-                line1 = f"{left_part}{mid_prefix}{first_line_text}{' ' * pad_first}{right_part}"
-            else:
-                # If the first segment is too long, wrap it.
-                wrapped_first = textwrap.wrap(raw_lines[0], width=avail_mid)
-                first_line_text = wrapped_first[0]
-                pad_first = avail_mid - len(first_line_text)
-                line1 = f"{left_part}{mid_prefix}{first_line_text}{' ' * pad_first}{right_part}"
-                # Prepend any leftover from wrapping the first line.
-                indent = " " * (left_len + level_len)
-                rest_first = []
-                for line in wrapped_first[1:]:
-                    pad = avail_mid - len(line)
-                    rest_first.append(f"{indent}{line}{' ' * pad}")
-            # For subsequent lines, we now prepend left_len padding.
-            subsequent_lines = []
-            if "\n" in raw_message:
-                # If we wrapped the first line, add the wrapped leftovers.
-                if len(raw_lines[0]) > avail_mid and wrapped_first[1:]:
-                    subsequent_lines.extend(rest_first)
-                # Then for any remaining original lines, add left_part padding.
-                for line in raw_lines[1:]:
-                    subsequent_lines.append(" " * left_len + line)
-            formatted = "\n".join([line1] + subsequent_lines)
+        # The first line is wrapped and padded to keep the source location right aligned,
+        # further lines of messages containing newlines are only indented.
+        raw_lines = record.getMessage().split("\n")
+        if len(raw_lines) > 1 and len(raw_lines[0]) <= avail_mid:
+            wrapped = [raw_lines[0]]
         else:
-            # Default handling: wrap the message automatically.
-            wrapped = textwrap.wrap(raw_message, width=avail_mid)
-            if not wrapped:
-                wrapped = [""]
-            first_line_text = wrapped[0]
-            pad_first = avail_mid - len(first_line_text)
-            line1 = f"{left_part}{mid_prefix}{first_line_text}{' ' * pad_first}{right_part}"
-            indent = " " * (left_len + level_len)
-            subsequent_lines = []
-            for line in wrapped[1:]:
-                pad = avail_mid - len(line)
-                subsequent_lines.append(f"{indent}{line}{' ' * pad}")
-            formatted = "\n".join([line1] + subsequent_lines)
+            wrapped = _wrap(raw_lines[0], avail_mid)
+        lines = [f"{left_part}{mid_prefix}{wrapped[0]}{' ' * (avail_mid - len(wrapped[0]))}{right_part}"]
+        lines.extend(f"{indent}{line}{' ' * (avail_mid - len(line))}" for line in wrapped[1:])
+        lines.extend(" " * left_len + line for line in raw_lines[1:])
 
         # Append a horizontal separator line at the end.
-        formatted += f"\n{'-' * term_width}"
-        return self.FORMATS[record.levelno](formatted) if self.use_color else formatted
+        return "\n".join(lines) + f"\n{'-' * term_width}"
 
 
 class _DuplicateFilter:
-    def __init__(self) -> None:
-        self.msgs = set()
+    """Drops records whose message was seen among the last maxsize distinct messages."""
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self.msgs = OrderedDict()
 
     def filter(self, record: logging.LogRecord) -> bool:
-        if record.msg in self.msgs:
-            return False
-        self.msgs.add(record.msg)
+        try:
+            if record.msg in self.msgs:
+                self.msgs.move_to_end(record.msg)
+                return False
+            self.msgs[record.msg] = None
+        except TypeError:  # unhashable message objects are never deduplicated
+            return True
+        if len(self.msgs) > self.maxsize:
+            self.msgs.popitem(last=False)
         return True
 
 
+# handlers shared by all loggers set up by setup_logging, one per output
+_HANDLERS = {}
+# handler forwarding records to the main process, set in queue logging workers
+_QUEUE_HANDLER = None
+
+
+def _shared_handler(key: tuple, factory: Callable[[], logging.Handler]) -> logging.Handler:
+    if key not in _HANDLERS:
+        _HANDLERS[key] = factory()
+    return _HANDLERS[key]
+
+
+def _console_handler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    handler.setFormatter(CustomFormatter(use_color=True))
+    return handler
+
+
+def _file_handler(output_file: str) -> logging.Handler:
+    handler = logging.FileHandler(output_file, "a", delay=True)
+    handler.setFormatter(CustomFormatter(use_color=False))
+    return handler
+
+
 def setup_logging(
     output_file: Union[str, None] = None,
     logger: logging.Logger = logging.getLogger(""),
     level: Union[int, None] = logging.INFO,
 ) -> logging.Logger:
+    """
+    Attaches the console and file handlers to the logger. Calling it again for the same
+    logger and output file only updates the level, all loggers share the same handlers,
+    so the output file is opened once. In queue logging workers (see LogQueue) the records
+    are forwarded to the main process instead.
+    """
     if output_file is None:
         output_file = __LOG_FILENAME__
     if level is None:
@@ -121,15 +162,14 @@ def setup_logging(
 
     logger.setLevel(level)
 
-    console_formatter = CustomFormatter(use_color=True)
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-
-    file_formatter = CustomFormatter(use_color=False)
-    file_handler = logging.FileHandler(output_file, "a")
-    file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+    if _QUEUE_HANDLER is None:
+        handlers = (
+            _shared_handler(("console",), _console_handler),
+            _shared_handler(("file", os.path.abspath(output_file)), functools.partial(_file_handler, output_file)),
+        )
+        for handler in handlers:
+            if handler not in logger.handlers:
+                logger.addHandler(handler)
 
     # Install the duplicate filter permanently if not already present.
     if not any(isinstance(f, _DuplicateFilter) for f in logger.filters):
@@ -138,6 +178,71 @@ def setup_logging(
     return logger
 
 
+def _all_loggers() -> list:
+    loggers = [it for it in logging.Logger.manager.loggerDict.values() if isinstance(it, logging.Logger)]
+    return [logging.getLogger()] + loggers
+
+
+def _init_queue_worker(queue: Any, function: Union[Callable, None], args: tuple) -> None:
+    """Replaces the handlers of setup_logging in a worker by a handler forwarding to the queue."""
+    global _QUEUE_HANDLER
+    _QUEUE_HANDLER = logging.handlers.QueueHandler(queue)
+    shared = set(_HANDLERS.values())
+    # the inherited handlers are detached without closing them, closing would flush the
+    # buffered output of the main process a second time
+    for logger in _all_loggers():
+        removed = [handler for handler in logger.handlers if handler in shared]
+        for handler in removed:
+            logger.removeHandler(handler)
+        if removed and not logger.propagate:
+            logger.addHandler(_QUEUE_HANDLER)
+    logging.getLogger().addHandler(_QUEUE_HANDLER)
+    _HANDLERS.clear()
+    if function is not None:
+        function(*args)
+
+
+class _DispatchHandler(logging.Handler):
+    """Passes records of the workers to the logger of the same name in the main process."""
+    def handle(self, record: logging.LogRecord) -> bool:
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+class LogQueue:
+    """
+    Routes the logging of worker processes through a queue to a single listener thread
+    in the main process, which writes to the handlers of the logger a record came from.
+    Workers then do not contend for the console and the log files.
+
+    Example:
+        with LogQueue() as log_queue:
+            with multiprocessing.Pool(4, initializer=log_queue.initializer(_init_worker)) as pool:
+                ...
+
+    Args:
+        context: multiprocessing context of the pool, defaults to the default context
+    """
+    def __init__(self, context: Any = None) -> None:
+        self.queue = (context or multiprocessing).Queue(-1)
+        self._listener = None
+
+    def initializer(self, function: Union[Callable, None] = None, *args: Any) -> Callable:
+        """Pool initializer setting up the queue logging, followed by function(*args)."""
+        return functools.partial(_init_queue_worker, self.queue, function, args)
+
+    def __enter__(self) -> "LogQueue":
+        self._listener = logging.handlers.QueueListener(self.queue, _DispatchHandler())
+        self._listener.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._listener.stop()
+        self._listener = None
+        self.queue.close()
+        self.queue.join_thread()
+
+
 class LogContext:
     
     def __init__(self, logger: logging.Logger) -> None:
@@ -23,24 +23,24 @@ def build_xxh_cutstring(channel):
         0.98,
         1.0,
     ]
-    cutstring = "("
+    # The bin number is looked up in one ternary chain per score, so each score is compared
+    # once per bin edge instead of once per 2D bin. Events outside of the binning or in the
+    # skipped bins end up in bin 0, as with the former sum of products.
+    rows = []
     bincounter = 0.0
-    for i, qqh_bin in enumerate(qqh_binning[:-1]):
+    for qqh_bin in qqh_binning[:-1]:
         # outer binning is the qqh score
-        cutstring += (
-            f"({channel}_qqh >= {qqh_bin} && {channel}_qqh < {qqh_binning[i+1]}) * ("
-        )
+        row = f"{channel}_ggh < {ggh_binning[0]} ? 0.0 : "
         for j, ggh_bin in enumerate(ggh_binning[:-1]):
             # inner binning is the ggh score, only if the sum of the two scores is below 1
             if qqh_bin + ggh_bin < 1.0:
-                cutstring += f"{bincounter} * ({channel}_ggh >= {ggh_bin} && {channel}_ggh < {ggh_binning[j+1]}) + "
+                row += f"{channel}_ggh < {ggh_binning[j+1]} ? {bincounter} : "
                 bincounter += 1.0
-        # remove the last " + "
-        cutstring = cutstring[:-3] + ") + "
-    # remove the last " + " and close the parenthesis
-    cutstring = cutstring[:-3] + ")"
-    # print(cutstring)
-    # print("Number of bins: {}".format(bincounter))
+        rows.append(f"({row}0.0)")
+    cutstring = f"({channel}_qqh < {qqh_binning[0]} ? 0.0 : "
+    for i, row in enumerate(rows):
+        cutstring += f"{channel}_qqh < {qqh_binning[i+1]} ? {row} : "
+    cutstring += "0.0)"
     return cutstring, bincounter
 
 
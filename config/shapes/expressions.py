@@ -0,0 +1,455 @@
+"""
+Small intermediate representation of the cut and weight expressions.
+
+The selections are written as C++ strings that are concatenated in many places, so the
+same sub-expressions reach RDataFrame in slightly different spellings and are jitted
+again for every process, channel and variation. Expressions are parsed once into
+hashable trees, from which
+
+    - a canonical spelling (minimal parentheses, no whitespace, flattened and
+      deduplicated logical chains) is emitted, so identical expressions are identical
+      strings, and
+    - sub-expressions shared between several expressions are hoisted into common
+      Define columns, see SharedDefinitions.
+
+The operand order is never changed, guards like "n>0&&x[0]>1" keep working.
+"""
+
+import hashlib
+import logging
+import re
+from collections import Counter
+from functools import lru_cache
+
+from config.logging_setup_configs import setup_logging
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?[fFuUlL]*)
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<name>[A-Za-z_]\w*(?:(?:::|\.|->)[A-Za-z_]\w*)*)
+    | (?P<operator>\|\||&&|==|!=|<=|>=|<<|>>|[-+*/%<>!?:(),\[\]&|^~])
+    """,
+    re.VERBOSE,
+)
+
+_CAST_TYPES = {"bool", "char", "double", "float", "int", "long", "short", "unsigned", "size_t"}
+
+# C++ binding strength of the binary operators, higher binds tighter
+_BINARY = {
+    "||": 2,
+    "&&": 3,
+    "|": 4,
+    "^": 5,
+    "&": 6,
+    "==": 7,
+    "!=": 7,
+    "<": 8,
+    "<=": 8,
+    ">": 8,
+    ">=": 8,
+    "<<": 9,
+    ">>": 9,
+    "+": 10,
+    "-": 10,
+    "*": 11,
+    "/": 11,
+    "%": 11,
+}
+_TERNARY, _UNARY, _POSTFIX, _ATOM = 1, 12, 13, 14
+_LOGICAL = {"&&", "||"}
+
+# functions without side effects that are safe to evaluate for every event
+_PURE_FUNCTIONS = {
+    "abs", "fabs", "sqrt", "exp", "log", "log10", "pow", "min", "max", "sin", "cos", "tan",
+    "atan", "atan2", "cosh", "sinh", "tanh", "floor", "ceil", "round",
+    "std::abs", "std::fabs", "std::sqrt", "std::exp", "std::log", "std::pow", "std::min", "std::max",
+    "std::cos", "std::sin", "std::floor", "std::ceil", "TMath::Abs", "TMath::Sqrt", "TMath::Exp",
+    "TMath::Log", "TMath::Power", "TMath::Min", "TMath::Max", "TMath::Cos", "TMath::Sin",
+}
+
+# Trees are nested tuples, the first element is the node type:
+#   ("atom", text)                      names, numbers and string literals
+#   ("call", function, *arguments)
+#   ("index", base, index)
+#   ("cast", type, operand)
+#   ("unary", operator, operand)
+#   ("binary", operator, lhs, rhs)
+#   ("logical", operator, *operands)    flattened && and || chains
+#   ("ternary", condition, if_true, if_false)
+
+
+# template argument lists, i.e. static_cast<int>(...) or std::numeric_limits<float>::max()
+_TEMPLATE_ARGUMENTS = re.compile(r"\s*<[\w\s:,*<>]*")
+_TEMPLATE_CONTINUATION = re.compile(r"\s*(?:\(|::)")
+
+
+def _template_end(expression, position):
+    """End of the template argument list starting at position, None if there is none.
+
+    A '<' after a name is only read as a template if its arguments are closed and followed
+    by a call or a scope, otherwise it is a comparison.
+    """
+    match = _TEMPLATE_ARGUMENTS.match(expression, position)
+    if match is None:
+        return None
+    depth = 0
+    for end in range(position, match.end()):
+        if expression[end] == "<":
+            depth += 1
+        elif expression[end] == ">":
+            depth -= 1
+            if depth == 0:
+                return end + 1 if _TEMPLATE_CONTINUATION.match(expression, end + 1) else None
+    return None
+
+
+def _tokenize(expression):
+    tokens, position = [], 0
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None:
+            raise ExpressionError(f"Unexpected character '{expression[position]}' at {position} in: {expression}")
+        kind, text, position = match.lastgroup, match.group(), match.end()
+        if kind == "name":
+            # the template arguments and a following scope are part of the name
+            end = _template_end(expression, position)
+            while end is not None:
+                text += re.sub(r"\s*([<>,:*])\s*", r"\1", expression[position:end].strip())
+                position = end
+                scope = re.compile(r"\s*::\s*[A-Za-z_]\w*").match(expression, position)
+                if scope is None:
+                    break
+                text += re.sub(r"\s+", "", scope.group())
+                position = scope.end()
+                end = _template_end(expression, position)
+        if kind != "space":
+            tokens.append((kind, text))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, text = self.peek()
+        if kind is None or (value is not None and text != value):
+            raise ExpressionError(f"Expected '{value or 'operand'}' at token {self.position} in: {self.expression}")
+        self.position += 1
+        return kind, text
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("Empty expression")
+        tree = self.ternary()
+        if self.position != len(self.tokens):
+            raise ExpressionError(f"Unexpected '{self.peek()[1]}' at token {self.position} in: {self.expression}")
+        return tree
+
+    def ternary(self):
+        condition = self.binary(_TERNARY + 1)
+        if self.peek() == ("operator", "?"):
+            self.take("?")
+            if_true = self.ternary()
+            self.take(":")
+            return ("ternary", condition, if_true, self.ternary())
+        return condition
+
+    def binary(self, min_strength):
+        lhs = self.unary()
+        while True:
+            kind, text = self.peek()
+            strength = _BINARY.get(text) if kind == "operator" else None
+            if strength is None or strength < min_strength:
+                return lhs
+            self.take()
+            rhs = self.binary(strength + 1)
+            if text in _LOGICAL:
+                lhs = _logical(text, lhs, rhs)
+            else:
+                lhs = ("binary", text, lhs, rhs)
+
+    def unary(self):
+        kind, text = self.peek()
+        if kind == "operator" and text in ("!", "-", "+", "~"):
+            self.take()
+            operand = self.unary()
+            return operand if text == "+" else ("unary", text, operand)
+        if (
+            (kind, text) == ("operator", "(")
+            and self.peek(1)[0] == "name"
+            and self.peek(1)[1] in _CAST_TYPES
+            and self.peek(2) == ("operator", ")")
+        ):
+            self.position += 3
+            return ("cast", self.tokens[self.position - 2][1], self.unary())
+        return self.postfix()
+
+    def postfix(self):
+        tree = self.atom()
+        while True:
+            kind, text = self.peek()
+            if (kind, text) == ("operator", "(") and tree[0] == "atom":
+                self.take("(")
+                arguments = []
+                if self.peek() != ("operator", ")"):
+                    arguments.append(self.ternary())
+                    while self.peek() == ("operator", ","):
+                        self.take(",")
+                        arguments.append(self.ternary())
+                self.take(")")
+                tree = ("call", tree[1], *arguments)
+            elif (kind, text) == ("operator", "["):
+                self.take("[")
+                index = self.ternary()
+                self.take("]")
+                tree = ("index", tree, index)
+            else:
+                return tree
+
+    def atom(self):
+        kind, text = self.take()
+        if kind in ("name", "number", "string"):
+            return ("atom", text)
+        if text == "(":
+            tree = self.ternary()
+            self.take(")")
+            return tree
+        raise ExpressionError(f"Unexpected '{text}' at token {self.position - 1} in: {self.expression}")
+
+
+def _logical(operator, *operands):
+    flat = []
+    for operand in operands:
+        for it in operand[2:] if operand[0] == "logical" and operand[1] == operator else (operand,):
+            if it not in flat:  # repeating a pure operand does not change the result
+                flat.append(it)
+    return flat[0] if len(flat) == 1 else ("logical", operator, *flat)
+
+
+@lru_cache(maxsize=None)
+def parse(expression):
+    """Parse an expression into its tree, cached per spelling.
+
+    Raises:
+        ExpressionError: if the expression is not understood
+    """
+    return _Parser(str(expression)).parse()
+
+
+def _strength(tree):
+    if tree[0] in ("binary", "logical"):
+        return _BINARY[tree[1]]
+    return {"ternary": _TERNARY, "unary": _UNARY, "cast": _UNARY, "call": _POSTFIX, "index": _POSTFIX}.get(
+        tree[0], _ATOM
+    )
+
+
+def _join(lhs, operator, rhs):
+    # keep "a- -b" or "a< <b" from merging into a different token
+    if rhs and (operator[-1] + rhs[0]) in ("++", "--", "&&", "||", "<<", ">>", "<=", ">=", "==", "//", "/*"):
+        return f"{lhs}{operator} {rhs}"
+    return f"{lhs}{operator}{rhs}"
+
+
+def emit(tree):
+    """Canonical spelling of a tree."""
+
+    def wrapped(child, min_strength, parent=None):
+        text = emit(child)
+        # mixed logical or unary chains are parenthesized, cling warns about them otherwise
+        mixed_logic = parent in _LOGICAL and child[0] == "logical"
+        if _strength(child) < min_strength or mixed_logic:
+            return f"({text})"
+        return text
+
+    kind = tree[0]
+    if kind == "atom":
+        return tree[1]
+    if kind == "call":
+        return f"{tree[1]}({','.join(emit(it) for it in tree[2:])})"
+    if kind == "index":
+        return f"{wrapped(tree[1], _POSTFIX)}[{emit(tree[2])}]"
+    if kind in ("cast", "unary"):
+        prefix = f"({tree[1]})" if kind == "cast" else tree[1]
+        operand = wrapped(tree[2], _POSTFIX if tree[2][0] in ("unary", "cast") else _UNARY)
+        return _join("", prefix, operand)
+    if kind == "binary":
+        strength = _BINARY[tree[1]]
+        return _join(wrapped(tree[2], strength), tree[1], wrapped(tree[3], strength + 1))
+    if kind == "logical":
+        strength = _BINARY[tree[1]]
+        return tree[1].join(wrapped(it, strength, tree[1]) for it in tree[2:])
+    if kind == "ternary":
+        return f"{wrapped(tree[1], _TERNARY + 1)}?{emit(tree[2])}:{wrapped(tree[3], _TERNARY)}"
+    raise ExpressionError(f"Unknown node {kind}")
+
+
+@lru_cache(maxsize=None)
+def canonical(expression):
+    """Canonical spelling of an expression.
+
+    Expressions that can not be parsed are returned with normalized whitespace only.
+    """
+    try:
+        return emit(parse(expression))
+    except ExpressionError as e:
+        logger.debug(f"Keeping expression as is: {e}")
+        return re.sub(r"\s+", " ", str(expression)).strip()
+
+
+def _size(tree):
+    return 1 + sum(_size(it) for it in tree[1:] if isinstance(it, tuple))
+
+
+def _names(tree):
+    if tree[0] == "atom":
+        return {tree[1]}
+    return set().union(*(_names(it) for it in tree[1:] if isinstance(it, tuple)))
+
+
+def _is_pure(tree):
+    """True if evaluating the tree for every event can not fail, e.g. by an out of range index."""
+    kind = tree[0]
+    if kind == "atom":
+        return True
+    if kind == "index" or (kind == "binary" and tree[1] in ("/", "%")):
+        return False
+    if kind == "call" and tree[1] not in _PURE_FUNCTIONS:
+        return False
+    return all(_is_pure(it) for it in tree[1:] if isinstance(it, tuple))
+
+
+def _children(tree):
+    """Children of a tree with a flag whether they are always evaluated."""
+    kind = tree[0]
+    if kind == "logical":
+        return [(it, i == 0) for i, it in enumerate(tree[2:])]
+    if kind == "ternary":
+        return [(tree[1], True), (tree[2], False), (tree[3], False)]
+    return [(it, True) for it in tree[1:] if isinstance(it, tuple)]
+
+
+class SharedDefinitions:
+    """
+    Sub-expressions used more than once in a set of expressions, hoisted into shared columns.
+
+    Register all expressions with add, then define the columns of definitions() before
+    the expressions returned by rewrite. A sub-expression is only hoisted where it is
+    evaluated unconditionally, or if it is pure, so short-circuit guards stay effective.
+
+    Args:
+        prefix (str): prefix of the names of the shared columns
+        min_uses (int): minimal number of uses of a shared sub-expression
+        min_size (int): minimal number of nodes of a shared sub-expression
+        exclude (iterable): columns that are defined after the shared ones, sub-expressions
+            using them are not shared
+    """
+
+    def __init__(self, prefix="shared_expr_", min_uses=2, min_size=7, exclude=()):
+        self.prefix = prefix
+        self.min_uses = min_uses
+        self.min_size = min_size
+        self.exclude = set(exclude)
+        self._trees = []
+        self._shared = None
+
+    def add(self, expression):
+        try:
+            self._trees.append(parse(canonical(expression)))
+        except ExpressionError as e:
+            logger.debug(f"Not sharing sub-expressions of: {e}")
+        self._shared = None
+
+    def _hoistable(self, tree, always):
+        return (always or _is_pure(tree)) and not (self.exclude and self.exclude & _names(tree))
+
+    def _walk(self, tree, visit, always=True):
+        """Visit all nodes that may be hoisted, visit returns True to stop descending."""
+        if tree[0] != "atom" and self._hoistable(tree, always) and visit(tree):
+            return
+        for child, child_always in _children(tree):
+            self._walk(child, visit, always and child_always)
+
+    def _uses(self, selected):
+        uses = Counter()
+
+        def visit(tree):
+            if tree in selected:
+                uses[tree] += 1
+                return True
+            return False
+
+        for tree in self._trees:
+            self._walk(tree, visit)
+        for tree in selected:
+            for child, always in _children(tree):
+                self._walk(child, visit, always)
+        return uses
+
+    def _select(self):
+        if self._shared is None:
+            counts = Counter()
+            for tree in self._trees:
+                self._walk(tree, lambda it: counts.update([it]))
+            selected = {it for it, n in counts.items() if n >= self.min_uses and _size(it) >= self.min_size}
+            # a sub-expression only used inside a larger shared one is not worth its own column
+            while True:
+                uses = self._uses(selected)
+                dropped = {it for it in selected if uses[it] < self.min_uses}
+                if not dropped:
+                    break
+                selected -= dropped
+            self._shared = {
+                it: self.prefix + hashlib.sha1(emit(it).encode("utf-8")).hexdigest()[:12] for it in selected
+            }
+        return self._shared
+
+    def _rewrite(self, tree, always=True, top=False):
+        shared = self._select()
+        if not top and tree in shared and self._hoistable(tree, always):
+            return ("atom", shared[tree])
+        if tree[0] == "atom":
+            return tree
+        children = iter(_children(tree))
+        rewritten = [
+            self._rewrite(it, always and next(children)[1]) if isinstance(it, tuple) else it for it in tree[1:]
+        ]
+        return (tree[0], *rewritten)
+
+    def definitions(self):
+        """Shared columns as (name, expression), each defined after the columns it uses."""
+        shared, ordered = self._select(), []
+
+        def collect(tree):
+            for child, _ in _children(tree):
+                collect(child)
+            if tree in shared and tree not in ordered:
+                ordered.append(tree)
+
+        for tree in self._trees:
+            collect(tree)
+        return [(shared[it], emit(self._rewrite(it, top=True))) for it in ordered]
+
+    def rewrite(self, expression):
+        """Expression using the shared columns, the canonical expression if it can not be parsed."""
+        try:
+            tree = parse(canonical(expression))
+        except ExpressionError:
+            return canonical(expression)
+        return emit(self._rewrite(tree))
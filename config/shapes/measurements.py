@@ -0,0 +1,145 @@
+"""
+Declarative definitions of the measurements produced with shapes/produce_shapes_tauid_es.py.
+
+A measurement fixes the categorization, the
+scans of shifted quantities (e.g. the tau energy scale) and which
+systematic variations are booked. All measurements share a single booking
+path, so a joint production (i.e. TauID+ES) books the nominal graphs once.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from config.shapes.category_selection import categorization as default_categorization
+from config.shapes.elees_measurement_binning import categorization as elees_categorization
+from config.shapes.taues_measurement_binning import categorization as taues_categorization
+from config.shapes.tauid_measurement_binning import categorization as tauid_categorization
+from config.shapes.variations import anti_iso_lt, anti_iso_lt_no_ff, same_sign
+
+
+@dataclass(frozen=True)
+class ShiftScan:
+    """
+    Scan of a shifted quantity, booked as one embedded dataset per scan point.
+
+    Attributes
+    ----------
+    channel : str
+        Channel the scan is booked for.
+    shiftstring : str
+        Prefix of the shifted branches, the branch of a point is <quantity>__<shiftstring>_<point>.
+    start : float
+        First point of the scan in percent.
+    step : float
+        Distance between two points in percent.
+    num_points : int
+        Number of scan points.
+    variations : tuple
+        Variations booked for every scan point.
+    """
+
+    channel: str
+    shiftstring: str
+    start: float
+    step: float
+    num_points: int
+    variations: tuple = ()
+
+    @property
+    def points(self):
+        return [self.start + self.step * i for i in range(self.num_points)]
+
+
+@dataclass(frozen=True)
+class MeasurementSpec:
+    """
+    Definition of a measurement.
+
+    Attributes
+    ----------
+    special_analysis : str or None
+        Name of the special analysis used for the channel selection, None for the default analysis.
+    categorization : dict
+        Categorization per channel.
+    scans : tuple
+        Scans of shifted quantities (ShiftScan).
+    book_tau_systematics : bool
+        Book the tau energy scale, tau ID and fake factor variations. Disabled if
+        the tau itself is the measured object.
+    signal_acceptance : bool
+        Book the acceptance variations of the ggH and qqH signals.
+    additional_processes : frozenset
+        Processes added to the default process selection.
+    processes : dict
+        Fixed process selection per channel, used instead of the default selection
+        if no process selection is given.
+    """
+
+    special_analysis: Optional[str]
+    categorization: dict
+    scans: Tuple[ShiftScan, ...] = ()
+    book_tau_systematics: bool = True
+    signal_acceptance: bool = False
+    additional_processes: FrozenSet[str] = frozenset()
+    processes: Dict[str, FrozenSet[str]] = field(default_factory=dict)
+
+    def scans_for(self, channel):
+        return [scan for scan in self.scans if scan.channel == channel]
+
+
+tau_es_scan = ShiftScan("mt", "EMBtauESshift", -2.5, 0.1, 51, (same_sign, anti_iso_lt))
+tau_es_scan_wide = ShiftScan("mt", "EMBtauESshift", -4.0, 0.1, 81, (same_sign, anti_iso_lt_no_ff))
+ele_es_scan = ShiftScan("ee", "EMBelefakeESshift", -1.5, 0.05, 51, (same_sign,))
+# finer tau ES grid used by the TauES measurement of shapes/produce_shapes_elees.py
+tau_es_scan_fine = ShiftScan("mt", "EMBtauESshift", -1.2, 0.05, 47, (same_sign, anti_iso_lt))
+
+MEASUREMENTS = {
+    None: MeasurementSpec(None, default_categorization),
+    "TauID": MeasurementSpec("TauID", tauid_categorization, book_tau_systematics=False),
+    "TauID+ES": MeasurementSpec(
+        "TauID", tauid_categorization, scans=(tau_es_scan_wide,), book_tau_systematics=False
+    ),
+    "TauES": MeasurementSpec("TauES", taues_categorization, scans=(tau_es_scan,)),
+    "EleES": MeasurementSpec(
+        "EleES",
+        elees_categorization,
+        scans=(ele_es_scan,),
+        signal_acceptance=True,
+        additional_processes=frozenset({"ggh", "qqh"}),
+        processes={
+            "ee": frozenset(
+                {"data", "ttl", "ttt", "vvl", "vvt", "ztt", "zl", "w", "emb", "ztt_nlo", "zl_nlo"}
+            )
+        },
+    ),
+}
+
+
+# measurements of shapes/produce_shapes_elees.py
+ELEES_MEASUREMENTS = dict(
+    MEASUREMENTS,
+    TauES=MeasurementSpec("TauES", taues_categorization, scans=(tau_es_scan_fine,)),
+)
+
+
+def get_measurement(special_analysis, es=False, measurements=MEASUREMENTS):
+    """
+    Get the definition of a measurement.
+
+    Parameters
+    ----------
+    special_analysis : str or None
+        Name of the special analysis, None for the default analysis.
+    es : bool
+        Add the tau energy scale scan to the TauID measurement.
+    measurements : dict
+        Definitions of the measurements by name, i.e. MEASUREMENTS or ELEES_MEASUREMENTS.
+
+    Returns
+    -------
+    MeasurementSpec
+        Definition of the measurement.
+    """
+    key = "TauID+ES" if special_analysis == "TauID" and es else special_analysis
+    if key not in measurements:
+        raise ValueError("Unknown special analysis: {}".format(special_analysis))
+    return measurements[key]
@@ -1510,14 +1510,14 @@ VV.J, VV.L, VV.T = VV.wrap_next(VVJ), VV.wrap_next(VVL), VV.wrap_next(VVT)
 # qqH125
 qqH125 = make_chainable_process_selection(qqH125_process_selection)
 for b in range(200, 211):
-    exec(f"qqH125_{b} = get_stxs_bin_selection('vbf_htautau', {b})")
-    exec(f"qqH125.bin{b} = qqH125.wrap_next(qqH125_{b})")
+    globals()[f"qqH125_{b}"] = get_stxs_bin_selection("vbf_htautau", b)
+    setattr(qqH125, f"bin{b}", qqH125.wrap_next(globals()[f"qqH125_{b}"]))
 
 # ggH125
 ggH125 = make_chainable_process_selection(ggH125_process_selection)
 for b in range(100, 117):
-    exec(f"ggH125_{b} = get_stxs_bin_selection('ggh_htautau', {b})")
-    exec(f"ggH125.bin{b} = ggH125.wrap_next(ggH125_{b})")
+    globals()[f"ggH125_{b}"] = get_stxs_bin_selection("ggh_htautau", b)
+    setattr(ggH125, f"bin{b}", ggH125.wrap_next(globals()[f"ggH125_{b}"]))
 
 # Individual and miscellaneous
 ZTT_embedded = ZTT_embedded_process_selection
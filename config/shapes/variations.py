@@ -1,5 +1,6 @@
 import inspect
 import logging
+import time
 from itertools import product
 from typing import Any, Callable
 
@@ -185,7 +186,7 @@ def set_ff_type(ff_type):
         raise KeyError(f"Fake factor option {ff_type} not found in FF_OPTIONS.")
 
     logger.info(f"Setting fake factor option to {ff_type}= {FF_OPTIONS[ff_type]}")
-    RuntimeVariables.FF_name_lt = FF_OPTIONS[ff_type]["lt"]
+    RuntimeVariables.bind(FF_name_lt=FF_OPTIONS[ff_type]["lt"])
     logger.warning(
         """
             Setting fake factor option for tt_1 and tt_2 is in parts not implemented yet.
@@ -195,18 +196,51 @@ def set_ff_type(ff_type):
     )
 
 
+_RESOLUTION_STATS = {
+    "contexts": 0,
+    "lazy_hits": 0,
+    "lazy_misses": 0,
+    "lazy_factory_seconds": 0.0,
+    "unrolled_hits": 0,
+    "unrolled_misses": 0,
+}
+
+
+def resolution_stats() -> dict:
+    """
+    Returns the statistics of the variation resolution since the last reset.
+
+    Returns:
+        dict: Number of bound contexts, cache hits and misses of the LazyVariable and
+            unrolled collection resolution and the time spent in LazyVariable factories.
+    """
+    return dict(_RESOLUTION_STATS)
+
+
+def reset_resolution_stats() -> None:
+    """
+    Resets the statistics of the variation resolution.
+    """
+    for key in _RESOLUTION_STATS:
+        _RESOLUTION_STATS[key] = type(_RESOLUTION_STATS[key])()
+
+
 class RuntimeVariables(object):
     """
     A singleton-like container class holding several variables that can be adjusted in time.
 
+    The variables are changed via bind (or set_ff_type), which also binds their current
+    values as the context in which LazyVariables and unrolled variation collections are
+    resolved. Resolved variations are memoized per context.
+
     Attributes:
         FF_name_lt (str): Fake factor name for the "lt" channel.
         FF_name_tt_1 (str): Fake factor name for the first "tt" channel.
         FF_name_tt_2 (str): Fake factor name for the second "tt" channel.
 
     Usage:
-        >>> used = Used()
-        >>> print(used.FF_name_lt)
+        >>> RuntimeVariables.bind(FF_name_lt="fake_factor_2")
+        >>> print(RuntimeVariables.FF_name_lt)
 
     Note:
         This class implements a singleton-like pattern by returning the same instance
@@ -216,11 +250,45 @@ class RuntimeVariables(object):
     FF_name_tt_1 = FF_OPTIONS["fake_factor"]["tt_1"]
     FF_name_tt_2 = FF_OPTIONS["fake_factor"]["tt_2"]
 
+    _context = None
+
     def __new__(cls) -> "RuntimeVariables":
         if not hasattr(cls, "instance"):
             cls.instance = super(RuntimeVariables, cls).__new__(cls)
             return cls.instance
 
+    @classmethod
+    def bind(cls, **values: Any) -> tuple:
+        """
+        Sets the given variables and binds the current values as resolution context.
+
+        Args:
+            **values: New values of the runtime variables, i.e. FF_name_lt="fake_factor_2".
+
+        Returns:
+            tuple: The bound context.
+        """
+        for name, value in values.items():
+            if name.startswith("_") or not hasattr(cls, name):
+                raise AttributeError(f"{cls.__name__} has no runtime variable {name}")
+            setattr(cls, name, value)
+        cls._context = (cls.FF_name_lt, cls.FF_name_tt_1, cls.FF_name_tt_2)
+        _RESOLUTION_STATS["contexts"] += 1
+        logger.debug(f"Bound runtime context {cls._context}")
+        return cls._context
+
+    @classmethod
+    def context(cls) -> tuple:
+        """
+        Returns the bound context, binding the current values if nothing was bound yet.
+
+        Returns:
+            tuple: The bound context.
+        """
+        if cls._context is None:
+            return cls.bind()
+        return cls._context
+
 
 class LazyVariable:
     """
@@ -228,8 +296,8 @@ class LazyVariable:
 
     This class accepts a factory callable that produces the actual instance to use.
     Any attribute access or string representation is delegated to the instance returned
-    by the factory at call time, ensuring that modifications to the underlying variable
-    are reflected immediately.
+    by the factory for the context bound in RuntimeVariables. The factory is called once
+    per context, later accesses reuse the memoized instance.
 
     Usage:
         >>> def my_factory() -> SomeClass:
@@ -247,11 +315,28 @@ class LazyVariable:
             factory (Callable[[], Any]): A callable that returns the actual variable instance.
         """
         self.factory: Callable[[], Any] = factory
+        self._instances: dict = {}
+        if logger.isEnabledFor(logging.DEBUG):
+            caller = inspect.currentframe().f_back
+            logger.debug(f"LazyVariable created at {caller.f_code.co_filename}:{caller.f_lineno}")
+
+    def resolve(self) -> Any:
+        """
+        Returns the instance of the factory for the bound context.
+
+        Returns:
+            Any: The memoized instance.
+        """
+        context = RuntimeVariables.context()
         try:
-            caller = inspect.stack()[1]
-            logger.debug(f"LazyVariable created at {caller.filename}:{caller.lineno} with {inspect.getsource(factory)}")
-        except NameError:  # logger or inspect not defined
-            pass
+            instance = self._instances[context]
+            _RESOLUTION_STATS["lazy_hits"] += 1
+        except KeyError:
+            start = time.perf_counter()
+            instance = self._instances[context] = self.factory()
+            _RESOLUTION_STATS["lazy_factory_seconds"] += time.perf_counter() - start
+            _RESOLUTION_STATS["lazy_misses"] += 1
+        return instance
 
     def __getattr__(self, name: str) -> Any:
         """
@@ -263,13 +348,9 @@ class LazyVariable:
         Returns:
             Any: The attribute value from the instantiated object.
         """
-        instance = self.factory()
-        try:
-            caller = inspect.stack()[1]
-            logger.debug(f"LazyVariable __getattr__: '{name}' called from {caller.filename}:{caller.lineno}, returning {instance}")
-        except NameError:  # logger or inspect not defined
-            pass
-        return getattr(instance, name)
+        if name.startswith("__") or name in ("factory", "_instances"):  # not yet initialized, i.e. during copying
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
 
     def __repr__(self) -> str:
         """
@@ -278,13 +359,7 @@ class LazyVariable:
         Returns:
             str: The string representation of the object returned by the factory.
         """
-        result = repr(self.factory())
-        try:
-            caller = inspect.stack()[1]
-            logger.debug(f"LazyVariable __repr__: called from {caller.filename}:{caller.lineno}, returning {result}")
-        except NameError:  # logger or inspect not defined
-            pass
-        return result
+        return repr(self.resolve())
 
     def __str__(self) -> str:
         """
@@ -293,13 +368,24 @@ class LazyVariable:
         Returns:
             str: The string representation of the object returned by the factory.
         """
-        result = str(self.factory())
-        try:
-            caller = inspect.stack()[1]
-            logger.debug(f"LazyVariable __str__: called from {caller.filename}:{caller.lineno}, returning {result}")
-        except NameError:  # logger or inspect not defined
-            pass
-        return result
+        return str(self.resolve())
+
+
+def resolve(variation: Any) -> Any:
+    """
+    Resolves LazyVariables, also inside (nested) lists, for the bound context.
+
+    Args:
+        variation (Any): A variation, a LazyVariable or a list of them.
+
+    Returns:
+        Any: The variation with all LazyVariables replaced by their instances.
+    """
+    if isinstance(variation, LazyVariable):
+        return variation.resolve()
+    if isinstance(variation, list):
+        return [resolve(it) for it in variation]
+    return variation
 
 
 #  Variations needed for the various jet background estimations.
@@ -718,7 +804,7 @@ ff_variations_lt = [
 # lt channel
 ff_variations_tau_es_lt = [
     LazyVariable(  # requieres LazyVariation since Used.FF_name_lt may be defined later
-        lambda: ReplaceVariableReplaceCutAndAddWeight(
+        lambda name=name, variation=variation: ReplaceVariableReplaceCutAndAddWeight(
             name,
             variation,
             "tau_iso",
@@ -738,7 +824,7 @@ ff_variations_tau_es_lt = [
 # lt for emb only for correlation
 ff_variations_tau_es_emb_lt = [
     LazyVariable(  # requieres LazyVariation since Used.FF_name_lt may be defined later
-        lambda: ReplaceVariableReplaceCutAndAddWeight(
+        lambda name=name, variation=variation: ReplaceVariableReplaceCutAndAddWeight(
             name,
             variation,
             "tau_iso",
@@ -758,7 +844,7 @@ ff_variations_tau_es_emb_lt = [
 # # tt channel
 ff_variations_tau_es_tt = [
     LazyVariable(  # requieres LazyVariation since Used.FF_name_tt may be defined later
-        lambda: ReplaceVariableReplaceCutAndAddWeight(
+        lambda name=name, variation=variation: ReplaceVariableReplaceCutAndAddWeight(
             name,
             variation,
             "tau_iso",
@@ -800,7 +886,7 @@ ff_variations_tau_es_tt = [
 # tt channel emb process
 ff_variations_tau_es_tt = [
     LazyVariable(  # requieres LazyVariation since Used.FF_name_tt may be defined later
-        lambda: ReplaceVariableReplaceCutAndAddWeight(
+        lambda name=name, variation=variation: ReplaceVariableReplaceCutAndAddWeight(
             name,
             variation,
             "tau_iso",
@@ -1065,25 +1151,42 @@ is still possible.
 """
 
 
+# memoized sums of collections and unrolled collections per bound context
+_COLLECTION_SUMS = {}
+_UNROLLED = {}
+
+
 class VariationCollectionMeta(type):
     def __add__(cls, other):
         if not issubclass(other, _VariationCollection):
             raise TypeError("Cannot add {} to {}".format(other, cls))
-        merged_attrs = {
-            **{k: v for k, v in cls.__dict__.items() if not k.startswith("__")},
-            **{k: v for k, v in other.__dict__.items() if not k.startswith("__")},
-        }
-        return type(f"{cls.__name__}+{other.__name__}", (_VariationCollection,), merged_attrs)
+        if (cls, other) not in _COLLECTION_SUMS:
+            merged_attrs = {
+                **{k: v for k, v in cls.__dict__.items() if not k.startswith("__")},
+                **{k: v for k, v in other.__dict__.items() if not k.startswith("__")},
+            }
+            _COLLECTION_SUMS[(cls, other)] = type(
+                f"{cls.__name__}+{other.__name__}", (_VariationCollection,), merged_attrs
+            )
+        return _COLLECTION_SUMS[(cls, other)]
 
 
 class _VariationCollection(metaclass=VariationCollectionMeta):
     @classmethod
     def unrolled(cls):
-        results = []
-        for name, value in cls.__dict__.items():
-            if not name.startswith("__"):
-                results.append(value)
-        return results
+        """
+        Returns all variations of the collection with LazyVariables resolved for the
+        bound context. The result is memoized per collection and context.
+        """
+        key = (cls, RuntimeVariables.context())
+        if key in _UNROLLED:
+            _RESOLUTION_STATS["unrolled_hits"] += 1
+        else:
+            _RESOLUTION_STATS["unrolled_misses"] += 1
+            _UNROLLED[key] = [
+                resolve(value) for name, value in cls.__dict__.items() if not name.startswith("__")
+            ]
+        return list(_UNROLLED[key])
 
 
 class SemiLeptonicFFEstimations(_VariationCollection):
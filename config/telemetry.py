@@ -0,0 +1,200 @@
+"""
+Stage level telemetry of the Python entry points of run_analysis.sh.
+
+A StageTelemetry wraps the main function of an entry point and appends a single JSON line
+per run to a local store: wall time, CPU time and peak RSS of the process (including its
+finished workers), the counted events and items and the timing of the consecutive phases
+of the stage (i.e. booking, optimization, event loop and writing). The store defaults to
+output/telemetry.jsonl and can be moved with SMHTT_TELEMETRY_STORE, an empty value disables
+the recording. The events are only counted if SMHTT_TELEMETRY_COUNT_EVENTS is set, as the
+inputs are reopened for it. See misc_helper/telemetry_report.py for the report of the stored runs.
+"""
+import datetime
+import fcntl
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from config.logging_setup_configs import setup_logging
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+STORE_ENVIRONMENT = "SMHTT_TELEMETRY_STORE"
+DEFAULT_STORE = os.path.join("output", "telemetry.jsonl")
+# Counting the events reopens every input after the event loop, it is only done on request.
+COUNT_EVENTS_ENVIRONMENT = "SMHTT_TELEMETRY_COUNT_EVENTS"
+
+
+def store_path() -> Union[str, None]:
+    """Path of the telemetry store, None if the recording is disabled."""
+    return os.environ.get(STORE_ENVIRONMENT, DEFAULT_STORE) or None
+
+
+def count_events_enabled() -> bool:
+    """True if the processed events are counted, see COUNT_EVENTS_ENVIRONMENT."""
+    return os.environ.get(COUNT_EVENTS_ENVIRONMENT, "") not in ("", "0")
+
+
+def _usage() -> Tuple[float, int]:
+    """CPU time [s] and peak RSS [kB] of this process and its finished child processes."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, max(own.ru_maxrss, children.ru_maxrss)
+
+
+class StageTelemetry:
+    """
+    Resource usage and phase timings of a single run of a stage.
+
+    Phases are consecutive, starting a phase ends the current one. Counters hold the number
+    of processed items, the events per second are derived from the 'events' counter and
+    the wall time of the 'event_loop' phase (or of the whole stage without such a phase).
+    Without counted events, i.e. with the counting disabled, they are left out of the record.
+
+    Args:
+        stage (str): name of the stage, i.e. the entry point
+        store (str): JSON lines file the record is appended to, None disables the recording
+        **metadata: configuration of the run, i.e. era and channels
+    """
+
+    def __init__(self, stage: str, store: Union[str, None] = "", **metadata: Any) -> None:
+        self.stage = stage
+        self.store = store_path() if store == "" else store
+        self.metadata = metadata
+        self.phases = OrderedDict()
+        self.counters = Counter()
+        self._phase = None
+        self._start = None
+
+    def __enter__(self) -> "StageTelemetry":
+        self._time = datetime.datetime.now().isoformat(timespec="seconds")
+        self._start = (time.perf_counter(), _usage()[0])
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> bool:
+        self.end_phase()
+        record = self.record("ok" if exc_type is None else f"failed: {exc_type.__name__}")
+        logger.info(
+            f"{self.stage}: {record['wall']:.1f} s wall, {record['cpu']:.1f} s cpu, {record['max_rss_mb']:.0f} MB peak RSS"
+            + "".join(f", {name} {values['wall']:.1f} s" for name, values in record["phases"].items())
+        )
+        if self.store is not None:
+            self.write(record)
+        return False
+
+    def start_phase(self, name: str) -> None:
+        """End the current phase and start the given one, repeated phases are accumulated."""
+        self.end_phase()
+        self._phase = (name, time.perf_counter(), _usage()[0])
+
+    def end_phase(self) -> None:
+        if self._phase is None:
+            return
+        name, wall, cpu = self._phase
+        phase = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+        phase["wall"] += time.perf_counter() - wall
+        phase["cpu"] += _usage()[0] - cpu
+        self._phase = None
+
+    def count(self, name: str, value: Union[int, None]) -> None:
+        """Add processed items, i.e. events or histograms, unknown counts (None) are ignored."""
+        if value is not None:
+            self.counters[name] += value
+
+    def record(self, status: str = "ok") -> Dict[str, Any]:
+        wall, cpu = time.perf_counter() - self._start[0], _usage()[0] - self._start[1]
+        loop = self.phases.get("event_loop", {}).get("wall") or wall
+        record = {
+            "time": self._time,
+            "stage": self.stage,
+            "status": status,
+            "argv": sys.argv,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "wall": round(wall, 3),
+            "cpu": round(cpu, 3),
+            "max_rss_mb": round(_usage()[1] / 1024.0, 1),
+            "counters": dict(self.counters),
+            "phases": {
+                name: {"wall": round(values["wall"], 3), "cpu": round(values["cpu"], 3)}
+                for name, values in self.phases.items()
+            },
+            "metadata": self.metadata,
+        }
+        if self.counters["events"] and loop:
+            record["events_per_second"] = round(self.counters["events"] / loop, 1)
+        return record
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Append the record to the store, locked as jobs may share it. Failures are only logged."""
+        try:
+            directory = os.path.dirname(os.path.abspath(self.store))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.store, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write telemetry to {self.store}: {e}")
+
+
+def read_store(path: str) -> List[Dict[str, Any]]:
+    """All records of a telemetry store in the order of writing, unreadable lines are skipped."""
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def count_entries(paths: Iterable[str], tree_name: str = "ntuple") -> Union[int, None]:
+    """
+    Number of entries of the trees in the given files. Only the file headers are read.
+    Remote files (i.e. root://) are not opened, None is returned if any of them is remote.
+    """
+    import ROOT
+
+    entries = 0
+    for path in paths:
+        if "://" in path:
+            return None
+        rootfile = ROOT.TFile.Open(path, "READ")
+        if not rootfile or rootfile.IsZombie():
+            return None
+        tree = rootfile.Get(tree_name)
+        entries += tree.GetEntries() if tree else 0
+        rootfile.Close()
+    return entries
+
+
+def graph_entries(graphs: Iterable[Any]) -> Union[int, None]:
+    """
+    Number of events looped over to fill the given ntuple_processor graphs, files are opened once.
+    Only counted if enabled with SMHTT_TELEMETRY_COUNT_EVENTS, None if disabled or unknown.
+    """
+    if not count_events_enabled():
+        return None
+    entries, total = {}, 0
+    for graph in graphs:
+        for ntuple in getattr(getattr(graph, "unit_block", None), "ntuples", None) or []:
+            path = getattr(ntuple, "path", None)
+            if path is None:
+                logger.info("Events not counted, the inputs of the graphs are unknown.")
+                return None
+            key = (path, getattr(ntuple, "directory", "ntuple"))
+            if key not in entries:
+                entries[key] = count_entries([key[0]], key[1])
+            if entries[key] is None:
+                logger.info(f"Events not counted, the input {key[0]} is remote or not readable.")
+                return None
+            total += entries[key]
+    return total
@@ -2,44 +2,36 @@
 # -*- coding: utf-8 -*-
 
 
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True  # disable ROOT internal argument parser
+import os
 import sys
 
+sys.path.extend([".", ".."])  # if executed within smhtt_ul or smhtt_ul/datacards
+from fitting.scan_results import branch_names, read_limit_tree
+
 
 if __name__ == "__main__":
     filename = sys.argv[1]
     print("[INFO] Print fit results from file {}.".format(filename))
-    f = ROOT.TFile(filename)
-    if f == None:
+    if "://" not in filename and not os.path.exists(filename):
         raise Exception("[ERROR] File {} not found.".format(filename))
 
-    tree = f.Get("limit")
-    if tree == None:
+    try:
+        names = [name for name in branch_names(filename) if name.startswith("r")]
+    except KeyError:
         raise Exception("[ERROR] Tree {} not found in file {}.".format("limit", filename))
-    num_entries = tree.GetEntries()
+    columns = read_limit_tree(filename, names)
 
-    indices = {}
-    count = 1
+    # row 0 holds the best fit, the lower and upper limits of the n-th POI follow in rows 2n-1 and 2n
     results = {}
-    for key in tree.GetListOfBranches():
-        name = key.GetName()
-        if name.startswith("r"):
-            indices[name] = count
-            count += 2
-            results[name] = [-999, -999, -999]
-
-    for i, row in enumerate(tree):
-        for name in indices:
-            if i == 0:
-                results[name][0] = getattr(row, name)
-            elif i == indices[name]:
-                results[name][1] = getattr(row, name)
-            elif i == indices[name]+1:
-                results[name][2] = getattr(row, name)
+    for count, name in enumerate(names):
+        values = columns[name]
+        results[name] = [
+            values[index] if index < len(values) else -999
+            for index in (0, 2 * count + 1, 2 * count + 2)
+        ]
 
     for name in results:
         r = results[name][0]
         d = results[name][1]
         u = results[name][2]
-        print("[INFO] {0:<30}: {1:.4f} {2:.4f} +{3:.4f}".format(name, r, d-r, u-r))
\ No newline at end of file
+        print("[INFO] {0:<30}: {1:.4f} {2:.4f} +{3:.4f}".format(name, r, d-r, u-r))
@@ -132,11 +132,8 @@ if [[ $MODE == "SYNC" ]]; then
         -o ${shapes_output_synced} \
         --variable-selection ${VARIABLES} \
         --special "EleES" \
-        -n 1
-    POSTFIX="-ML"
-    inputfile="htt_${CHANNEL}.inputs-sm-Run${ERA}${POSTFIX}.root"
-
-    hadd -f $shapes_output_synced/$inputfile $shapes_output_synced/${ERA}-${CHANNEL}*.root
+        --output-name "htt_{channel}.inputs-sm-Run{era}-ML.root" \
+        -n 4
 
     exit 0
 fi
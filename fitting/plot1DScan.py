@@ -8,6 +8,9 @@ import json
 import argparse
 import os.path
 
+sys.path.extend([".", ".."])  # if executed within smhtt_ul or smhtt_ul/fitting
+from fitting.scan_results import best_fit, evaluator, find_crossings, graph_arrays, read_scan, to_tgraph, uncertainties
+
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 
@@ -23,15 +26,10 @@ def read(scan, param, files, chop, remove_near_min, rezero,
          remove_delta=None, improve=False, remove_dups=True):
     # print files
     goodfiles = [f for f in files if plot.TFileIsGood(f)]
-    limit = plot.MakeTChain(goodfiles, 'limit')
-    graph = plot.TGraphFromTree(
-        limit, param, '2*deltaNLL', 'quantileExpected > -0.5')
-    # print 'INPUT'
+    # sorted by the POI, duplicates are removed from the arrays before the TGraph is built
+    graph = to_tgraph(*read_scan(goodfiles, param, unique=remove_dups), scan)
+    # print('INPUT')
     # graph.Print()
-    graph.SetName(scan)
-    graph.Sort()
-    if remove_dups:
-        plot.RemoveGraphXDuplicates(graph)
     if remove_delta is not None:
         plot.RemoveSmallDelta(graph, remove_delta)
     plot.RemoveGraphYAbove(graph, chop)
@@ -59,7 +57,7 @@ def ProcessEnvelope(main, others, relax_safety=0):
     for oth in others:
         gr = oth['graph']
         # gr.Print()
-        for i in xrange(gr.GetN()):
+        for i in range(gr.GetN()):
             x = gr.GetX()[i]
             y = gr.GetY()[i]
             if x not in vals:
@@ -95,10 +93,10 @@ def ProcessEnvelope(main, others, relax_safety=0):
     gr.SetPoint(len(vals), min_x, min_y)
     gr.Sort()
 
-    for i in xrange(gr.GetN()):
+    for i in range(gr.GetN()):
         gr.GetY()[i] -= min_y
     for oth in others:
-        for i in xrange(oth['graph'].GetN()):
+        for i in range(oth['graph'].GetN()):
             oth['graph'].GetY()[i] -= min_y
         # print 'OTHER'
         # oth['graph'].Print()
@@ -108,7 +106,7 @@ def ProcessEnvelope(main, others, relax_safety=0):
 
 
 def ProcessEnvelopeNew(main, others, relax_safety=0):
-    print '[ProcessEnvelope] Will create envelope from %i other scans' % len(others)
+    print('[ProcessEnvelope] Will create envelope from %i other scans' % len(others))
     min_x = min([oth['graph'].GetX()[0] for oth in others])
     max_x = max([oth['graph'].GetX()[oth['graph'].GetN() - 1] for oth in others])
     # print '(min_x,max_x) = (%f, %f)' % (min_x, max_x)
@@ -117,7 +115,7 @@ def ProcessEnvelopeNew(main, others, relax_safety=0):
     x = min_x
     xvals = []
     yvals = []
-    for i in xrange(npoints):
+    for i in range(npoints):
         yset = []
         for oth in others:
             gr = oth['graph']
@@ -131,7 +129,7 @@ def ProcessEnvelopeNew(main, others, relax_safety=0):
 
     gr = ROOT.TGraph()
     gr.Set(len(xvals))  # will not contain the best fit
-    for i in xrange(gr.GetN()):
+    for i in range(gr.GetN()):
         gr.SetPoint(i, xvals[i], yvals[i])
 
     # print 'Envelope'
@@ -147,10 +145,10 @@ def ProcessEnvelopeNew(main, others, relax_safety=0):
     gr.SetPoint(len(xvals), min_x, min_y)
     gr.Sort()
 
-    for i in xrange(gr.GetN()):
+    for i in range(gr.GetN()):
         gr.GetY()[i] -= min_y
     for oth in others:
-        for i in xrange(oth['graph'].GetN()):
+        for i in range(oth['graph'].GetN()):
             oth['graph'].GetY()[i] -= min_y
         # print 'OTHER'
         # oth['graph'].Print()
@@ -174,14 +172,8 @@ def BuildScan(scan, param, files, color, yvals, chop,
 
     else:
         graph = pregraph
-    bestfit = None
-    fitsx = []
-    fitsy = []
-    for i in xrange(graph.GetN()):
-        fitsx.append(graph.GetX()[i])
-        fitsy.append(graph.GetY()[i])
-
-    bestfit = fitsx[fitsy.index(min(fitsy))]
+    fitsx, fitsy = graph_arrays(graph)
+    bestfit = best_fit(fitsx, fitsy)
     if envelope:
         plot.RemoveGraphYAll(graph, 0.)
     graph.SetMarkerColor(color)
@@ -199,33 +191,19 @@ def BuildScan(scan, param, files, color, yvals, chop,
     assert(bestfit is not None)
     if not envelope:
         plot.ImproveMinimum(graph, func)
+    # the graph may have been changed by the envelope and the minimum improvement
+    fitsx, fitsy = graph_arrays(graph)
     crossings = {}
-    cross_1sig = None
-    cross_2sig = None
-    other_1sig = []
-    other_2sig = []
-    val = None
-    val_2sig = None
     for yval in yvals:
-        crossings[yval] = plot.FindCrossingsWithSpline(graph, func, yval)
-        for cr in crossings[yval]:
-            cr["contains_bf"] = cr["lo"] <= bestfit and cr["hi"] >= bestfit
-    for cr in crossings[yvals[0]]:
-        if cr['contains_bf']:
-            val = (bestfit, cr['hi'] - bestfit, cr['lo'] - bestfit)
-            cross_1sig = cr
-        else:
-            other_1sig.append(cr)
+        # crossings of the drawn spline
+        crossings[yval] = find_crossings(fitsx, fitsy, yval, function=evaluator(spline))
+    val, cross_1sig, other_1sig = uncertainties(crossings[yvals[0]], bestfit)
     if len(yvals) > 1:
-        for cr in crossings[yvals[1]]:
-            if cr['contains_bf']:
-                val_2sig = (bestfit, cr['hi'] - bestfit, cr['lo'] - bestfit)
-                cross_2sig = cr
-            else:
-                other_2sig.append(cr)
+        val_2sig, cross_2sig, other_2sig = uncertainties(crossings[yvals[1]], bestfit)
     else:
         val_2sig = (0., 0., 0.)
         cross_2sig = cross_1sig
+        other_2sig = []
     func.SetLineColor(color)
     func.SetLineWidth(2)
     return {
@@ -247,7 +225,7 @@ def BuildScan(scan, param, files, color, yvals, chop,
 #         graph.Print()
 #         raise RuntimeError('Attempting to build %s scan from TGraph with zero or one point (see above)' % files)
 #     bestfit = None
-#     for i in xrange(graph.GetN()):
+#     for i in range(graph.GetN()):
 #         if graph.GetY()[i] == 0.:
 #             bestfit = graph.GetX()[i]
 #     graph.SetMarkerColor(color)
@@ -362,13 +340,13 @@ if args.pub:
     args.no_input_label = True
 
 
-print '--------------------------------------'
-print args.output
-print '--------------------------------------'
+print('--------------------------------------')
+print(args.output)
+print('--------------------------------------')
 
 fixed_name = args.POI
 if args.translate is not None:
-    print args.translate
+    print(args.translate)
     with open(args.translate) as jsonfile:
         name_translate = json.load(jsonfile)
     if args.POI in name_translate:
@@ -390,21 +368,21 @@ if args.premade:
     tmp_gr = tmp_file.Get('main').Clone()
 main_scan = BuildScan(args.output, args.POI, [args.main], args.main_color, yvals, args.chop,
                         args.remove_near_min, args.rezero, remove_delta=main_remove_delta, improve=main_improve, pregraph=tmp_gr, envelope=args.envelope)
-print main_scan
+print(main_scan)
 n_brk = 0
 n_env = len(args.others) if args.others is not None else 0
 if args.envelope and args.breakdown:
     n_brk = len(args.breakdown.split(','))
-    n_env = len(args.others) / n_brk
-    print '>> Number of components in breakdown: %i' % n_brk
-    print '>> Number of components in envelope: %i' % n_env
+    n_env = len(args.others) // n_brk
+    print('>> Number of components in breakdown: %i' % n_brk)
+    print('>> Number of components in envelope: %i' % n_env)
 
 other_scans = []
 other_scans_opts = []
 if args.others is not None:
     for i, oargs in enumerate(args.others):
         splitargs = oargs.split(':')
-        print splitargs
+        print(splitargs)
         other_scans_opts.append(splitargs)
         tmp_gr = None
         if args.premade:
@@ -428,16 +406,16 @@ if args.others is not None:
             )
 
 if args.envelope and args.breakdown:
-    for i in xrange(n_env):
-        print '>> Correcting breakdown offsets for envelope index %i' % i
+    for i in range(n_env):
+        print('>> Correcting breakdown offsets for envelope index %i' % i)
         gr = other_scans[i]['graph'].Clone()
         plot.RemoveSmallDelta(gr, 1E-6)
         bf = other_scans[i+n_env]['val'][0]
         y_off = other_scans[i]['func'].Eval(bf)
-        print'>> Evaluating for offset at best-fit of %f gives %f' % (bf, y_off)
-        for j in xrange(1, n_brk):
+        print('>> Evaluating for offset at best-fit of %f gives %f' % (bf, y_off))
+        for j in range(1, n_brk):
             oth = other_scans[i+j*n_env]
-            print '>> Applying shift of %f to graph %s' % (y_off, other_scans_opts[i+j*n_env][0])
+            print('>> Applying shift of %f to graph %s' % (y_off, other_scans_opts[i+j*n_env][0]))
             plot.ApplyGraphYOffset(oth['graph'], y_off)
             color = oth['func'].GetLineColor()
             oth['spline'] = ROOT.TSpline3("spline3", oth['graph'])
@@ -447,7 +425,7 @@ if args.envelope and args.breakdown:
             oth['func'].SetLineColor(color)
             NAMECOUNTER += 1
     new_others = []
-    for j in xrange(n_brk):
+    for j in range(n_brk):
         if args.old_envelope:
             new_gr = ProcessEnvelope(main_scan, other_scans[n_env*j:n_env*(j+1)], args.relax_safety)
         else:
@@ -635,7 +613,7 @@ if args.breakdown is None and args.envelope is False:
         textfit = '#color[%s]{%s = %.3f{}^{#plus %.3f}_{#minus %.3f}}' % (
             other_scans_opts[i][2], fixed_name, other['val'][0], other['val'][1], abs(other['val'][2]))
         if args.upper_cl:
-            print 'here'
+            print('here')
             textfit = '#color[%s]{%s < %.2f (%i%% CL)}' % (
                 other_scans_opts[i][2], fixed_name, other['val'][1], int(args.upper_cl * 100))
         pt.AddText(textfit)
@@ -659,12 +637,12 @@ if args.breakdown is not None:
     for i, br in enumerate(breakdown):
         if i < (len(breakdown) - 1):
             if (abs(v_hi[i + 1]) > abs(v_hi[i])):
-                print 'ERROR SUBTRACTION IS NEGATIVE FOR %s HI' % br
+                print('ERROR SUBTRACTION IS NEGATIVE FOR %s HI' % br)
                 hi = 0.
             else:
                 hi = math.sqrt(v_hi[i] * v_hi[i] - v_hi[i + 1] * v_hi[i + 1])
             if (abs(v_lo[i + 1]) > abs(v_lo[i])):
-                print 'ERROR SUBTRACTION IS NEGATIVE FOR %s LO' % br
+                print('ERROR SUBTRACTION IS NEGATIVE FOR %s LO' % br)
                 lo = 0.
             else:
                 lo = math.sqrt(v_lo[i] * v_lo[i] - v_lo[i + 1] * v_lo[i + 1])
@@ -699,9 +677,9 @@ signif_x = None
 signif_y = None
 if args.signif:
     gr = main_scan['graph']
-    for i in xrange(gr.GetN()):
+    for i in range(gr.GetN()):
         if abs(gr.GetX()[i] - 0.) < 1E-4:
-            print 'Found scan point at %s = %.6f' % (args.POI, gr.GetX()[i])
+            print('Found scan point at %s = %.6f' % (args.POI, gr.GetX()[i]))
             pt.SetY1(pt.GetY1() - 0.1)
             pt.SetX1(0.52)
             signif = ROOT.Math.normal_quantile_c(
@@ -715,7 +693,7 @@ if args.signif:
             pt.AddText(txt_signif)
     signif = ROOT.Math.normal_quantile_c(
                 ROOT.Math.chisquared_cdf_c(main_scan['func'].Eval(1.0), 1) / 2., 1)
-    print '-2#DeltalnL @ %s = %.1f is %.3f, signif = %.2fsigma' % (fixed_name, 1., main_scan['func'].Eval(1.0), signif)
+    print('-2#DeltalnL @ %s = %.1f is %.3f, signif = %.2fsigma' % (fixed_name, 1., main_scan['func'].Eval(1.0), signif))
 
 
 # pt.AddText(textfit)
@@ -758,8 +736,8 @@ if args.json is not None:
     if args.breakdown is not None:
         js[args.model][args.POI].update(breakdown_json)
     if args.envelope is not None:
-        print main_scan['other_1sig']
-        print main_scan['other_2sig']
+        print(main_scan['other_1sig'])
+        print(main_scan['other_2sig'])
         js_extra = {
             'OtherLimitLo': 0.,
             'OtherLimitHi': 0.,
@@ -880,7 +858,7 @@ if len(other_scans) >= 3 and args.legend_pos == 1:
 
 legend.AddEntry(main_scan['func'], args.main_label, 'L')
 if args.breakdown and args.envelope:
-    for i in xrange(n_env):
+    for i in range(n_env):
         legend.AddEntry(new_others[i]['func'], other_scans_opts[i][1], 'L')
 else:
     for i, other in enumerate(other_scans):
@@ -0,0 +1,259 @@
+"""
+Columnar access to the results of combine fits and likelihood scans.
+
+The 'limit' trees of the higgsCombine files are read with uproot into numpy arrays, once per
+file and set of branches, instead of looping over the entries with getattr. On top, the
+deltaNLL scans are interpolated, the crossings with the confidence levels are found and the
+uncertainties are extracted with vectorized numpy operations, for 1D scans with a cubic
+spline and for 2D scans with a grid interpolation.
+
+The crossings are returned in the format of CombineHarvester's FindCrossingsWithSpline,
+dicts with the interval limits 'lo' and 'hi' and the flags 'valid_lo' and 'valid_hi' that
+are False if the interval is open towards the end of the scan range.
+"""
+import functools
+import os
+
+import numpy as np
+import uproot
+
+LIMIT_TREE = "limit"
+# quantileExpected of the best fit is -1, of the scan points (and the best fit in scans) > -1
+SCAN_QUANTILE = -0.5
+
+
+def _file_stamp(path):
+    """Path, size and modification time of a file, remote files are identified by their path."""
+    if "://" in path:
+        return path, None, None
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+
+@functools.lru_cache(maxsize=128)
+def _read_arrays(stamp, branches, tree_name):
+    with uproot.open(stamp[0]) as rootfile:
+        tree = rootfile[tree_name]
+        missing = [branch for branch in branches if branch not in tree.keys()]
+        if missing:
+            raise KeyError(f"Branches {missing} not found in tree {tree_name} of {stamp[0]}")
+        arrays = tree.arrays(list(branches), library="np")
+    # the arrays are shared by all callers, protect them against modification
+    for array in arrays.values():
+        array.flags.writeable = False
+    return arrays
+
+
+def branch_names(path, tree_name=LIMIT_TREE):
+    """Names of the branches of the limit tree of a file."""
+    with uproot.open(path) as rootfile:
+        return list(rootfile[tree_name].keys())
+
+
+def read_limit_tree(paths, branches, tree_name=LIMIT_TREE):
+    """
+    Read branches of the limit trees of one or multiple files, concatenated in file order.
+    The arrays of each file are cached, repeated reads of unchanged files do not open them.
+
+    Args:
+        paths (str or list): path(s) of the higgsCombine files
+        branches (list): names of the branches
+        tree_name (str): name of the tree
+
+    Returns:
+        dict: branch name -> numpy array (read only)
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    branches = tuple(branches)
+    parts = [_read_arrays(_file_stamp(path), branches, tree_name) for path in paths]
+    if len(parts) == 1:
+        return parts[0]
+    return {branch: np.concatenate([part[branch] for part in parts]) for branch in branches}
+
+
+def remove_duplicates(x, *columns):
+    """Remove points with the same x as the previous point from x-sorted arrays."""
+    keep = np.ones(len(x), dtype=bool)
+    keep[1:] = x[1:] != x[:-1]
+    return (x[keep], *(column[keep] for column in columns))
+
+
+def read_scan(paths, poi, min_quantile=SCAN_QUANTILE, unique=True, y_cut=None, rezero=False):
+    """
+    Points of a 1D likelihood scan, sorted by the parameter of interest.
+
+    Args:
+        paths (str or list): path(s) of the higgsCombine files of the scan
+        poi (str): parameter of interest
+        min_quantile (float): only points with quantileExpected > min_quantile are used
+        unique (bool): keep only the first point of equal values of the parameter of interest
+        y_cut (float): remove points with 2*deltaNLL above this value
+        rezero (bool): shift the scan to zero if a point below the best fit is found
+
+    Returns:
+        tuple: numpy arrays of the parameter of interest and 2*deltaNLL
+    """
+    arrays = read_limit_tree(paths, [poi, "deltaNLL", "quantileExpected"])
+    selected = arrays["quantileExpected"] > min_quantile
+    x, y = arrays[poi][selected].astype(np.float64), 2.0 * arrays["deltaNLL"][selected].astype(np.float64)
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+    if unique:
+        x, y = remove_duplicates(x, y)
+    if y_cut is not None:
+        x, y = x[y <= y_cut], y[y <= y_cut]
+    if rezero and len(y) and y.min() < 0.0:
+        y = y - y.min()
+    return x, y
+
+
+def best_fit(x, y):
+    """Parameter value of the minimum of the scan points."""
+    return float(x[np.argmin(y)])
+
+
+def spline(x, y):
+    """Cubic spline through the scan points, evaluated vectorized."""
+    from scipy.interpolate import CubicSpline
+
+    return CubicSpline(x, y)
+
+
+def evaluator(obj):
+    """Vectorized evaluation of a ROOT object with an Eval method, i.e. the TSpline3 drawn with the scan."""
+
+    def function(x):
+        return np.array([obj.Eval(float(it)) for it in np.atleast_1d(x)], dtype=np.float64)
+
+    return function
+
+
+def find_crossings(x, y, level, function=None, iterations=60):
+    """
+    Intervals of a 1D scan below a level, i.e. 1 (68% CL) or 4 (95% CL) of -2 deltaNLL.
+
+    The crossings are bracketed by the scan points and refined on the interpolating function
+    by a bisection of all brackets at once.
+
+    Args:
+        x, y (numpy.ndarray): sorted scan points
+        level (float): level of the crossings
+        function (callable): vectorized interpolation of the scan, defaults to a cubic spline
+        iterations (int): number of bisection steps
+
+    Returns:
+        list: intervals as dicts with 'lo', 'hi', 'valid_lo' and 'valid_hi'
+    """
+    if function is None:
+        function = spline(*remove_duplicates(x, y))
+    # points on the level count as inside of the interval
+    above = y - level > 0.0
+    brackets = np.flatnonzero(above[:-1] != above[1:])
+    lo, hi = x[brackets].astype(np.float64), x[brackets + 1].astype(np.float64)
+    lo_above = above[brackets]
+    for _ in range(iterations):
+        mid = 0.5 * (lo + hi)
+        mid_above = function(mid) - level > 0.0
+        same = mid_above == lo_above
+        lo, hi = np.where(same, mid, lo), np.where(same, hi, mid)
+    crosses = (0.5 * (lo + hi)).tolist()
+    x_min, x_max = float(x[0]), float(x[-1])
+
+    intervals, current = [], None
+    for cross, falling in zip(crosses, lo_above):
+        if falling and current is None:
+            current = {"lo": cross, "hi": x_max, "valid_lo": True, "valid_hi": False}
+        elif not falling and current is None:
+            intervals.append({"lo": x_min, "hi": cross, "valid_lo": False, "valid_hi": True})
+        elif not falling:
+            current.update(hi=cross, valid_hi=True)
+            intervals.append(current)
+            current = None
+    if current is not None:
+        intervals.append(current)
+    if not intervals:
+        intervals.append({"lo": x_min, "hi": x_max, "valid_lo": False, "valid_hi": False})
+    return intervals
+
+
+def uncertainties(crossings, bestfit):
+    """
+    Uncertainty of the best fit from the interval containing it.
+
+    Returns:
+        tuple: ((best fit, up, down) or None, interval containing the best fit or None, other intervals)
+    """
+    value, interval, others = None, None, []
+    for crossing in crossings:
+        crossing["contains_bf"] = bool(crossing["lo"] <= bestfit <= crossing["hi"])
+        if crossing["contains_bf"]:
+            value, interval = (bestfit, crossing["hi"] - bestfit, crossing["lo"] - bestfit), crossing
+        else:
+            others.append(crossing)
+    return value, interval, others
+
+
+def interpolate_2d(x, y, z, x_range, y_range, n_points, method="cubic"):
+    """
+    Interpolation of scattered 2D scan points on a regular grid, points outside of the
+    convex hull of the scan are dropped.
+
+    Returns:
+        tuple: flat numpy arrays of the x and y values of the grid points and the interpolation
+    """
+    from scipy.interpolate import griddata
+
+    grid_x, grid_y = np.mgrid[
+        x_range[0] : x_range[1] : n_points * 1j,
+        y_range[0] : y_range[1] : n_points * 1j,
+    ]
+    values = griddata(np.column_stack([x, y]), z, (grid_x, grid_y), method)
+    valid = np.isfinite(values)
+    return grid_x[valid], grid_y[valid], values[valid]
+
+
+def bin_average_2d(x, y, values, x_range, y_range, n_bins, empty=999.0):
+    """
+    Average of the values in n_bins x n_bins bins, as the bin contents of a TProfile2D filled
+    with them. Values on the upper edges are dropped like overflow. Bins with a zero average,
+    i.e. empty bins, are filled once more with the value empty, so empty bins are set to empty.
+
+    Returns:
+        numpy.ndarray: averages indexed by [x bin, y bin]
+    """
+    ix = np.floor((x - x_range[0]) / (x_range[1] - x_range[0]) * n_bins).astype(np.int64)
+    iy = np.floor((y - y_range[0]) / (y_range[1] - y_range[0]) * n_bins).astype(np.int64)
+    inside = (ix >= 0) & (ix < n_bins) & (iy >= 0) & (iy < n_bins)
+    index = ix[inside] * n_bins + iy[inside]
+    sums = np.bincount(index, weights=values[inside], minlength=n_bins * n_bins)
+    counts = np.bincount(index, minlength=n_bins * n_bins)
+    averages = np.zeros(n_bins * n_bins, dtype=np.float64)
+    np.divide(sums, counts, out=averages, where=counts > 0)
+    zero = averages == 0.0
+    averages[zero] = (sums[zero] + empty) / (counts[zero] + 1)
+    return averages.reshape(n_bins, n_bins)
+
+
+def minimum_2d(x, y, values):
+    """Position of the minimum of 2D points."""
+    index = np.argmin(values)
+    return float(x[index]), float(y[index])
+
+
+def graph_arrays(graph):
+    """Copies of the points of a TGraph as numpy arrays."""
+    n = graph.GetN()
+    return (
+        np.array([graph.GetX()[i] for i in range(n)], dtype=np.float64),
+        np.array([graph.GetY()[i] for i in range(n)], dtype=np.float64),
+    )
+
+
+def to_tgraph(x, y, name=None):
+    """TGraph of numpy arrays."""
+    import ROOT
+
+    graph = ROOT.TGraph(len(x), np.ascontiguousarray(x, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64))
+    if name is not None:
+        graph.SetName(name)
+    return graph
@@ -4,11 +4,10 @@ import json
 import os
 import glob
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from multiprocessing import Pool, current_process, RLock
-import XRootD.client.glob_funcs as xrdglob
-import XRootD.client as client
-from XRootD.client.flags import DirListFlags
+from multiprocessing import Pool, RLock
 
 
 def args_parser():
@@ -50,6 +49,26 @@ def args_parser():
         default="tmp_dir",
         help="Temporary directory to store intermediate files",
     )
+    parser.add_argument(
+        "--transfer-backend",
+        choices=["auto", "xrootd", "local"],
+        default="auto",
+        help="Backend used to transfer the friend trees to the output path. "
+        "'auto' uses xrootd for root:// output paths and the local filesystem otherwise.",
+    )
+    parser.add_argument(
+        "--transfer-workers",
+        type=int,
+        default=4,
+        help="Maximal number of concurrent transfers",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Manifest of finished friend trees used to resume interrupted runs. "
+        "Defaults to friend_manifest.jsonl in the temporary directory's parent.",
+    )
     return parser.parse_args()
 
 
@@ -79,53 +98,131 @@ def convert_to_xrootd(path):
         return path
 
 
-def job_wrapper(args):
-    return friend_producer(*args)
+def friend_relative_path(inputfile):
+    data = parse_filepath(inputfile)
+    return os.path.join(data["era"], data["nick"], data["channel"], os.path.basename(inputfile))
 
 
-def check_file_exists_remote(serverpath, file_path):
-    server_url = serverpath.split("store")[0][:-1]
-    file_path = (
-        "/store" + serverpath.split("store")[1] + file_path.replace(serverpath, "")
-    )
-    # print(f"Checking if {file_path} exists in {server_url}")
-    myclient = client.FileSystem(server_url)
-    status, listing = myclient.stat(file_path, DirListFlags.STAT)
-    if status.ok:
-        # print(f"{file_path} exists")
+class LocalTransfer:
+    """Transfer backend moving the friend trees to a directory on the local filesystem."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+
+    def list_existing(self):
+        return {
+            os.path.relpath(path, self.output_path)
+            for path in glob.glob(os.path.join(self.output_path, "*/*/*/*.root"))
+        }
+
+    def upload(self, local_file, relative_path):
+        output_file = os.path.join(self.output_path, relative_path)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        shutil.move(local_file, output_file)
         return True
-    else:
-        # print(f"{file_path} does not exist")
+
+
+class XRootDTransfer:
+    """Transfer backend copying the friend trees to a remote storage via the XRootD python bindings."""
+
+    def __init__(self, output_path, max_retries=5):
+        self.output_path = output_path.rstrip("/")
+        self.max_retries = max_retries
+
+    def list_existing(self):
+        import XRootD.client.glob_funcs as xrdglob
+
+        # One listing per directory instead of one stat per file, paths are compared relative to the output path.
+        return {
+            "/".join(path.split("/")[-4:])
+            for path in xrdglob.glob(self.output_path + "/*/*/*/*.root")
+        }
+
+    def upload(self, local_file, relative_path):
+        import XRootD.client as client
+
+        output_file = f"{self.output_path}/{relative_path}"
+        for n in range(self.max_retries):
+            process = client.CopyProcess()
+            process.add_job(os.path.abspath(local_file), output_file, force=True, mkdir=True)
+            process.prepare()
+            status, results = process.run()
+            if status.ok and all(result["status"].ok for result in results):
+                os.remove(local_file)
+                return True
+            print(f"Failed to upload {output_file}")
+            print(f"Retrying {n+1}/{self.max_retries}")
         return False
 
 
-def friend_producer(
-    inputfile, workdir, output_path, dataset_proc, era, channel, debug=False
-):
-    temp_output_file = os.path.join(
-        workdir, era, dataset_proc["nick"], channel, os.path.basename(inputfile)
-    )
-    final_output_file = os.path.join(
-        output_path, era, dataset_proc["nick"], channel, os.path.basename(inputfile)
-    )
+def get_transfer_backend(name, output_path):
+    if name == "auto":
+        name = "xrootd" if output_path.startswith("root://") else "local"
+    if name == "xrootd":
+        return XRootDTransfer(output_path)
+    return LocalTransfer(output_path)
+
+
+class Manifest:
+    """
+    Append-only record of the finished friend trees, one JSON object per line.
+
+    Files listed in the manifest for the same output path are skipped by later
+    runs without checking the output path again.
+    """
+
+    def __init__(self, path, output_path):
+        self.path = path
+        self.output_path = output_path
+        self.finished = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # last line of an interrupted run
+                        continue
+                    if record.get("output_path") == output_path:
+                        self.finished.add(record["output"])
+
+    def add(self, inputfile, relative_path, status):
+        record = {
+            "input": inputfile,
+            "output_path": self.output_path,
+            "output": relative_path,
+            "status": status,
+        }
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self.finished.add(relative_path)
+
+
+def job_wrapper(args):
+    return friend_producer(*args)
+
+
+def friend_producer(inputfile, workdir, dataset_proc, debug=False):
+    """Create the friend tree of an ntuple in the working directory.
+
+    Returns:
+        tuple: (input file, temporary friend tree, path relative to the output path, status)
+    """
+    relative_path = friend_relative_path(inputfile)
+    temp_output_file = os.path.join(workdir, relative_path)
     if debug:
         print(f"Processing {inputfile}")
         print(f"Outputting to {temp_output_file}")
     os.makedirs(os.path.dirname(temp_output_file), exist_ok=True)
-    if (
-        dataset_proc["sample_type"] == "data"
-        or dataset_proc["sample_type"] == "embedding"
-    ):
-        return
     if not is_file_empty(inputfile, debug):
-        if not check_file_exists_remote(output_path, final_output_file):
-            build_rdf(inputfile, dataset_proc, temp_output_file)
-            upload_file(output_path, temp_output_file, final_output_file)
+        build_rdf(inputfile, dataset_proc, temp_output_file)
+        return inputfile, temp_output_file, relative_path, "built"
     else:
-        if not check_file_exists_remote(output_path, final_output_file):
-            print(f"{inputfile} is empty, generating empty friend tree")
-            generate_empty_friend_tree(temp_output_file)
-            upload_file(output_path, temp_output_file, final_output_file)
+        print(f"{inputfile} is empty, generating empty friend tree")
+        generate_empty_friend_tree(temp_output_file)
+        return inputfile, temp_output_file, relative_path, "empty"
 
 
 def is_file_empty(inputfile, debug=False):
@@ -176,25 +273,6 @@ def build_rdf(inputfile, dataset_proc, output_file):
     rootfile.Close()
 
 
-def upload_file(redirector, input_file, output_file, max_retries=5):
-    success = False
-    n = 0
-    while not success and n < max_retries:
-        if output_file.startswith("root://"):
-            os.system(f"xrdcp {input_file} {output_file}")
-            if check_file_exists_remote(redirector, output_file):
-                success = True
-            else:
-                print(f"Failed to upload {output_file}")
-                print(f"Retrying {n+1}/{max_retries}")
-                n += 1
-        else:
-            if not os.path.exists(os.path.dirname(output_file)):
-                os.makedirs(os.path.dirname(output_file))
-            os.system(f"mv {input_file} {output_file}")
-            success = True
-
-
 def generate_empty_friend_tree(output_file):
     friend_tree = ROOT.TFile(output_file, "CREATE")
     tree = ROOT.TTree("ntuple", "")
@@ -202,19 +280,35 @@ def generate_empty_friend_tree(output_file):
     friend_tree.Close()
 
 
-def generate_friend_trees(dataset, ntuples, nthreads, workdir, output_path, debug):
+def generate_friend_trees(
+    dataset, ntuples, nthreads, workdir, transfer, manifest, transfer_workers=4, debug=False
+):
+    """Produce the friend trees in three stages.
+
+    The existing outputs are listed once, the friend trees are snapshotted in a
+    process pool and handed to a bounded number of concurrent transfers as soon
+    as they are ready. Every finished file is recorded in the manifest.
+    """
+    todo = [ntuple for ntuple in ntuples if friend_relative_path(ntuple) not in manifest.finished]
+    print(f"{len(ntuples) - len(todo)} friend trees already finished according to {manifest.path}")
+    existing = transfer.list_existing() if todo else set()
+    for ntuple in todo:
+        if friend_relative_path(ntuple) in existing:
+            manifest.add(ntuple, friend_relative_path(ntuple), "exists")
+    todo = [ntuple for ntuple in todo if friend_relative_path(ntuple) not in existing]
+    print(f"{len(todo)} friend trees to be produced")
+    if not todo:
+        return True
+    nthreads = min(nthreads, len(todo))
     print("Using {} threads".format(nthreads))
     arguments = [
         (
             ntuple,
             workdir,
-            output_path,
             dataset[parse_filepath(ntuple)["nick"]],
-            parse_filepath(ntuple)["era"],
-            parse_filepath(ntuple)["channel"],
             debug,
         )
-        for ntuple in ntuples
+        for ntuple in todo
     ]
     pbar = tqdm(
         total=len(arguments),
@@ -223,11 +317,28 @@ def generate_friend_trees(dataset, ntuples, nthreads, workdir, output_path, debu
         dynamic_ncols=True,
         leave=True,
     )
-    with Pool(nthreads, initargs=(RLock(),), initializer=tqdm.set_lock) as pool:
-        for result in pool.imap_unordered(job_wrapper, arguments):
-            pbar.update(1)
-    pool.close()
+    failed = []
+
+    def finish(future, inputfile, relative_path, status):
+        # Called by the transfer threads, the manifest is updated as soon as a file is done.
+        if future.exception() is None and future.result():
+            manifest.add(inputfile, relative_path, status)
+        else:
+            failed.append(inputfile)
+        pbar.update(1)
+
+    with Pool(nthreads, initargs=(RLock(),), initializer=tqdm.set_lock) as pool, ThreadPoolExecutor(
+        transfer_workers
+    ) as transfers:
+        for inputfile, temp_output_file, relative_path, status in pool.imap_unordered(job_wrapper, arguments):
+            future = transfers.submit(transfer.upload, temp_output_file, relative_path)
+            future.add_done_callback(
+                lambda future, info=(inputfile, relative_path, status): finish(future, *info)
+            )
     pbar.close()
+    if failed:
+        print(f"Failed to transfer {len(failed)} friend trees: {failed}")
+    return not failed
 
 
 if __name__ == "__main__":
@@ -238,6 +349,8 @@ if __name__ == "__main__":
     dataset = json.load(open(args.dataset_config))
     print("Collecting ntuples from {}".format(base_path))
     if base_path.startswith("root://"):
+        import XRootD.client.glob_funcs as xrdglob
+
         ntuples = xrdglob.glob(base_path)
     else:
         ntuples = glob.glob(base_path)
@@ -251,13 +364,20 @@ if __name__ == "__main__":
             ntuples,
         )
     )
-    nthreads = args.nthreads
-    if nthreads > len(ntuples_wo_data):
-        nthreads = len(ntuples_wo_data)
-    generate_friend_trees(
-        dataset, ntuples_wo_data, nthreads, workdir, output_path, args.debug
+    manifest_path = args.manifest
+    if manifest_path is None:
+        manifest_path = os.path.join(os.path.dirname(os.path.abspath(workdir)), "friend_manifest.jsonl")
+    success = generate_friend_trees(
+        dataset,
+        ntuples_wo_data,
+        args.nthreads,
+        workdir,
+        get_transfer_backend(args.transfer_backend, output_path),
+        Manifest(manifest_path, output_path),
+        transfer_workers=args.transfer_workers,
+        debug=args.debug,
     )
     # remove the temporary directory
-    if os.path.exists(workdir):
+    if success and os.path.exists(workdir):
         shutil.rmtree(workdir)
     print("Done")
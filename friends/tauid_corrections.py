@@ -0,0 +1,272 @@
+"""
+Building of the tau ID scale factor corrections in the correctionlib format from combine fit results.
+
+The fit results are read column-wise from the 'limit' trees of the MultiDimFit
+outputs. The pt- and DM-binned corrections of one era hold all working points in
+a single 'wp' category, so all working points of an era are assembled in one pass
+and written to one correction set. Before writing, the corrections are validated
+against the correctionlib schema and evaluated with the correctionlib evaluator to
+check that every bin returns the fitted values.
+"""
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import uproot
+import correctionlib
+import correctionlib.schemav2 as schema
+import correctionlib.JSONEncoder as JSONEncoder
+
+# pt bins of the fit and the lower edge of each bin, the last bin is open
+PT_BINS = {"Pt20to25": 20, "Pt25to30": 25, "Pt30to35": 30, "Pt35to40": 35, "PtGt40": 40}
+PT_EDGES = [20, 25, 30, 35, 40, 10000]
+# decay modes and the DM bin of the fit they are assigned to
+DM_BINS = {0: "DM_0", 1: "DM_1", 10: "DM_10_11", 11: "DM_10_11"}
+VARIATIONS = {"nom": "r", "up": "u", "down": "d"}
+
+
+def read_fit_results(filename, pois=None):
+    """Read the best fit values and uncertainties of the POIs from a MultiDimFit output.
+
+    The first entry of the 'limit' tree holds the best fit, followed by the lower
+    and upper boundary of the interval of each POI in the order of the branches.
+
+    Args:
+        filename (str): MultiDimFit output file
+        pois (list): POIs to read, defaults to all branches starting with 'r'
+
+    Returns:
+        dict: POI -> {'r': best fit, 'd': lower boundary, 'u': upper boundary}
+    """
+    with uproot.open(filename) as f:
+        if "limit" not in f:
+            raise Exception("[ERROR] Tree {} not found in file {}.".format("limit", filename))
+        tree = f["limit"]
+        branches = [name for name in tree.keys() if name.startswith("r")]
+        if pois is None:
+            pois = branches
+        missing = set(pois) - set(branches)
+        if missing:
+            raise Exception("[ERROR] POIs {} not found in file {}.".format(sorted(missing), filename))
+        values = tree.arrays(pois, library="np")
+    results = {}
+    for poi in pois:
+        index = 1 + 2 * branches.index(poi)
+        if len(values[poi]) < index + 2:
+            raise Exception("[ERROR] No uncertainties of {} found in file {}.".format(poi, filename))
+        lo, hi = values[poi][index], values[poi][index + 1]
+        results[poi] = {"r": float(values[poi][0]), "d": float(min(lo, hi)), "u": float(max(lo, hi))}
+    return results
+
+
+def read_fit_results_files(requests, nthreads=4):
+    """Read several fit results in parallel.
+
+    Args:
+        requests (dict): key -> (filename, list of POIs or None)
+        nthreads (int): number of files read in parallel
+
+    Returns:
+        dict: key -> result of read_fit_results
+    """
+    with ThreadPoolExecutor(nthreads) as pool:
+        futures = {key: pool.submit(read_fit_results, *request) for key, request in requests.items()}
+    return {key: future.result() for key, future in futures.items()}
+
+
+class CorrectionSet(object):
+    def __init__(self, name):
+        self.name = name
+        self.corrections = []
+
+    def add_correction_file(self, correction_file):
+        with open(correction_file) as file:
+            data = json.load(file)
+            corr = schema.Correction.parse_obj(data)
+            self.add_correction(corr)
+
+    def add_correction(self, correction):
+        if isinstance(correction, (dict, schema.Correction)):
+            self.corrections.append(correction)
+        elif isinstance(correction, TauIDCorrection):
+            self.corrections.append(correction.correction)
+        else:
+            raise TypeError(
+                "Correction must be a Correction object or a dictionary, not {}".format(
+                    type(correction)
+                )
+            )
+
+    def build(self):
+        return schema.CorrectionSet(schema_version=schema.VERSION, corrections=self.corrections)
+
+    def write_json(self, outputfile):
+        cset = self.build()
+        print(f">>> Writing {outputfile}...")
+        JSONEncoder.write(cset, outputfile)
+        JSONEncoder.write(cset, outputfile + ".gz")
+
+
+class TauIDCorrection(object):
+    """
+    pt- or DM-binned tau ID scale factors for all working points of one era.
+
+    Args:
+        name (str): name of the correction
+        binning (str): 'pt' or 'dm'
+        data (dict): working point -> fit bin -> {'r', 'd', 'u'}
+        era (str): data taking period
+        dm_bins (dict): decay mode -> fit bin, defaults to DM_BINS
+    """
+
+    def __init__(self, name, binning, data, era, dm_bins=DM_BINS):
+        if binning not in ("pt", "dm"):
+            raise ValueError("Invalid binning {}".format(binning))
+        self.name = name
+        self.binning = binning
+        self.data = data
+        self.era = era
+        self.dm_bins = dm_bins
+        self.correction = None
+
+    def __repr__(self) -> str:
+        return "TauIDCorrection({})".format(self.name)
+
+    @property
+    def wps(self):
+        return list(self.data.keys())
+
+    def fit_bins(self):
+        """Fit bins in the order of the correction bins."""
+        if self.binning == "pt":
+            return [name for name, _ in sorted(PT_BINS.items(), key=lambda item: item[1])]
+        return [self.dm_bins[dm] for dm in sorted(self.dm_bins)]
+
+    def get_tauID_sf(self, wp, fit_bin, variation):
+        try:
+            return self.data[wp][fit_bin][VARIATIONS[variation]]
+        except KeyError:
+            raise ValueError(
+                "No fit result for bin {} of the {} working point in {}".format(fit_bin, wp, self.era)
+            )
+
+    def _variations(self, wp, fit_bin):
+        return {
+            "nodetype": "category",
+            "input": "type",
+            "content": [
+                {"key": variation, "value": self.get_tauID_sf(wp, fit_bin, variation)}
+                for variation in VARIATIONS
+            ],
+        }
+
+    def _sfs(self, wp):
+        if self.binning == "pt":
+            return {
+                "nodetype": "binning",
+                "input": "pt",
+                "edges": PT_EDGES,
+                "flow": "clamp",
+                "content": [self._variations(wp, fit_bin) for fit_bin in self.fit_bins()],
+            }
+        return {
+            "nodetype": "category",
+            "input": "decaymode",
+            "content": [
+                {"key": dm, "value": self._variations(wp, self.dm_bins[dm])} for dm in sorted(self.dm_bins)
+            ],
+        }
+
+    def scheme(self):
+        if self.binning == "pt":
+            variable = {"name": "pt", "type": "real", "description": "Tau pT"}
+            description, output = "pt-dependent tau ID scale factor", "pT-dependent scale factor"
+        else:
+            variable = {"name": "decaymode", "type": "int", "description": "Tau decay mode"}
+            description, output = "dm-dependent tau ID scale factor", "DM-dependent scale factor"
+        return {
+            "version": 0,
+            "name": self.name,
+            "description": description + " for tau embedded samples",
+            "inputs": [
+                variable,
+                {"name": "type", "type": "string", "description": "Variation: nom, Up, Down"},
+                {
+                    "name": "wp",
+                    "type": "string",
+                    "description": "DeepTau2017v2p1VSjet working point: VVVLoose-VVTight ",
+                },
+            ],
+            "output": {"name": "sf", "type": "real", "description": output},
+            "data": {
+                "nodetype": "category",
+                "input": "wp",
+                "content": [{"key": wp, "value": self._sfs(wp)} for wp in self.wps],
+            },
+        }
+
+    def generate_scheme(self):
+        self.correction = schema.Correction.parse_obj(self.scheme())
+        return self.correction
+
+    def evaluation_points(self):
+        """Input value of every correction bin and the fit bin it has to return."""
+        if self.binning == "pt":
+            return [(PT_BINS[fit_bin] + 1.0, fit_bin) for fit_bin in self.fit_bins()] + [
+                (PT_EDGES[0] - 1.0, self.fit_bins()[0]),
+                (PT_EDGES[-1] + 1.0, self.fit_bins()[-1]),
+            ]
+        return [(dm, fit_bin) for dm, fit_bin in sorted(self.dm_bins.items())]
+
+
+def validate(correctionset, corrections):
+    """Validate a correction set against the correctionlib schema and check the evaluated scale factors.
+
+    Args:
+        correctionset (CorrectionSet): correction set to be written
+        corrections (list): TauIDCorrection objects contained in the set
+
+    Raises:
+        ValueError: if an evaluated scale factor differs from the fit result
+    """
+    cset = correctionset.build()
+    evaluator = correctionlib.CorrectionSet.from_string(JSONEncoder.dumps(cset))
+    for corr in corrections:
+        for wp in corr.wps:
+            for value, fit_bin in corr.evaluation_points():
+                for variation in VARIATIONS:
+                    expected = corr.get_tauID_sf(wp, fit_bin, variation)
+                    result = evaluator[corr.name].evaluate(value, variation, wp)
+                    if not math.isclose(result, expected, rel_tol=1e-9):
+                        raise ValueError(
+                            "{} returns {} instead of {} for {} ({}, {})".format(
+                                corr.name, result, expected, value, variation, wp
+                            )
+                        )
+                if not corr.get_tauID_sf(wp, fit_bin, "down") <= corr.get_tauID_sf(
+                    wp, fit_bin, "nom"
+                ) <= corr.get_tauID_sf(wp, fit_bin, "up"):
+                    print(f"[WARNING] Best fit of {fit_bin} ({wp}) not inside its interval in {corr.name}")
+
+
+def build_tauid_corrections(results, era, dm_bins=DM_BINS):
+    """Build and validate the pt- and DM-binned correction set of one era.
+
+    Args:
+        results (dict): working point -> fit bin -> {'r', 'd', 'u'}, holding the pt and the DM bins
+        era (str): data taking period
+        dm_bins (dict): decay mode -> fit bin
+
+    Returns:
+        CorrectionSet: validated correction set
+    """
+    correctionset = CorrectionSet("TauID_SF")
+    corrections = [
+        TauIDCorrection("TauID_sf_embedding_ptbinned", "pt", results, era, dm_bins),
+        TauIDCorrection("TauID_sf_embedding_dmbinned", "dm", results, era, dm_bins),
+    ]
+    for corr in corrections:
+        corr.generate_scheme()
+        correctionset.add_correction(corr)
+    validate(correctionset, corrections)
+    return correctionset
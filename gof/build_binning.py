@@ -13,6 +13,9 @@ import ROOT
 
 logger = logging.getLogger("calculate_binning.py")
 
+# default values of undefined quantities, ignored for the binning
+DEFAULT_VALUES = [-11.0, -999.0, -10.0, -1.0]
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser()
@@ -76,6 +79,12 @@ def parse_arguments():
         nargs="+",
         help="Directories arranged as Artus output and containing a friend tree for mm.",
     )
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=0,
+        help="Number of threads used to read the ntuples, 0 uses all available cores.",
+    )
     parser.add_argument(
         "--output-folder",
         type=str,
@@ -162,64 +171,97 @@ def get_data_selection(era, channel, name, unit, categorization, basedir, friend
 
 
 def build_chain(dict_):
-    # Build chain
-    friend_paths = dict_["friend_paths"]
+    # Build chain, the friend trees are attached with the name of their directory as alias
     logger.debug("Use tree path %s for chain.", dict_["tree_path"])
     chain = ROOT.TChain(dict_["tree_path"])
     friendchains = {}
-    for d in friend_paths:
+    for d in dict_["friend_paths"]:
         friendchains[d] = ROOT.TChain(dict_["tree_path"])
-    for i, f in enumerate(dict_["files"]):
-        filename = f"{dict_['base_path']}/{f}"
-        chain.AddFile(filename)
-        for friendchain in friendchains:
-            friendfile = f"{d}/{f}"
-            friendchains[friendchain].AddFile(friendfile)
+    for f in dict_["files"]:
+        chain.AddFile(f"{dict_['base_path']}/{f}")
+        for d, friendchain in friendchains.items():
+            friendchain.AddFile(f"{d}/{f}")
+    for d, friendchain in friendchains.items():
+        chain.AddFriend(friendchain, "fr_{}".format(os.path.basename(d.rstrip("/"))))
 
     chain_numentries = chain.GetEntries()
     if not chain_numentries > 0:
-        logger.fatal("Chain (before skimming) does not contain any events.")
+        logger.fatal("Chain does not contain any events.")
         raise Exception
-    logger.debug("Found %s events before skimming with cut string.", chain_numentries)
-    logger.debug("Using cut string %s", dict_["cut_string"])
-
-    # Skim chain
-    chain_skimmed = chain.CopyTree(dict_["cut_string"])
-    chain_skimmed_numentries = chain_skimmed.GetEntries()
-    friendchains_skimmed = {}
-    # Apply skim selection also to friend chains
-    for d in friendchains:
-        friendchains[d].AddFriend(chain)
-        friendchains_skimmed[d] = friendchains[d].CopyTree(dict_["cut_string"])
-    if not chain_skimmed_numentries > 0:
-        logger.fatal("Chain (after skimming) does not contain any events.")
+    logger.debug("Found %s events before applying the cut string.", chain_numentries)
+    # keep the friend chains alive as long as the chain is used
+    return chain, friendchains
+
+
+def read_columns(dict_, variables, num_threads=0):
+    """Read the variables and the event weight of all selected events in a single event loop.
+
+    Args:
+        dict_ (dict): data selection, see get_data_selection
+        variables (list): variables to be read
+        num_threads (int): number of threads of the event loop, 0 uses all available cores
+
+    Returns:
+        tuple: (dict of variable -> numpy array, numpy array of the event weights)
+    """
+    if num_threads != 1:
+        ROOT.EnableImplicitMT(num_threads)
+    chain, _friendchains = build_chain(dict_)
+    rdf = ROOT.RDataFrame(chain)
+    if dict_["cut_string"] not in ("", "()"):
+        logger.debug("Using cut string %s", dict_["cut_string"])
+        rdf = rdf.Filter(dict_["cut_string"])
+    weight = dict_["weight_string"] if dict_["weight_string"] not in ("", "()") else "1.0"
+    rdf = rdf.Define("gof_binning_weight", f"(double)({weight})")
+    columns = rdf.AsNumpy(list(variables) + ["gof_binning_weight"])
+    weights = columns.pop("gof_binning_weight")
+    if not len(weights) > 0:
+        logger.fatal("No events left after applying the cut string.")
         raise Exception
-    logger.debug(
-        "Found %s events after skimming with cut string.", chain_skimmed_numentries
-    )
-    for d in friendchains_skimmed:
-        chain_skimmed.AddFriend(
-            friendchains_skimmed[d], "fr_{}".format(os.path.basename(d.rstrip("/")))
-        )
-
-    return chain_skimmed
-
-
-def get_1d_binning(channel, chain, variables, percentiles):
-    # Collect values
-    values = [[] for v in variables]
-    for event in chain:
-        for i, v in enumerate(variables):
-            value = getattr(event, v)
-            if value not in [-11.0, -999.0, -10.0, -1.0]:
-                values[i].append(value)
-
-    # Get min and max by percentiles
+    logger.debug("Found %s events after applying the cut string.", len(weights))
+    return {v: np.asarray(columns[v], dtype=float) for v in variables}, weights
+
+
+def weighted_percentile(values, weights, percentiles):
+    """Weighted percentiles with linear interpolation.
+
+    The sorted values are placed at the normalized cumulative weights
+    (S_i - w_1) / (S_N - w_1), which reproduces np.percentile for equal weights.
+    Negative weights, e.g. of NLO samples, are clipped to zero, since the
+    cumulative weights have to be non-decreasing for the interpolation, and
+    values without weight are dropped.
+
+    Args:
+        values (np.ndarray): values
+        weights (np.ndarray): weights of the values
+        percentiles (list): percentiles in [0, 100]
+
+    Returns:
+        np.ndarray: values at the percentiles
+    """
+    if (weights < 0).any():
+        logger.warning("Clipping %s negative weights to zero for the percentiles.", int((weights < 0).sum()))
+    positive = weights > 0
+    if not positive.any():
+        return np.percentile(values, percentiles)
+    values, weights = values[positive], weights[positive]
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    cumulative = np.cumsum(weights)
+    if len(values) < 2 or cumulative[-1] == weights[0]:
+        return np.percentile(values, percentiles)
+    positions = (cumulative - weights[0]) / (cumulative[-1] - weights[0])
+    return np.interp(np.asarray(percentiles) / 100.0, positions, values)
+
+
+def get_1d_binning(channel, columns, weights, variables, percentiles):
+    # Get min and max by percentiles, ignoring default values
     binning = {}
-    for i, v in enumerate(variables):
+    for v in variables:
         binning[v] = {}
-        if len(values[i]) > 0:
-            borders = [float(x) for x in np.percentile(values[i], percentiles)]
+        valid = ~np.isin(columns[v], DEFAULT_VALUES)
+        if valid.any():
+            borders = [float(x) for x in weighted_percentile(columns[v][valid], weights[valid], percentiles)]
             # remove duplicates in bins for integer binning
             borders = sorted(list(set(borders)))
             # epsilon offset for integer variables to make it more stable
@@ -245,6 +287,20 @@ def get_1d_binning(channel, chain, variables, percentiles):
         logger.debug("Binning for variable %s: %s", v, binning[v]["bins"])
     return binning
 
+
+def unrolled_expression(v1, v2, bins2, range_):
+    """Expression unrolling v1 in the bins of v2.
+
+    Events with v2 in the (b-th) bin (bins2[b], bins2[b+1]] are shifted by b * range_,
+    the bin index is computed as the number of inner borders below v2. Events outside
+    of bins2 evaluate to zero.
+    """
+    index = "+".join("({VAR2}>{B})".format(VAR2=v2, B=b) for b in bins2[1:-1]) or "0"
+    return "({VAR1}+{RANGE}*({INDEX}))*({VAR2}>{MIN})*({VAR2}<={MAX})".format(
+        VAR1=v1, VAR2=v2, RANGE=range_, INDEX=index, MIN=bins2[0], MAX=bins2[-1]
+    )
+
+
 def add_2d_unrolled_binning(variables, binning):
     for i1, v1 in enumerate(variables):
         for i2, v2 in enumerate(variables):
@@ -262,18 +318,10 @@ def add_2d_unrolled_binning(variables, binning):
             range_ = max(bins1) - min(bins1)
 
             bins = [bins1[0]]
-            expression = ""
             for b in range(len(bins2) - 1):
-                expression += "({OFFSET}+{VAR1})*({VAR2}>{MIN})*({VAR2}<={MAX})".format(
-                    VAR1=v1,
-                    VAR2=v2,
-                    MIN=bins2[b],
-                    MAX=bins2[b + 1],
-                    OFFSET=b * range_)
-                if b != len(bins2) - 2:
-                    expression += "+"
                 for c in range(len(bins1)-1):
                     bins.append(b * range_ + bins1[c+1])
+            expression = unrolled_expression(v1, v2, bins2, range_)
             # Add separate term shifting undefined values away from zero.
             # If this is not done the bin including zero is populated with all events
             # with default values.
@@ -282,7 +330,7 @@ def add_2d_unrolled_binning(variables, binning):
             default_val = -10.
             if v1 in ["njets", "nbtag"]:
                 if v2 in jet_variables:
-                    expression += "({DEF})*(({VAR2}<{MIN})+({VAR2}>{MAX}))".format(
+                    expression += "+({DEF})*(({VAR2}<{MIN})+({VAR2}>{MAX}))".format(
                             DEF=default_val,
                             VAR2=v2,
                             MIN=bins2[0],
@@ -346,8 +394,8 @@ def main(args):
 
     outputfile = os.path.join(args.output_folder, f"binning_{era}_{channel}.yaml")
     outputfile2d = os.path.join(args.output_folder, f"binning_{era}_{channel}_2D.yaml")
-    chain = build_chain(data_selection)
-    binning = get_1d_binning(channel, chain, variables, percentiles)
+    columns, weights = read_columns(data_selection, variables, args.num_threads)
+    binning = get_1d_binning(channel, columns, weights, variables, percentiles)
     with open(outputfile, "w") as f:
         yaml.dump(binning, f, default_flow_style=False)
 
@@ -111,10 +111,8 @@ if [[ $MODE == "SYNC" ]]; then
     python shapes/convert_to_synced_shapes.py -e $ERA \
         -i ${shapes_rootfile} \
         -o ${shapes_output_synced} \
-        -n 1 --gof
-
-    inputfile="htt_${CHANNEL}.inputs-sm-Run${ERA}${POSTFIX}.root"
-    hadd -f $shapes_output_synced/$inputfile $shapes_output_synced/${ERA}-${CHANNEL}*.root
+        --output-name "htt_{channel}.inputs-sm-Run{era}${POSTFIX}.root" \
+        -n 4 --gof
 
     exit 0
 fi
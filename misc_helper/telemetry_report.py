@@ -0,0 +1,155 @@
+"""
+Report of the runs recorded in the telemetry store (see config/telemetry.py).
+
+    python misc_helper/telemetry_report.py                          # last runs and their phases
+    python misc_helper/telemetry_report.py --stage produce_shapes --last 20
+    python misc_helper/telemetry_report.py --compare -2 -1          # where did the time go?
+
+Runs are addressed by their index in the listing, negative indices count from the end.
+"""
+import argparse
+import sys
+
+sys.path.insert(0, ".")  # if executed within smhtt_ul
+sys.path.insert(0, "..")  # if executed within smhtt_ul/misc_helper
+
+from rich.console import Console
+from rich.table import Table
+
+from config.telemetry import COUNT_EVENTS_ENVIRONMENT, DEFAULT_STORE, read_store, store_path
+
+console = Console()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report and compare the runs of the telemetry store.")
+    parser.add_argument("--store", type=str, default=store_path() or DEFAULT_STORE, help="Telemetry store.")
+    parser.add_argument("--stage", type=str, default=None, help="Only show runs of this stage.")
+    parser.add_argument("--last", type=int, default=10, help="Number of listed runs.")
+    parser.add_argument(
+        "--compare",
+        type=int,
+        nargs=2,
+        default=None,
+        metavar=("A", "B"),
+        help="Compare the phases of two runs, given by their index.",
+    )
+    return parser.parse_args()
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _rate(value):
+    return "-" if not value else f"{value:,.0f}"
+
+
+def list_runs(runs, first_index):
+    # the events per second are only recorded if the events were counted
+    rates = any("events_per_second" in run for run in runs)
+    caption = None if rates else f"events/s not recorded, the events are only counted with {COUNT_EVENTS_ENVIRONMENT}=1"
+    table = Table(title="Runs", caption=caption)
+    columns = ("#", "time", "stage", "status", "wall [s]", "cpu [s]", "cpu/wall", "RSS [MB]")
+    for column in columns + (("events/s",) if rates else ()) + ("phases",):
+        table.add_column(column, justify="left" if column in ("time", "stage", "status", "phases") else "right")
+    for index, run in enumerate(runs, start=first_index):
+        wall = run["wall"] or 0.0
+        phases = ", ".join(
+            f"{name} {100.0 * values['wall'] / wall:.0f}%" if wall else name
+            for name, values in sorted(run["phases"].items(), key=lambda it: -it[1]["wall"])
+        )
+        row = [
+            str(index),
+            run["time"],
+            run["stage"],
+            run["status"],
+            _seconds(run["wall"]),
+            _seconds(run["cpu"]),
+            f"{run['cpu'] / wall:.2f}" if wall else "-",
+            f"{run['max_rss_mb']:.0f}",
+        ]
+        if rates:
+            row.append(_rate(run.get("events_per_second")))
+        table.add_row(*row, phases)
+    console.print(table)
+
+
+def compare_runs(a, b, labels):
+    """Phase by phase comparison of two runs, sorted by the change of the wall time."""
+    table = Table(title=f"{a['stage']}: run {labels[0]} ({a['time']}) vs. run {labels[1]} ({b['time']})")
+    for column in ("phase", "wall A [s]", "wall B [s]", "delta [s]", "ratio", "cpu A [s]", "cpu B [s]"):
+        table.add_column(column, justify="left" if column == "phase" else "right")
+
+    names = list(a["phases"]) + [name for name in b["phases"] if name not in a["phases"]]
+    empty = {"wall": 0.0, "cpu": 0.0}
+    rows = []
+    for name in names:
+        phase_a, phase_b = a["phases"].get(name, empty), b["phases"].get(name, empty)
+        rows.append((name, phase_a, phase_b, phase_b["wall"] - phase_a["wall"]))
+    unaccounted = [
+        run["wall"] - sum(values["wall"] for values in run["phases"].values()) for run in (a, b)
+    ]
+    rows.append(
+        (
+            "(outside phases)",
+            {"wall": unaccounted[0], "cpu": None},
+            {"wall": unaccounted[1], "cpu": None},
+            unaccounted[1] - unaccounted[0],
+        )
+    )
+    rows.sort(key=lambda it: -abs(it[3]))
+
+    for name, phase_a, phase_b, delta in rows:
+        table.add_row(
+            name,
+            _seconds(phase_a["wall"]),
+            _seconds(phase_b["wall"]),
+            f"{delta:+.1f}",
+            f"{phase_b['wall'] / phase_a['wall']:.2f}" if phase_a["wall"] > 0 else "-",
+            _seconds(phase_a["cpu"]),
+            _seconds(phase_b["cpu"]),
+        )
+    table.add_row(
+        "total",
+        _seconds(a["wall"]),
+        _seconds(b["wall"]),
+        f"{b['wall'] - a['wall']:+.1f}",
+        f"{b['wall'] / a['wall']:.2f}" if a["wall"] > 0 else "-",
+        _seconds(a["cpu"]),
+        _seconds(b["cpu"]),
+        style="bold",
+    )
+    console.print(table)
+
+    for key, label in (("max_rss_mb", "peak RSS [MB]"), ("events_per_second", "events/s")):
+        if a.get(key) or b.get(key):
+            console.print(f"{label}: {_rate(a.get(key))} -> {_rate(b.get(key))}")
+    if rows:
+        name, _, _, delta = rows[0]
+        console.print(f"Largest change: {name} ({delta:+.1f} s)")
+    if a["metadata"] != b["metadata"]:
+        console.print(f"[yellow]Different configuration:[/yellow] {a['metadata']} vs. {b['metadata']}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    runs = read_store(args.store)
+    if args.stage is not None:
+        runs = [run for run in runs if run["stage"] == args.stage]
+    if not runs:
+        console.print(f"No runs recorded in {args.store}")
+        sys.exit(0)
+
+    if args.compare is not None:
+        try:
+            a, b = (runs[index] for index in args.compare)
+        except IndexError:
+            sys.exit(f"Run indices {args.compare} out of range, {len(runs)} runs recorded.")
+        labels = [index % len(runs) for index in args.compare]
+        if a["stage"] != b["stage"]:
+            console.print(f"[yellow]Comparing different stages {a['stage']} and {b['stage']}[/yellow]")
+        compare_runs(a, b, labels)
+    else:
+        first_index = max(len(runs) - args.last, 0)
+        list_runs(runs[first_index:], first_index)
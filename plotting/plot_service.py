@@ -0,0 +1,284 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import traceback
+from array import array
+
+import ROOT
+
+from config.logging_setup_configs import LogQueue, setup_logging
+from shapes.histogram_index import HistogramIndex
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+# store and plot function of the current render_plots call, inherited by the forked workers
+_STORE = None
+_FUNCTION = None
+
+
+def content_key(content):
+    """sha256 hex digest of JSON serializable content."""
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def histogram_digest(hist):
+    """Digest of the bin edges, contents and errors (including under- and overflow) of a histogram."""
+    axis = hist.GetXaxis()
+    values = array("d", (axis.GetBinLowEdge(i) for i in range(1, hist.GetNbinsX() + 2)))
+    for i in range(hist.GetNcells()):
+        values.append(hist.GetBinContent(i))
+        values.append(hist.GetBinError(i))
+    return hashlib.sha256(values.tobytes()).hexdigest()
+
+
+def source_digests(*modules):
+    """Digests of the source files of the given modules, i.e. the plotting script and the style modules."""
+    digests = {}
+    for module in modules:
+        path = getattr(module, "__file__", module)
+        if path is None:
+            continue
+        path = os.path.splitext(path)[0] + ".py" if path.endswith(".pyc") else path
+        with open(path, "rb") as f:
+            digests[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+
+def style_config(args, modules=(), exclude=("input", "channels", "variables", "num_processes", "force")):
+    """Style configuration of a set of plots.
+
+    Args:
+        args (argparse.Namespace): command line arguments of the plotting script
+        modules (iterable): modules (or files) whose source defines the style of the plots
+        exclude (iterable): arguments that do not change the appearance of a single plot
+
+    Returns:
+        dict: the options and the source digests
+    """
+    return {
+        "options": {k: v for k, v in sorted(vars(args).items()) if k not in exclude},
+        "sources": source_digests(*modules),
+    }
+
+
+class ShapesStore:
+    """
+    Histograms of a shapes file needed for a set of plots.
+
+    The histograms are selected with the histogram index of the file and read in a
+    single pass in key order. They are detached from the file, which is closed
+    afterwards, so forked render workers can use them without opening it again.
+
+    Args:
+        path (str): path of the shapes file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.histograms = {}
+        self._names = {}
+        self._digests = {}
+
+    def load(self, channels, variables, categories=("",), variations=("Nominal",)):
+        """Read all histograms of the given channels, variables, categories and variations.
+
+        Returns:
+            int: number of loaded histograms
+        """
+        channels, variables = set(channels), set(variables)
+        categories, variations = set(categories), set(variations)
+        ROOT.TH1.AddDirectory(False)
+        rootfile = ROOT.TFile(self.path, "READ")
+        if rootfile.IsZombie():
+            raise OSError(f"Could not open shapes file {self.path}")
+        try:
+            index = HistogramIndex.from_rootfile(rootfile, self.path)
+            selected = index.query(
+                channel=lambda channel: channel in channels,
+                variable=lambda variable: variable in variables,
+                category=lambda category: category in categories,
+                variation=lambda variation: variation in variations,
+            )
+            for hist in selected:
+                _hist = rootfile.Get(hist["key"])
+                _hist.SetDirectory(0)
+                self.histograms[hist["key"]] = _hist
+                self._names[
+                    (hist["channel"], hist["process"], hist["category"], hist["variation"], hist["variable"])
+                ] = hist["key"]
+        finally:
+            rootfile.Close()
+        logger.info(f"Loaded {len(selected)} histograms from {self.path}")
+        return len(selected)
+
+    def name(self, channel, process, category, shape_type, variable):
+        try:
+            return self._names[(channel, process, category or "", shape_type, variable)]
+        except KeyError:
+            raise KeyError(
+                f"No histogram of {process} in {channel} (category '{category or ''}', {shape_type}, {variable}) "
+                f"loaded from {self.path}"
+            )
+
+    def digest(self, name):
+        """Digest of a loaded histogram, None if it is not loaded."""
+        if name not in self.histograms:
+            return None
+        if name not in self._digests:
+            self._digests[name] = histogram_digest(self.histograms[name])
+        return self._digests[name]
+
+
+class ShapesParser:
+    """
+    Drop-in replacement for the Rootfile_parser of Dumbledraw, serving the histograms of a
+    variable from a ShapesStore. Every call returns a copy, the accessed histograms are
+    recorded to detect later changes of the inputs of a plot.
+    """
+
+    def __init__(self, store, variable, accessed):
+        self._store = store
+        self._variable = variable
+        self._accessed = accessed
+
+    def get(self, channel, process, category=None, shape_type="Nominal"):
+        name = self._store.name(channel, process, category, shape_type, self._variable)
+        self._accessed.add(name)
+        return self._store.histograms[name].Clone()
+
+
+class ShapesSession:
+    """Histogram access of a single plot."""
+
+    def __init__(self, store):
+        self._store = store
+        self.accessed = set()
+
+    def parser(self, variable):
+        return ShapesParser(self._store, variable, self.accessed)
+
+
+class RenderCache:
+    """
+    Record of the rendered plots, their style and the digests of their input histograms.
+
+    Args:
+        path (str): path of the JSON file holding the record
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable render cache {path}: {e}")
+
+    def is_current(self, outputs, style_key, store):
+        """Check if the outputs exist and were rendered with the same style from the same histograms."""
+        entry = self.entries.get(outputs[0])
+        if entry is None or entry["style"] != style_key or entry["outputs"] != list(outputs):
+            return False
+        if not all(os.path.exists(output) for output in outputs):
+            return False
+        return all(store.digest(name) == digest for name, digest in entry["inputs"].items())
+
+    def update(self, outputs, style_key, inputs):
+        """Record a rendered plot, written immediately so interrupted runs keep their progress.
+
+        Args:
+            outputs (list): written files of the plot
+            style_key (str): key of the style configuration
+            inputs (dict): name -> digest of the histograms used for the plot
+        """
+        self.entries[outputs[0]] = {"style": style_key, "outputs": list(outputs), "inputs": inputs}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def _init_worker():
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+
+
+def _render(indexed_task):
+    index, task = indexed_task
+    session = ShapesSession(_STORE)
+    try:
+        _FUNCTION(task, session)
+    except Exception:
+        # reported by render_plots, a failing plot must not abort the other plots of the batch
+        return index, None, traceback.format_exc()
+    return index, sorted(session.accessed), None
+
+
+def render_plots(function, tasks, store, style, cache_path=None, num_processes=1, force=False):
+    """Render a set of plots in batch mode, skipping plots that are up to date.
+
+    A plot is up to date if its outputs exist and the style configuration and the
+    digests of the histograms it used are unchanged since the last render. The
+    remaining plots are spread over a pool of forked workers, which share the
+    histograms of the store without reading the shapes file again. A plot that
+    raises is reported and left out of the cache, the other plots are rendered.
+
+    Args:
+        function (callable): function(task, session) rendering a single plot, histograms are
+            accessed via session.parser(variable)
+        tasks (list): dicts describing the plots, with the written files under 'outputs'
+        store (ShapesStore): loaded histograms
+        style (dict): style configuration, see style_config
+        cache_path (str): path of the render cache, None disables skipping
+        num_processes (int): number of render workers
+        force (bool): render all plots
+
+    Returns:
+        int: number of successfully rendered plots
+    """
+    global _STORE, _FUNCTION
+    _STORE, _FUNCTION = store, function
+    style_key = content_key(style)
+    cache = RenderCache(cache_path) if cache_path is not None else None
+
+    todo = [
+        task
+        for task in tasks
+        if force or cache is None or not cache.is_current(task["outputs"], style_key, store)
+    ]
+    logger.info(f"Rendering {len(todo)} of {len(tasks)} plots, {len(tasks) - len(todo)} are up to date.")
+
+    failed = []
+
+    def _done(index, accessed, error):
+        outputs = todo[index]["outputs"]
+        if error is not None:
+            logger.error(f"Rendering of {outputs[0]} failed:\n{error}")
+            failed.append(outputs[0])
+        elif cache is not None:
+            cache.update(outputs, style_key, {name: store.digest(name) for name in accessed})
+
+    _init_worker()
+    if num_processes > 1 and len(todo) > 1:
+        context = multiprocessing.get_context("fork")
+        with LogQueue(context) as log_queue, context.Pool(
+            min(num_processes, len(todo)), initializer=log_queue.initializer(_init_worker)
+        ) as pool:
+            for result in pool.imap_unordered(_render, enumerate(todo)):
+                _done(*result)
+            # let the workers exit normally to flush their pending log records
+            pool.close()
+            pool.join()
+    else:
+        for indexed_task in enumerate(todo):
+            _done(*_render(indexed_task))
+    if failed:
+        logger.error(f"Rendering of {len(failed)} of {len(todo)} plots failed:")
+        for output in sorted(failed):
+            logger.error(f"  {output}")
+    return len(todo) - len(failed)
@@ -6,14 +6,14 @@ import copy
 import itertools as itt
 import logging
 import os
-from multiprocessing import Pool, Process
 
 import ROOT
 import yaml
+import plot_service
+import process_ordering
 from process_ordering import ControlShapeBkgProcesses
 
 import Dumbledraw.dumbledraw as dd
-import Dumbledraw.rootfile_parser_ntuple_processor_inputshapes as rootfile_parser
 import Dumbledraw.styles as styles
 from config.logging_setup_configs import setup_logging
 
@@ -90,11 +90,33 @@ def parse_arguments():
         default="",
         help="Tag that is added to the output file"
     )
+    parser.add_argument(
+        "-n",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="Number of processes used to render the plots")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render all plots, also those that are unchanged since the last render")
 
     return parser.parse_args()
 
 
-def main(info):
+def plot_directory(args):
+    return f"{args.era}_plots_{args.postfix}_{args.tag}"
+
+
+def output_paths(args, channel, variable):
+    _path = os.path.join(plot_directory(args), channel)
+    return [
+        os.path.join(_path, f"{args.era}_{channel}_{args.category or ''}_{variable}.{_ext}")
+        for _ext in ["pdf", "png"]
+    ]
+
+
+def main(info, shapes):
     args = info["args"]
     variable = info["variable"]
     channel = info["channel"]
@@ -137,7 +159,7 @@ def main(info):
         logger.critical("Era {} is not implemented.".format(args.era))
         raise Exception
 
-    rootfile = rootfile_parser.Rootfile_parser(args.input, variable, )
+    rootfile = shapes.parser(variable)
 
     legend_bkg_processes = copy.deepcopy(bkg_processes)
     legend_bkg_processes.reverse()
@@ -450,11 +472,9 @@ def main(info):
         begin_left=posChannelCategoryLabelLeft)
 
     print("Trying to save the created plot")
-    _path = os.path.join(f"{args.era}_plots_{postfix}_{args.tag}", channel)
-    if not os.path.exists(_path):
-        os.makedirs(_path, exist_ok=True)
-    for _ext in ["pdf", "png"]:
-        plot.save(os.path.join(_path, f"{args.era}_{channel}_{args.category or ''}_{variable}.{_ext}"))
+    for output in info["outputs"]:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        plot.save(output)
 
 
 if __name__ == "__main__":
@@ -475,6 +495,20 @@ if __name__ == "__main__":
 
     args.postfix = postfix
 
-    infolist = [{"args": args, "channel": ch, "variable": v} for ch, v in itt.product(channels, variables)]
-    for info in infolist:
-        main(info)
+    infolist = [
+        {"args": args, "channel": ch, "variable": v, "outputs": output_paths(args, ch, v)}
+        for ch, v in itt.product(channels, variables)
+    ]
+
+    # read all histograms of the plots at once and render only the plots with changed inputs or style
+    shapes = plot_service.ShapesStore(args.input)
+    shapes.load(channels, variables, categories=[args.category or ""])
+    plot_service.render_plots(
+        main,
+        infolist,
+        shapes,
+        style=plot_service.style_config(args, modules=[__file__, process_ordering, styles, dd]),
+        cache_path=os.path.join(plot_directory(args), ".render_cache.json"),
+        num_processes=args.num_processes,
+        force=args.force,
+    )
@@ -2,19 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import Dumbledraw.dumbledraw as dd
-import Dumbledraw.rootfile_parser_ntuple_processor_inputshapes as rootfile_parser
 import Dumbledraw.styles as styles
 import ROOT
 
 import argparse
 import copy
+import itertools as itt
 import yaml
 import os
 
 import logging
 logger = logging.getLogger("")
-from multiprocessing import Pool
-from multiprocessing import Process
+import plot_service
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -44,7 +43,7 @@ def parse_arguments():
         "--category",
         type=str,
         default=None,
-        help="Enable control plotting for given category")
+        help="Enable control plotting for given comma separated categories")
     parser.add_argument(
         "--channels",
         type=str,
@@ -75,7 +74,17 @@ def parse_arguments():
         "--es_shift",
         type=str,
         default=None,
-        help="The value of the energy scale shift in %.")
+        help="The comma separated energy scale shifts, i.e. the names of the shifted embedded processes.")
+    parser.add_argument(
+        "-n",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="Number of processes used to render the plots")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render all plots, also those that are unchanged since the last render")
 
     return parser.parse_args()
 
@@ -93,28 +102,7 @@ def setup_logging(output_file, level=logging.DEBUG):
     logger.addHandler(file_handler)
 
 
-def main(info):
-    args = info["args"]
-    variable = info["variable"]
-    channel = info["channel"]
-    channel_dict = {
-        "ee": "#font[42]{#scale[0.85]{ee}}",
-        "em": "#scale[0.85]{e}#mu",
-        "et": "#font[42]{#scale[0.85]{e}}#tau_{#font[42]{h}}",
-        "mm": "#mu#mu",
-        "mt": "#mu#tau_{#font[42]{h}}",
-        "tt": "#tau_{#font[42]{h}}#tau_{#font[42]{h}}"
-    }
-    if args.linear == True:
-        split_value = 0.1
-    else:
-        if args.normalize_by_bin_width:
-            split_value = 10001
-        else:
-            split_value = 101
-
-    split_dict = {c: split_value for c in ["et", "mt", "tt", "em", "mm"]}
-
+def get_bkg_processes(args, channel, es_shift):
     bkg_processes = [
         "VVL", "TTL", "ZL", "jetFakesEMB", "EMB"
     ]
@@ -124,7 +112,7 @@ def main(info):
         ]
     if not args.fake_factor and args.embedding and  args.energy_scale:
         bkg_processes = [
-            "QCDEMB", "VVL", "VVJ", "W", "TTL", "TTJ", "ZJ", "ZL", args.es_shift
+            "QCDEMB", "VVL", "VVJ", "W", "TTL", "TTJ", "ZJ", "ZL", es_shift
         ]
     if not args.embedding and args.fake_factor:
         bkg_processes = [
@@ -154,25 +142,6 @@ def main(info):
             bkg_processes = [
                 "VVT", "VVL", "VVJ", "W", "TTT", "TTL", "TTJ", "ZJ", "ZL", "ZTT"
             ]
-    all_bkg_processes = [b for b in bkg_processes]
-    legend_bkg_processes = copy.deepcopy(bkg_processes)
-    legend_bkg_processes.reverse()
-
-    if "2016" in args.era:
-        era = "Run2016"
-    elif "2017" in args.era:
-        era = "Run2017"
-    elif "2018" in args.era:
-        era = "Run2018"
-    else:
-        logger.critical("Era {} is not implemented.".format(args.era))
-        raise Exception
-
-    # category = "_".join([channel, variable])
-    # if args.category_postfix is not None:
-    #     category += "_%s"%args.category_postfix
-    rootfile = rootfile_parser.Rootfile_parser(args.input, variable, )
-    bkg_processes = [b for b in all_bkg_processes]
     if "em" in channel:
         if not args.embedding:
             bkg_processes = [
@@ -197,6 +166,74 @@ def main(info):
             "QCD", "VVT", "VVL", "W", "TTT", "TTL", "ZTT", "ZL"
         ]
 
+    return bkg_processes
+
+
+def plot_directory(args):
+    if not args.embedding and not args.fake_factor:
+        postfix = "fully_classic"
+    if args.embedding and not args.fake_factor:
+        postfix = "emb_classic"
+    if not args.embedding and args.fake_factor:
+        postfix = "classic_ff"
+    if args.embedding and args.fake_factor:
+        postfix = "emb_ff"
+    if args.draw_jet_fake_variation is not None:
+        postfix = postfix + "_" + args.draw_jet_fake_variation
+    return "%s_plots_%s" % (args.era, postfix)
+
+
+def output_paths(args, channel, variable, cat, es_shift):
+    shiftanme = ""
+    for process in get_bkg_processes(args, channel, es_shift):
+        if "emb" in process:
+            shiftanme = process
+        else:
+            shiftanme = ""
+    return [
+        "%s/%s/%s/%s_%s_%s_%s_%s.%s" % (plot_directory(args), channel, cat, args.era, channel, variable, cat, shiftanme, ext)
+        for ext in ["pdf", "png"]
+    ]
+
+
+def main(info, shapes):
+    args = info["args"]
+    variable = info["variable"]
+    channel = info["channel"]
+    es_shift = info["es_shift"]
+    channel_dict = {
+        "ee": "#font[42]{#scale[0.85]{ee}}",
+        "em": "#scale[0.85]{e}#mu",
+        "et": "#font[42]{#scale[0.85]{e}}#tau_{#font[42]{h}}",
+        "mm": "#mu#mu",
+        "mt": "#mu#tau_{#font[42]{h}}",
+        "tt": "#tau_{#font[42]{h}}#tau_{#font[42]{h}}"
+    }
+    if args.linear == True:
+        split_value = 0.1
+    else:
+        if args.normalize_by_bin_width:
+            split_value = 10001
+        else:
+            split_value = 101
+
+    split_dict = {c: split_value for c in ["et", "mt", "tt", "em", "mm"]}
+
+    if "2016" in args.era:
+        era = "Run2016"
+    elif "2017" in args.era:
+        era = "Run2017"
+    elif "2018" in args.era:
+        era = "Run2018"
+    else:
+        logger.critical("Era {} is not implemented.".format(args.era))
+        raise Exception
+
+    # category = "_".join([channel, variable])
+    # if args.category_postfix is not None:
+    #     category += "_%s"%args.category_postfix
+    rootfile = shapes.parser(variable)
+    bkg_processes = get_bkg_processes(args, channel, es_shift)
     legend_bkg_processes = copy.deepcopy(bkg_processes)
     legend_bkg_processes.reverse()
 
@@ -210,7 +247,7 @@ def main(info):
             [0.5, [0.3, 0.28]], "ModTDR", r=0.04, l=0.14, width=width)
         
     # get category histograms
-    cat = args.category
+    cat = info["category"]
 
     # get background histograms
     total_bkg = None
@@ -395,30 +432,10 @@ def main(info):
         begin_left=posChannelCategoryLabelLeft)
 
     # save plot
-    if not args.embedding and not args.fake_factor:
-        postfix = "fully_classic"
-    if args.embedding and not args.fake_factor:
-        postfix = "emb_classic"
-    if not args.embedding and args.fake_factor:
-        postfix = "classic_ff"
-    if args.embedding and args.fake_factor:
-        postfix = "emb_ff"
-    if args.draw_jet_fake_variation is not None:
-        postfix = postfix + "_" + args.draw_jet_fake_variation
-
-    if not os.path.exists("%s_plots_%s"%(args.era,postfix)):
-        os.mkdir("%s_plots_%s"%(args.era,postfix))
-    if not os.path.exists("%s_plots_%s/%s/%s"%(args.era,postfix,channel,cat)):
-        os.mkdir("%s_plots_%s/%s/%s"%(args.era,postfix,channel,cat))
-    shiftanme = ""
-    for i in range(len(bkg_processes)):
-        if "emb" in bkg_processes[i]:
-            shiftanme = bkg_processes[i]
-        else:
-            shiftanme = ""
     print("Trying to save the created plot")
-    plot.save("%s_plots_%s/%s/%s/%s_%s_%s_%s_%s.%s" % (args.era, postfix, channel,cat, args.era, channel, variable,cat,shiftanme, "pdf"))
-    plot.save("%s_plots_%s/%s/%s/%s_%s_%s_%s_%s.%s" % (args.era, postfix, channel,cat, args.era, channel, variable,cat,shiftanme, "png"))
+    for output in info["outputs"]:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        plot.save(output)
 
 
 if __name__ == "__main__":
@@ -426,23 +443,33 @@ if __name__ == "__main__":
     setup_logging("{}_plot_shapes.log".format(args.era), logging.DEBUG)
     variables = args.variables.split(",")
     channels = args.channels.split(",")
+    categories = args.category.split(",") if args.category is not None else [None]
+    es_shifts = args.es_shift.split(",") if args.es_shift is not None else [None]
     infolist = []
-
-    if not args.embedding and not args.fake_factor:
-        postfix = "fully_classic"
-    if args.embedding and not args.fake_factor:
-        postfix = "emb_classic"
-    if not args.embedding and args.fake_factor:
-        postfix = "classic_ff"
-    if args.embedding and args.fake_factor:
-        postfix = "emb_ff"
-
-    if not os.path.exists("%s_plots_%s"%(args.era,postfix)):
-        os.mkdir("%s_plots_%s"%(args.era,postfix))
-    for ch in channels:
-        if not os.path.exists("%s_plots_%s/%s"%(args.era,postfix,ch)):
-            os.mkdir("%s_plots_%s/%s"%(args.era,postfix,ch))
-        for v in variables:
-            infolist.append({"args" : args, "channel" : ch, "variable" : v})
-    pool = Pool(1)
-    pool.map(main, infolist)
+    for ch, v, cat, es_shift in itt.product(channels, variables, categories, es_shifts):
+        infolist.append({
+            "args" : args, "channel" : ch, "variable" : v, "category" : cat, "es_shift" : es_shift,
+            "outputs" : output_paths(args, ch, v, cat, es_shift),
+        })
+
+    # read all histograms of the plots at once and render only the plots with changed inputs or style
+    shapes = plot_service.ShapesStore(args.input)
+    shapes.load(
+        channels,
+        variables,
+        categories=[cat or "" for cat in categories],
+        variations=[args.draw_jet_fake_variation or "Nominal"],
+    )
+    plot_service.render_plots(
+        main,
+        infolist,
+        shapes,
+        style=plot_service.style_config(
+            args,
+            modules=[__file__, styles, dd],
+            exclude=("input", "channels", "variables", "category", "es_shift", "num_processes", "force"),
+        ),
+        cache_path=os.path.join(plot_directory(args), ".render_cache.json"),
+        num_processes=args.num_processes,
+        force=args.force,
+    )
@@ -130,7 +130,10 @@ fi
 if [[ $MODE == "MERGE" ]]; then
     source utils/setup_root.sh
     echo "[INFO] Merging outputs located in ${CONDOR_OUTPUT}"
-    hadd -j 5 -n 600 -f $shapes_rootfile ${CONDOR_OUTPUT}/../analysis_unit_graphs-${ERA}-${CHANNEL}-${NTUPLETAG}-${TAG}/*.root
+    python submit/merge_outputs.py -o $shapes_rootfile -j 5 \
+        -i ${CONDOR_OUTPUT}/../analysis_unit_graphs-${ERA}-${CHANNEL}-${NTUPLETAG}-${TAG} \
+        --check ${CONDOR_OUTPUT}/../analysis_unit_graphs-${ERA}-${CHANNEL}-${NTUPLETAG}-${TAG} \
+        ${CONDOR_OUTPUT}/analysis_unit_graphs-${ERA}-${CHANNEL}-${NTUPLETAG}-${TAG}.pkl
 fi
 
 if [[ $MODE == "SYNC" ]]; then
@@ -145,10 +148,8 @@ if [[ $MODE == "SYNC" ]]; then
     python shapes/convert_to_synced_shapes.py -e $ERA \
         -i ${shapes_rootfile} \
         -o ${shapes_output_synced} \
-        -n 1
-
-    inputfile="htt_${CHANNEL}.inputs-sm-Run${ERA}${POSTFIX}.root"
-    hadd -f $shapes_output_synced/$inputfile $shapes_output_synced/${ERA}-${CHANNEL}*.root
+        --output-name "htt_{channel}.inputs-sm-Run{era}${POSTFIX}.root" \
+        -n 4
 
     exit 0
 fi
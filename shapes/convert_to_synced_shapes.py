@@ -4,9 +4,12 @@ import os
 import argparse
 import logging
 import multiprocessing
+from collections import defaultdict
 
 import ROOT
 
+from config.telemetry import StageTelemetry
+
 logger = logging.getLogger("")
 
 _process_map = {
@@ -25,90 +28,15 @@ _process_map = {
     "QCD": "QCD",
 }
 
+# embedded samples with shifted tau energy scale from -4.0% to 4.0% in steps of 0.1%, i.e. embminus2p5 -> -2.5
 tau_es_map = {
-
-    "embminus4p0": "-4.0",
-    "embminus3p9": "-3.9",
-    "embminus3p8": "-3.8",
-    "embminus3p7": "-3.7",
-    "embminus3p6": "-3.6",
-    "embminus3p5": "-3.5",
-    "embminus3p4": "-3.4",
-    "embminus3p3": "-3.3",
-    "embminus3p2": "-3.2",
-    "embminus3p1": "-3.1",
-    "embminus3p0": "-3.0",
-    "embminus2p9": "-2.9",
-    "embminus2p8": "-2.8",
-    "embminus2p7": "-2.7",
-    "embminus2p6": "-2.6",
-    "embminus2p5": "-2.5",
-    "embminus2p4": "-2.4",
-    "embminus2p3": "-2.3",
-    "embminus2p2": "-2.2",
-    "embminus2p1": "-2.1",
-    "embminus2p0": "-2.0",
-    "embminus1p9": "-1.9",
-    "embminus1p8": "-1.8",
-    "embminus1p7": "-1.7",
-    "embminus1p6": "-1.6",
-    "embminus1p5": "-1.5",
-    "embminus1p4": "-1.4",
-    "embminus1p3": "-1.3",
-    "embminus1p2": "-1.2",
-    "embminus1p1": "-1.1",
-    "embminus1p0": "-1.0",
-    "embminus0p9": "-0.9",
-    "embminus0p8": "-0.8",
-    "embminus0p7": "-0.7",
-    "embminus0p6": "-0.6",
-    "embminus0p5": "-0.5",
-    "embminus0p4": "-0.4",
-    "embminus0p3": "-0.3",
-    "embminus0p2": "-0.2",
-    "embminus0p1": "-0.1",
-    "emb0p0": "0.00",
-    "emb0p1": "0.1",
-    "emb0p2": "0.2",
-    "emb0p3": "0.3",
-    "emb0p4": "0.4",
-    "emb0p5": "0.5",
-    "emb0p6": "0.6",
-    "emb0p7": "0.7",
-    "emb0p8": "0.8",
-    "emb0p9": "0.9",
-    "emb1p0": "1.0",
-    "emb1p1": "1.1",
-    "emb1p2": "1.2",
-    "emb1p3": "1.3",
-    "emb1p4": "1.4",
-    "emb1p5": "1.5",
-    "emb1p6": "1.6",
-    "emb1p7": "1.7",
-    "emb1p8": "1.8",
-    "emb1p9": "1.9",
-    "emb2p0": "2.0",
-    "emb2p1": "2.1",
-    "emb2p2": "2.2",
-    "emb2p3": "2.3",
-    "emb2p4": "2.4",
-    "emb2p5": "2.5",
-    "emb2p6": "2.6",
-    "emb2p7": "2.7",
-    "emb2p8": "2.8",
-    "emb2p9": "2.9",
-    "emb3p0": "3.0",
-    "emb3p1": "3.1",
-    "emb3p2": "3.2",
-    "emb3p3": "3.3",
-    "emb3p4": "3.4",
-    "emb3p5": "3.5",
-    "emb3p6": "3.6",
-    "emb3p7": "3.7",
-    "emb3p8": "3.8",
-    "emb3p9": "3.9",
-    "emb4p0": "4.0",
+    "emb{}{}p{}".format("minus" if shift < 0 else "", abs(shift) // 10, abs(shift) % 10): "{:.1f}".format(shift / 10)
+    for shift in range(-40, 41)
 }
+tau_es_map["emb0p0"] = "0.00"
+
+# number of histograms read by a worker per task
+READ_CHUNK_SIZE = 200
 
 
 def parse_args():
@@ -116,6 +44,13 @@ def parse_args():
     parser.add_argument("-e", "--era", help="Experiment era.")
     parser.add_argument("-i", "--input", help="Input root file.")
     parser.add_argument("-o", "--output", help="Output directory.")
+    parser.add_argument(
+        "--output-name",
+        default="{era}-{channel}-synced.root",
+        help="Name of the output file(s) in the output directory, may contain {era}, {channel} "
+        "and {category} placeholders. Without a {category} placeholder all categories of a "
+        "channel are written into a single file.",
+    )
     parser.add_argument(
         "--gof",
         action="store_true",
@@ -136,7 +71,7 @@ def parse_args():
         help="Select final discriminator for shape creation.",
     )
     parser.add_argument(
-        "-n", "--num-processes", default=1, type=int, help="Number of processes used."
+        "-n", "--num-processes", default=1, type=int, help="Number of processes reading the input histograms."
     )
     return parser.parse_args()
 
@@ -183,279 +118,278 @@ def correct_nominal_shape(hist, name, integral):
     return hist
 
 
-def write_hists_per_category(cat_hists: tuple):
-    category, keys, channel, ofname, ifname = cat_hists
-    infile = ROOT.TFile(ifname, "READ")
-    dir_name = "{CHANNEL}_{CATEGORY}".format(CHANNEL=channel, CATEGORY=category)
-    if "{category}" in ofname:
-        outfile = ROOT.TFile(ofname.format(category=dir_name), "RECREATE")
-    else:
-        outfile = ROOT.TFile(
-            ofname.replace(".root", "-" + category + ".root"), "RECREATE"
-        )
-    outfile.cd()
-    outfile.mkdir(dir_name)
-    outfile.cd(dir_name)
-    for name, name_output in sorted(keys.items(), key=lambda x: x[1]):
-        hist = infile.Get(name)
-        # pos = 0.0
-        # neg = 0.0
-        # if "bbH" in name_output or ("gg" in name_output and not "_i_" in name_output):
-        #     integral = hist.Integral()
-        #     if ("bbH" in name_output and len(name_output.split("_"))==2) \
-        #         or ("bbH" in name_output and len(name_output.split("_"))==3 and name_output.split("_")[2] == "powheg") \
-        #         or ("gg" in name_output and len(name_output.split("_"))==3) \
-        #         or ("gg" in name_output and len(name_output.split("_"))==4 and name_output.split("_")[3] == "powheg") \
-        #         or (name_output == "ggHWW125" or name_output == "qqHWW125"):
-        #         nominal = correct_nominal_shape(hist, "{} {}".format(name_output,category), integral)
-        #     # if the integral of the shape is negative, set it to the corrected nominal shape
-        #     elif integral <= 0.0:
-        #         hist = nominal
-        #     # skip interference terms as the negative bins there could be physical
-        #     elif not (name_output.startswith("gg") and "_i_" in name_output):
-        #         for i in range(hist.GetNbinsX()):
-        #             cont = hist.GetBinContent(i+1)
-        #             if cont<0.0:
-        #                 neg += cont
-        #                 hist.SetBinContent(i+1, 0.0)
-        #             else:
-        #                 pos += cont
-        #         if neg<0:
-        #             if (neg+pos)>0.0:
-        #                 hist.Scale((neg+pos)/pos)
-        # elif not ("gg" in name_output and "_i_" in name_output):
-        #     for i in range(hist.GetNbinsX()):
-        #         cont = hist.GetBinContent(i+1)
-        #         if cont<0.0:
-        #             neg += cont
-        #             hist.SetBinContent(i+1, 0.0)
-        #         else:
-        #             pos += cont
-        #     if neg<0:
-        #         if neg+pos>0.0:
-        #             hist.Scale((neg+pos)/pos)
-        #         else:
-        #             hist.Scale(0.0)
-        #         if neg<-5.0:
-        #                 logger.fatal("Found histogram with a yield of negative bins larger than 5.0!")
-        #                 raise Exception
-        # # Special treatment for gg interference terms since negative
-        # # integrals could be physical.
-        # elif ("gg" in name_output and "_i_" in name_output):
-        #     integral = hist.Integral()
-        #     # print(name_output, integral)
-        #     if ("gg" in name_output and len(name_output.split("_"))==3) \
-        #        or ("gg" in name_output and len(name_output.split("_"))==4 and name_output.split("_")[3] == "powheg"):
-        #         pass
-        #     elif integral <= 0.:
-        #         print("Integral smaller than zero")
-        #         # Check if uncertainty is negative when nominal is not.
-        #         split_name = name.split("#")
-        #         nom_name = "#".join(split_name[0:2] + ["Nominal"] + split_name[3:])
-        #         nominal = infile.Get(nom_name)
-        #         if nominal.Integral() > 0.:
-        #             print("Nominal integral greater than zero. Setting to nominal...")
-        #             hist = nominal
-        #             print("Integrals now: %f (nominal), %f (variation)" % (nominal.Integral(), hist.Integral()))
-        # Write shapes with partial correlations across eras.
-        if "Era" in name_output:
-            if (
-                "_1ProngPi0Eff_" in name_output
-                or "_qcd_iso" in name_output
-                or "_3ProngEff_" in name_output
-                or "_dyShape_" in name_output
-            ):
-                hist.SetTitle(name_output.replace("_Era", ""))
-                hist.SetName(name_output.replace("_Era", ""))
-                hist.Write()
-        if "scale_embed_met" in name_output:
-            hist.SetTitle(name_output.replace("met", "_".join(["met", args.era])))
-            hist.SetName(name_output.replace("met", "_".join(["met", args.era])))
-            hist.Write()
-            hist.SetTitle(
-                name_output.replace("met", "_".join(["met", channel, args.era]))
-            )
-            hist.SetName(
-                name_output.replace("met", "_".join(["met", channel, args.era]))
-            )
-            hist.Write()
-        if "Era" in name_output:
-            name_output = name_output.replace("Era", f"Run{args.era}")
-        if "Channel" in name_output:
-            name_output = name_output.replace("Channel", channel)
+
+
+def renaming_rules(channel, category, era):
+    """Replacements applied in this order to the name of every histogram of a category."""
+    rules = (
+        ("Era", f"Run{era}"),
+        ("Channel", channel),
         # rename dR0 and dr1 to lowdR and highdR
-        if "dr0" in name_output:
-            name_output = name_output.replace("dr0", "lowdR")
-        if "dr1" in name_output:
-            name_output = name_output.replace("dr1", "highdR")
-        if f"{channel}__{args.era}" in name_output:
-            name_output = name_output.replace(
-                f"{channel}__{args.era}", f"{channel}_{args.era}_"
-            )
-        if f"Up_{channel}_{args.era}" in name_output:
-            name_output = name_output.replace(
-                f"Up_{channel}_{args.era}", f"{channel}_{args.era}Up"
-            )
-        if f"Down_{channel}_{args.era}" in name_output:
-            name_output = name_output.replace(
-                f"Down_{channel}_{args.era}", f"{channel}_{args.era}Down"
-            )
-        if category == "control_region":
-            name_output = name_output.replace("EMB", "MUEMB")
-        hist.SetTitle(name_output)
-        hist.SetName(name_output)
-        hist.Write()
-    outfile.Close()
-    infile.Close()
-    return
+        ("dr0", "lowdR"),
+        ("dr1", "highdR"),
+        (f"{channel}__{era}", f"{channel}_{era}_"),
+        (f"Up_{channel}_{era}", f"{channel}_{era}Up"),
+        (f"Down_{channel}_{era}", f"{channel}_{era}Down"),
+    )
+    if category == "control_region":
+        rules += (("EMB", "MUEMB"),)
+    return rules
 
 
-def main(args):
-    input_file = ROOT.TFile(args.input)
+def output_names(name_output, channel, era, rules):
+    """Names a histogram is written with, the renamed shape comes last."""
+    names = []
+    # Write shapes with partial correlations across eras.
+    if "Era" in name_output and any(
+        it in name_output for it in ("_1ProngPi0Eff_", "_qcd_iso", "_3ProngEff_", "_dyShape_")
+    ):
+        names.append(name_output.replace("_Era", ""))
+    if "scale_embed_met" in name_output:
+        names.append(name_output.replace("met", "_".join(["met", era])))
+        names.append(name_output.replace("met", "_".join(["met", channel, era])))
+    for old, new in rules:
+        name_output = name_output.replace(old, new)
+    names.append(name_output)
+    return names
 
-    # Loop over histograms to extract relevant information for synced files.
-    logging.info("Reading input histograms from file %s", args.input)
-    hist_map = {}
-    for key in input_file.GetListOfKeys():
-        split_name = key.GetName().split("#")
-        channel = split_name[1].split("-")[0]
-        if args.gof:
-            # Use variable as category label for GOF test and control plots.
-            category = split_name[3]
+
+def synced_name(name, args, process_map, rev_process_map):
+    """Channel, category and name in the synced file of an input histogram.
+
+    Returns:
+        tuple: (channel, category, name) or None if the histogram is not part of the synced file
+    """
+    split_name = name.split("#")
+    channel = split_name[1].split("-")[0]
+    if args.gof:
+        # Use variable as category label for GOF test and control plots.
+        category = split_name[3]
+        process = (
+            "-".join(split_name[1].split("-")[1:])
+            if not "data" in split_name[0]
+            else "data_obs"
+        )
+    else:
+        category = split_name[1].split("-")[-1]
+        if "emb" not in split_name[0]:
             process = (
-                "-".join(split_name[1].split("-")[1:])
+                "-".join(split_name[1].split("-")[1:-1])
                 if not "data" in split_name[0]
                 else "data_obs"
             )
         else:
-            category = split_name[1].split("-")[-1]
-
-            if "emb" not in  split_name[0]:
-                process = (
-                    "-".join(split_name[1].split("-")[1:-1])
-                    if not "data" in split_name[0]
-                    else "data_obs"
+            process = split_name[0]
+    # add the additional process of special analyses to the sync file
+    if args.special == "TauES" or args.special == "EleES":
+        if "emb" in split_name[0]:
+            if "jetFakes" in split_name[0]:
+                process = "jetFakes_"
+                split_name[0] = (
+                    split_name[0].replace("jetFakes", "").replace("emb", "")
                 )
-            if "emb" in split_name[0] and split_name[0] !="emb0p0":
-                process = split_name[0]
-            if split_name[0] =="emb0p0":
-                pass
-        # add the additional process of special analyses to the sync file
-        if args.special == "TauES" or args.special == "EleES":
-            if "emb" in split_name[0]:
-                if "jetFakes" in split_name[0]:
-                    process = "jetFakes_"
-                    split_name[0] = (
-                        split_name[0].replace("jetFakes", "").replace("emb", "")
-                    )
-                else:
-                    process = "EMB_"
-                    split_name[0] = split_name[0].replace("emb", "")
-                if "minus" in split_name[0]:
-                    process += "-"
-                    split_name[0] = split_name[0].replace("minus", "")
-                process += ".".join(split_name[0].split("p"))
-            # Skip discriminant variables we do not want in the sync file.
-            # This is necessary because the sync file only allows for one type of histogram.
-            # A combination of the runs for different variables can then be used in separate files.
-            if args.variable_selection is None:
-                pass
             else:
-                if split_name[3] not in args.variable_selection:
-                    continue
-        variation = split_name[2]
-        # Skip variations necessary for estimations which are of no further use.
-        if "same_sign" in variation or "anti_iso" in variation:
-            continue
+                process = "EMB_"
+                split_name[0] = split_name[0].replace("emb", "")
+            if "minus" in split_name[0]:
+                process += "-"
+                split_name[0] = split_name[0].replace("minus", "")
+            process += ".".join(split_name[0].split("p"))
+        # Skip discriminant variables we do not want in the sync file.
+        # This is necessary because the sync file only allows for one type of histogram.
+        # A combination of the runs for different variables can then be used in separate files.
+        if args.variable_selection is not None and split_name[3] not in args.variable_selection:
+            return None
+    variation = split_name[2]
+    # Skip variations necessary for estimations which are of no further use.
+    if "same_sign" in variation or "anti_iso" in variation:
+        return None
 
-        # Check if channel and category are already in the map
-        if not channel in hist_map:
-            hist_map[channel] = {}
-        if not category in hist_map[channel]:
-            hist_map[channel][category] = {}
-
-        # Skip copying of jetFakes estimations based on underlying shapes to be able
-        # to use one name in the synced file.
-        # TODO: Should this be kept or do we want to put both version in the synced file and
-        #       perform the switch on combine level.
-        if args.mc:
-            _process_map["jetFakes"] = "jetFakesMC"
-            _process_map["QCD"] = "QCDMC"
-            if process in ["jetFakes", "QCD"]:
-                continue
+    # Skip copying of jetFakes estimations based on underlying shapes to be able
+    # to use one name in the synced file.
+    # TODO: Should this be kept or do we want to put both version in the synced file and
+    #       perform the switch on combine level.
+    if args.mc:
+        if process in ["jetFakes", "QCD"]:
+            return None
+    else:
+        if "MC" in process:
+            return None
+    if process in rev_process_map:
+        # Check if MSSM sample.
+        if "SUSY" in process:
+            # Read mass from dataset name in case of SUSY samples.
+            mass = split_name[0].split("_")[-1]
+            process = "_".join([rev_process_map[process], mass])
         else:
-            if "MC" in process:
-                continue
-        _rev_process_map = {val: key for key, val in _process_map.items()}
-        if process in _rev_process_map.keys():
-            # Check if MSSM sample.
-            if "SUSY" in process:
-                # Read mass from dataset name in case of SUSY samples.
-                mass = split_name[0].split("_")[-1]
-                process = "_".join([_rev_process_map[process], mass])
+            if args.special != "TauES":
+                process = rev_process_map[process]
             else:
-                if args.special != "TauES":
-                    process = _rev_process_map[process]
-                else:
-                    if not "emb" in process and not "jetFakes" in process:
-                        process = _rev_process_map[process]
-        if category != "control_region":
-            if "EMB" in process:
-                process  = "EMB_"+category+"_0.0"
-            if "emb" in process:
-                process = "EMB_"+category+"_"+tau_es_map[process]
-        elif category == "control_region":
-            if "EMB" in process:
-                process  = "EMB"
-
-        name_output = "{process}".format(process=process)
-        # rename signal processes from ggH to ggH_htt
-        if process in ["ggH125", "qqH125", "WH125", "ZH125", "ttH125"]:
-            name_output = process.replace("125", "_htt125")
-        if "Nominal" not in variation:
-            name_output += "_" + variation
-        logging.debug(
+                if not "emb" in process and not "jetFakes" in process:
+                    process = rev_process_map[process]
+    if category != "control_region":
+        if "EMB" in process:
+            process = "EMB_" + category + "_0.0"
+        if "emb" in process:
+            process = "EMB_" + category + "_" + tau_es_map[process]
+    elif category == "control_region":
+        if "EMB" in process:
+            process = "EMB"
+
+    name_output = "{process}".format(process=process)
+    # rename signal processes from ggH to ggH_htt
+    if process in ["ggH125", "qqH125", "WH125", "ZH125", "ttH125"]:
+        name_output = process.replace("125", "_htt125")
+    if "Nominal" not in variation:
+        name_output += "_" + variation
+    return channel, category, name_output
+
+
+def build_mapping(names, args):
+    """Precompute output file, directory and names of every histogram of the synced files.
+
+    Args:
+        names (list): names of the histograms in the input file
+        args (argparse.Namespace): command line arguments
+
+    Returns:
+        dict: input name -> (output file, directory, output names), ordered by
+            output file, directory and name in the synced file
+    """
+    process_map = dict(_process_map)
+    if args.mc:
+        process_map["jetFakes"] = "jetFakesMC"
+        process_map["QCD"] = "QCDMC"
+    rev_process_map = {val: key for key, val in process_map.items()}
+
+    hist_map = defaultdict(dict)
+    for name in dict.fromkeys(names):
+        synced = synced_name(name, args, process_map, rev_process_map)
+        if synced is None:
+            continue
+        channel, category, name_output = synced
+        logger.debug(
             "Adding histogram with name %s as %s to category %s.",
-            key.GetName(),
+            name,
             name_output,
             channel + "_" + category,
         )
-        hist_map[channel][category][key.GetName()] = name_output
-    # Clean up
-    input_file.Close()
+        hist_map[(channel, category)][name] = name_output
 
-    # Loop over map and create the output file.
-    for channel in hist_map:
+    mapping = {}
+    for (channel, category), hists in sorted(hist_map.items()):
         ofname = os.path.join(
-            args.output,
-            "{ERA}-{CHANNELS}-synced.root".format(CHANNELS=channel, ERA=args.era),
+            args.output, args.output_name.format(era=args.era, channel=channel, category=category)
         )
-        # if args.gof:
-        #     ofname = os.path.join(
-        #         args.output,
-        #         "htt_{{category}}.inputs-mssm-vs-sm-Run{ERA}.root".format(ERA=args.era),
-        #     )
-        logging.info(
-            "Writing histograms to file %s with %s processes",
-            ofname,
-            args.num_processes,
-        )
-
-        if not os.path.exists(args.output):
-            os.mkdir(args.output)
-        with multiprocessing.Pool(args.num_processes) as pool:
-            pool.map(
-                write_hists_per_category,
-                [
-                    (*item, channel, ofname, args.input)
-                    for item in sorted(hist_map[channel].items())
-                ],
+        rules = renaming_rules(channel, category, args.era)
+        for name, name_output in sorted(hists.items(), key=lambda x: x[1]):
+            mapping[name] = (
+                ofname,
+                "{CHANNEL}_{CATEGORY}".format(CHANNEL=channel, CATEGORY=category),
+                output_names(name_output, channel, args.era, rules),
             )
+    return mapping
+
+
+# Input file of a reader process, opened once by the pool initializer.
+_INPUT = None
+
+
+def _init_reader(ifname):
+    global _INPUT
+    ROOT.TH1.AddDirectory(False)
+    _INPUT = ROOT.TFile(ifname, "READ")
+
+
+def _read_chunk(names):
+    histograms = []
+    for name in names:
+        hist = _INPUT.Get(name)
+        hist.SetDirectory(0)
+        ROOT.SetOwnership(hist, True)
+        histograms.append((name, hist))
+    return histograms
+
+
+def read_histograms(ifname, names, num_processes):
+    """Read the given histograms, each exactly once, and yield them in the given order.
+
+    With more than one process, every reader process opens the input file once and
+    sends its histograms back to the caller, which stays the only writer.
+
+    Yields:
+        tuple: (name, histogram)
+    """
+    chunks = [names[i:i + READ_CHUNK_SIZE] for i in range(0, len(names), READ_CHUNK_SIZE)]
+    if num_processes > 1:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(num_processes, initializer=_init_reader, initargs=(ifname,)) as pool:
+            for histograms in pool.imap(_read_chunk, chunks):
+                yield from histograms
+    else:
+        _init_reader(ifname)
+        try:
+            for chunk in chunks:
+                yield from _read_chunk(chunk)
+        finally:
+            _INPUT.Close()
+
+
+def write_synced_shapes(mapping, ifname, num_processes):
+    """Write the histograms into the synced files, opening every output file once.
+
+    Args:
+        mapping (dict): input name -> (output file, directory, output names), see build_mapping
+        ifname (str): input file
+        num_processes (int): number of reader processes
+    """
+    outfiles, directories = {}, {}
+    try:
+        for name, hist in read_histograms(ifname, list(mapping), num_processes):
+            ofname, dir_name, names = mapping[name]
+            if ofname not in outfiles:
+                logger.info("Writing histograms to file %s", ofname)
+                outfiles[ofname] = ROOT.TFile(ofname, "RECREATE")
+            if (ofname, dir_name) not in directories:
+                directories[(ofname, dir_name)] = outfiles[ofname].mkdir(dir_name)
+            for name_output in names:
+                hist.SetTitle(name_output)
+                hist.SetName(name_output)
+                directories[(ofname, dir_name)].WriteTObject(hist, name_output)
+    finally:
+        for outfile in outfiles.values():
+            outfile.Close()
+
+
+def main(args, telemetry):
+    telemetry.start_phase("reading")
+    input_file = ROOT.TFile(args.input)
+
+    # Loop over histograms to extract relevant information for synced files.
+    logger.info("Reading input histograms from file %s", args.input)
+    names = [key.GetName() for key in input_file.GetListOfKeys()]
+    # Clean up
+    input_file.Close()
+    mapping = build_mapping(names, args)
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    logger.info(
+        "Writing %s histograms with %s reading processes",
+        len(mapping),
+        args.num_processes,
+    )
+    telemetry.start_phase("writing")
+    write_synced_shapes(mapping, args.input, args.num_processes)
+    telemetry.count("histograms", len(mapping))
 
-    logging.info("Successfully written all histograms to file.")
+    logger.info("Successfully written all histograms to file.")
 
 
 if __name__ == "__main__":
     args = parse_args()
     setup_logging("convert_to_synced_shapes.log", level=logging.INFO)
-    main(args)
+    with StageTelemetry(
+        "convert_to_synced_shapes", era=args.era, input=args.input, num_processes=args.num_processes
+    ) as telemetry:
+        main(args, telemetry)
@@ -18,17 +18,16 @@ then
     do 
         logandrun python shapes/convert_to_synced_shapes.py -e $ERA \
                                                             -i output/shapes/${ERA}-${CHANNEL}-analysis-shapes-${TAG}/shapes-analysis-${ERA}-${CHANNEL}-${PROC}.root \
-                                                            -o output/shapes/${ERA}-${CHANNEL}-${TAG}-synced_shapes_${VARIABLE}-${PROC} \
+                                                            -o output/shapes \
+                                                            --output-name ${ERA}-${CHANNEL}-${TAG}-synced_shapes_${VARIABLE}-${PROC}.root \
                                                             --variable-selection ${VARIABLE} \
                                                             -n 12
-        OUTFILE=output/shapes/${ERA}-${CHANNEL}-${TAG}-synced_shapes_${VARIABLE}-${PROC}.root
-        echo "[INFO] Adding written files to single output file $OUTFILE..."
-        logandrun hadd -f $OUTFILE output/shapes/${ERA}-${CHANNEL}-${TAG}-synced_shapes_${VARIABLE}-${PROC}/*.root
     done
 else
     logandrun python shapes/convert_to_synced_shapes.py -e $ERA \
                                                         -i output/shapes/${ERA}-${CHANNEL}-control-shapes-${TAG}/shapes-control-${ERA}-${CHANNEL}.root \
                                                         -o output/shapes/${ERA}-${CHANNEL}-${TAG}-gof-synced_shapes \
+                                                        --output-name "{era}-{channel}-synced-{category}.root" \
                                                         --gof \
                                                         -n 12
 fi
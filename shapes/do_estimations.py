@@ -12,6 +12,10 @@ from shapes.estimations.fakefactors import fake_factor_estimation
 from shapes.estimations.qcd import qcd_estimation, abcd_estimation
 from shapes.estimations.ttbar_emb import emb_ttbar_contamination_estimation
 from config.logging_setup_configs import setup_logging, LogContext
+from config.telemetry import StageTelemetry
+from shapes.estimation_engine import EstimationTask, HistogramStore, input_keys, run_parallel, run_sequential
+from shapes.estimations.histogram import Histogram
+from shapes.histogram_index import HistogramIndex
 
 
 def parse_args():
@@ -45,43 +49,21 @@ def parse_args():
         default="CR",
     )
     parser.add_argument("-s", "--special", help="Special selection.", default="")
+    parser.add_argument(
+        "-n",
+        "--num-processes",
+        type=int,
+        default=1,
+        help="Number of processes to run the estimations on. With one process the file is updated sequentially.",
+    )
+    parser.add_argument(
+        "--numpy-histograms",
+        action="store_true",
+        help="Run the estimations on numpy-backed histograms instead of TH1 objects.",
+    )
     return parser.parse_args()
 
 
-def parse_process_name(name, variation_key):
-    logger.debug("Processing histogram %s", name.GetName())
-    dataset, selection, variation, variable = name.GetName().split("#")
-    if variation_key in variation:
-        sel_split = selection.split("-", maxsplit=1)
-        # Set category to default since not present in control plots.
-        category = ""
-        # Treat data hists seperately because only channel selection is applied to data.
-        if "data" in dataset:
-            channel = sel_split[0]
-            # Set category label for analysis categories.
-            if len(sel_split) > 1:
-                category = sel_split[1]
-            process = "data"
-        else:
-            channel = sel_split[0]
-            #  Check if analysis category present in root file.
-            if (
-                len(sel_split[1].split("-")) > 2
-                or ("Embedded" in sel_split[1] and len(sel_split[1].split("-")) > 1)
-                or ("W" in sel_split[1] and len(sel_split[1].split("-")) > 1)
-                or ("H125" in sel_split[1] and len(sel_split[1].split("-")) > 1)
-                or ("qqHComb125" in sel_split[1])
-            ):
-                process = "-".join(sel_split[1].split("-")[:-1])
-                category = sel_split[1].split("-")[-1]
-            else:
-                # Set only process if no categorization applied.
-                process = sel_split[1]
-        return channel, category, variable, variation, process
-    else:
-        return None, None, None, None, None
-
-
 def add_input_to_inputdict(input_dict, channel, category, variable, variation, process):
     if channel not in input_dict:
         input_dict[channel] = {category: {variable: {variation: [process]}}}
@@ -95,100 +77,61 @@ def add_input_to_inputdict(input_dict, channel, category, variable, variation, p
         input_dict[channel][category][variable][variation].append(process)
 
 
-def parse_histograms_for_ff(inputfile):
+def parse_histograms_for_ff(index):
     ff_inputs = {}
-    available_variations = set()
-    for key in inputfile.GetListOfKeys():
-        channel, category, variable, variation, process = parse_process_name(
-            key, "anti_iso"
+    for hist in index.query(variation=lambda variation: "anti_iso" in variation and not variation.startswith("abcd")):
+        add_input_to_inputdict(
+            ff_inputs, hist["channel"], hist["category"], hist["variable"], hist["variation"], hist["process"]
         )
-        available_variations.add(variation)
-        if channel is not None:
-            if not variation.startswith("abcd"):
-                add_input_to_inputdict(
-                    ff_inputs, channel, category, variable, variation, process
-                )
-    logger.debug(available_variations)
+    logger.debug(index.unique("variation"))
     return ff_inputs
 
 
-def parse_histograms_for_qcd(inputfile):
+def parse_histograms_for_qcd(index):
     qcd_inputs = {}
-    for key in inputfile.GetListOfKeys():
-        channel, category, variable, variation, process = parse_process_name(
-            key, "same_sign"
-        )
-        if channel is not None:
-            if (
-                channel in ["et", "mt", "em", "tt", "mm", "ee"]
-                or "abcd_same_sign_anti_iso" in variation
-            ):
-                add_input_to_inputdict(
-                    qcd_inputs, channel, category, variable, variation, process
-                )
+    for hist in index.query(variation=lambda variation: "same_sign" in variation):
+        if (
+            hist["channel"] in ["et", "mt", "em", "tt", "mm", "ee"]
+            or "abcd_same_sign_anti_iso" in hist["variation"]
+        ):
+            add_input_to_inputdict(
+                qcd_inputs, hist["channel"], hist["category"], hist["variable"], hist["variation"], hist["process"]
+            )
     return qcd_inputs
 
 
-def parse_histograms_for_emb_estimation(inputfile):
+def parse_histograms_for_emb_estimation(index):
     emb_categories = {}
-    for key in inputfile.GetListOfKeys():
-        dataset, selection, variation, variable = key.GetName().split("#")
-        if "Nominal" in variation:
-            sel_split = selection.split("-", maxsplit=1)
-            if "EMB" in dataset or ("emb" in dataset and "jetFakes" not in dataset):
-                channel = sel_split[0]
-                category = sel_split[1].replace("Embedded", "").strip("-")
-                if channel in emb_categories:
-                    if category in emb_categories[channel]:
-                        emb_categories[channel][category].append(variable)
-                    else:
-                        emb_categories[channel][category] = [variable]
-                else:
-                    emb_categories[channel] = {category: [variable]}
+    for hist in index.query(
+        variation=lambda variation: "Nominal" in variation,
+        dataset=lambda dataset: "EMB" in dataset or ("emb" in dataset and "jetFakes" not in dataset),
+    ):
+        channel = hist["channel"]
+        category = hist["selection"].split("-", maxsplit=1)[1].replace("Embedded", "").strip("-")
+        emb_categories.setdefault(channel, {}).setdefault(category, []).append(hist["variable"])
     return emb_categories
 
 
-def parse_histograms_for_qqh(inputfile):
+def parse_histograms_for_qqh(index):
     qqh_procs = {}
-    for key in inputfile.GetListOfKeys():
-        dataset, selection, variation, variable = key.GetName().split("#")
-        if dataset in ["qqH", "ZH", "WH"] and not variation.startswith("THU"):
-            sel_split = selection.split("-", maxsplit=1)
-            # Set category to default since not present in control plots.
-            category = ""
-            # Treat data hists seperately because only channel selection is applied to data.
-            if "data" in dataset:
-                channel = sel_split[0]
-                # Set category label for analysis categories.
-                if len(sel_split) > 1:
-                    category = sel_split[1]
-                process = "data"
-            else:
-                channel = sel_split[0]
-                #  Check if analysis category present in root file.
-                if (
-                    len(sel_split[1].split("-")) > 2
-                    or ("Embedded" in sel_split[1] and len(sel_split[1].split("-")) > 1)
-                    or ("W" in sel_split[1] and len(sel_split[1].split("-")) > 1)
-                    or ("H125" in sel_split[1] and len(sel_split[1].split("-")) > 1)
-                    or ("qqHComb125" in sel_split[1])
-                ):
-                    process = "-".join(sel_split[1].split("-")[:-1])
-                    category = sel_split[1].split("-")[-1]
-                else:
-                    # Set only process if no categorization applied.
-                    process = sel_split[1]
-            if category == "":
-                continue
-            add_input_to_inputdict(
-                qqh_procs, channel, category, variable, variation, process
-            )
+    for hist in index.query(
+        dataset=lambda dataset: dataset in ["qqH", "ZH", "WH"],
+        variation=lambda variation: not variation.startswith("THU"),
+        category=lambda category: category != "",
+    ):
+        add_input_to_inputdict(
+            qqh_procs, hist["channel"], hist["category"], hist["variable"], hist["variation"], hist["process"]
+        )
     return qqh_procs
 
 
-def main(args):
-    input_file = ROOT.TFile(args.input, "update")
-    logger.info("Reading inputs from file {}".format(args.input))
+def plan_estimations(args, index):
+    """Collect the estimations except for the fake factors, in the order they are written to the file."""
+    tasks = []
+
+    def _add(channel, category, variation, function, **kwargs):
+        tasks.append(EstimationTask((channel, category, variation), function, kwargs))
+
     tauES_names = []
     eleES_names = []
     if args.special == "TauES":
@@ -208,7 +151,7 @@ def main(args):
     else:
         pass
     if args.do_qcd:
-        qcd_inputs = parse_histograms_for_qcd(input_file)
+        qcd_inputs = parse_histograms_for_qcd(index)
         logger.info("Starting estimations for the QCD mulitjet process.")
         logger.debug("%s", json.dumps(qcd_inputs, sort_keys=True, indent=4))
         for channel in qcd_inputs:
@@ -238,7 +181,6 @@ def main(args):
                     pass
                 for var in qcd_inputs[channel][category]:
                     common_kwargs = dict(
-                        rootfile=input_file,
                         channel=channel,
                         selection=category,
                         variable=var,
@@ -247,37 +189,40 @@ def main(args):
                         if channel in ["et", "mt", "em", "mm", "ee"]:
                             for use_emb in [True, False]:
                                 for use_nlo in [False]:
-                                    estimated_hist = qcd_estimation(
+                                    _add(
+                                        channel, category, variation,
+                                        qcd_estimation,
                                         **common_kwargs,
                                         variation=variation,
                                         is_embedding=use_emb,
                                         is_nlo=use_nlo,
                                         extrapolation_factor=extrapolation_factor,
                                     )
-                                    estimated_hist.Write()
                         else:
                             for use_emb in [True, False]:
-                                estimated_hist = abcd_estimation(
+                                _add(
+                                    channel, category, variation,
+                                    abcd_estimation,
                                     **common_kwargs,
                                     variation=variation,
                                     is_embedding=use_emb,
                                 )
-                                estimated_hist.Write()
                     if channel in ["em"]:
                         for variation, scale in zip(
                             ["subtrMCUp", "subtrMCDown"], [0.8, 1.2]
                         ):
                             for use_emb in [True, False]:
-                                estimated_hist = qcd_estimation(
+                                _add(
+                                    channel, category, variation,
+                                    qcd_estimation,
                                     **common_kwargs,
                                     variation=variation,
                                     is_embedding=use_emb,
                                     extrapolation_factor=extrapolation_factor,
                                     sub_scale=scale,
                                 )
-                                estimated_hist.Write()
     if args.do_qqh_procs:
-        qqh_procs = parse_histograms_for_qqh(input_file)
+        qqh_procs = parse_histograms_for_qqh(index)
         logger.info("Starting adding for qqH and VH processes.")
         logger.debug("%s", json.dumps(qqh_procs, sort_keys=True, indent=4))
         for channel in qqh_procs:
@@ -287,118 +232,173 @@ def main(args):
                 logger.info("Do estimation for category %s", category)
                 for var in qqh_procs[channel][category]:
                     for variation in qqh_procs[channel][category][var]:
-                        estimated_hist = qqH_merge_estimation(
-                            input_file, channel, category, var, variation=variation
+                        _add(
+                            channel, category, variation,
+                            qqH_merge_estimation,
+                            channel=channel,
+                            selection=category,
+                            variable=var,
+                            variation=variation,
                         )
-                        estimated_hist.Write()
     if args.do_emb_tt:
-        emb_categories = parse_histograms_for_emb_estimation(input_file)
+        emb_categories = parse_histograms_for_emb_estimation(index)
         logger.info("Producing embedding ttbar variations.")
         logger.debug("%s", json.dumps(emb_categories, sort_keys=True, indent=4))
         for channel in emb_categories:
             for category in emb_categories[channel]:
                 logger.info("Do estimation for category %s", category)
                 if args.special == "EleES":
-                    for embsignal in eleES_names:
-                        print(embsignal)
-                        var = emb_categories[channel][category][0]
-                        estimated_hist = emb_ttbar_contamination_estimation(
-                            input_file,
-                            channel,
-                            category,
-                            var,
-                            sub_scale=0.1,
-                            embname=embsignal,
-                        )
-                        estimated_hist.Write()
-                        estimated_hist = emb_ttbar_contamination_estimation(
-                            input_file,
-                            channel,
-                            category,
-                            var,
-                            sub_scale=-0.1,
-                            embname=embsignal,
-                        )
-                        estimated_hist.Write()
+                    embsignals = eleES_names
+                    variables = [emb_categories[channel][category][0]]
                 else:
-                    for var in emb_categories[channel][category]:
-                        estimated_hist = emb_ttbar_contamination_estimation(
-                            input_file,
-                            channel,
-                            category,
-                            var,
-                            sub_scale=0.1,
-                            embname="EMB",
-                        )
-                        estimated_hist.Write()
-                        estimated_hist = emb_ttbar_contamination_estimation(
-                            input_file,
-                            channel,
-                            category,
-                            var,
-                            sub_scale=-0.1,
-                            embname="EMB",
-                        )
-                        estimated_hist.Write()
+                    embsignals = ["EMB"]
+                    variables = emb_categories[channel][category]
+                for embsignal in embsignals:
+                    for var in variables:
+                        for sub_scale in [0.1, -0.1]:
+                            _add(
+                                channel, category, "Nominal",
+                                emb_ttbar_contamination_estimation,
+                                channel=channel,
+                                category=category,
+                                variable=var,
+                                sub_scale=sub_scale,
+                                embname=embsignal,
+                            )
+    return tasks
+
+
+def plan_ff_estimations(args, index):
+    """
+    Collect the fake factor estimations. The QCD estimation is subtracted in the DR selections
+    if present in the index, so the fake factors are planned after it has been added.
+    """
+    tasks = []
+
+    def _add(channel, category, variation, function, **kwargs):
+        tasks.append(EstimationTask((channel, category, variation), function, kwargs))
+
     if args.do_ff:
         logger.info("Starting estimations for fake factors and their variations")
-        ff_inputs = parse_histograms_for_ff(input_file)
+        ff_inputs = parse_histograms_for_ff(index)
         logger.debug("%s", json.dumps(ff_inputs, sort_keys=True, indent=4))
         for ch in ff_inputs:
             for cat in ff_inputs[ch]:
                 logger.info("Do estimation for category %s", cat)
-                with LogContext(logger).duplicate_filter():
-                    for var in ff_inputs[ch][cat]:
-                        for variation in ff_inputs[ch][cat][var]:
+                for var in ff_inputs[ch][cat]:
+                    for variation in ff_inputs[ch][cat][var]:
 
-                            if "same_sign_anti_iso" in variation:
-                                # Skip same sign anti iso variations since this is only used
-                                # for the qcd estimation of anti iso region for DR ff.
-                                # and is accessible via QCD#anti_iso# variation
-                                continue
+                        if "same_sign_anti_iso" in variation:
+                            # Skip same sign anti iso variations since this is only used
+                            # for the qcd estimation of anti iso region for DR ff.
+                            # and is accessible via QCD#anti_iso# variation
+                            continue
 
-                            _fake_factor_estimation = partial(
-                                fake_factor_estimation,
-                                rootfile=input_file,
-                                channel=ch,
-                                selection=cat,
-                                variable=var,
-                                selection_option=args.selection_option,
-                            )
-                            estimated_hist = _fake_factor_estimation(
-                                variation=variation,
+                        _fake_factor_estimation = partial(
+                            _add,
+                            ch, cat, variation,
+                            fake_factor_estimation,
+                            channel=ch,
+                            selection=cat,
+                            variable=var,
+                            selection_option=args.selection_option,
+                            index=index,
+                        )
+                        _fake_factor_estimation(
+                            variation=variation,
+                        )
+                        _fake_factor_estimation(
+                            variation=variation,
+                            is_embedding=False,
+                        )
+                        for sub_variation, scale in zip(
+                            [
+                                "CMS_ff_total_sub_syst_Channel_EraUp",
+                                "CMS_ff_total_sub_syst_Channel_EraDown",
+                            ],
+                            [0.9, 1.1],
+                        ):
+                            _fake_factor_estimation(
+                                variation=sub_variation,
+                                sub_scale=scale,
                             )
-                            estimated_hist.Write()
-                            estimated_hist = _fake_factor_estimation(
-                                variation=variation,
+                            _fake_factor_estimation(
+                                variation=sub_variation,
                                 is_embedding=False,
+                                sub_scale=scale,
                             )
-                            estimated_hist.Write()
-                            for variation, scale in zip(
-                                [
-                                    "CMS_ff_total_sub_syst_Channel_EraUp",
-                                    "CMS_ff_total_sub_syst_Channel_EraDown",
-                                ],
-                                [0.9, 1.1],
-                            ):
-                                estimated_hist = _fake_factor_estimation(
-                                    variation=variation,
-                                    sub_scale=scale,
-                                )
-                                estimated_hist.Write()
-                                estimated_hist = _fake_factor_estimation(
-                                    variation=variation,
-                                    is_embedding=False,
-                                    sub_scale=scale,
-                                )
-                                estimated_hist.Write()
+    return tasks
+
+
+def main(args, telemetry):
+    # the fake factor estimation depends on the outputs of the first stage (see plan_ff_estimations)
+    stages = (plan_estimations, plan_ff_estimations)
+    tasks = []
+    telemetry.start_phase("reading")
+    if args.num_processes > 1 or args.numpy_histograms:
+        # Read the inputs once, estimate in memory and write everything in a single pass afterwards.
+        input_file = ROOT.TFile(args.input, "read")
+        logger.info("Reading inputs from file {}".format(args.input))
+        index = HistogramIndex.from_rootfile(input_file, args.input)
+        store = HistogramStore({})
+        estimated_hists = []
+        for plan in stages:
+            telemetry.start_phase("reading")
+            stage_tasks = plan(args, index)
+            if not stage_tasks:
+                continue
+            store.load(input_file, input_keys(index, stage_tasks), as_arrays=args.numpy_histograms)
+            telemetry.start_phase("estimation")
+            if args.num_processes > 1:
+                stage_hists = run_parallel(store, stage_tasks, args.num_processes)
+            else:
+                stage_hists = list(run_sequential(store, stage_tasks))
+            for estimated_hist in stage_hists:
+                store.add(estimated_hist)
+                index.add(estimated_hist.GetName())
+            tasks += stage_tasks
+            estimated_hists += stage_hists
+        input_file.Close()
+
+        telemetry.start_phase("writing")
+        output_file = ROOT.TFile(args.input, "update")
+        for estimated_hist in estimated_hists:
+            if isinstance(estimated_hist, Histogram):
+                estimated_hist = estimated_hist.to_th1()
+            output_file.WriteTObject(estimated_hist)
+            telemetry.count("histograms", 1)
+    else:
+        output_file = ROOT.TFile(args.input, "update")
+        logger.info("Reading inputs from file {}".format(args.input))
+        index = HistogramIndex.from_rootfile(output_file, args.input)
+        # histograms are read, estimated and written one task after another
+        telemetry.start_phase("estimation")
+        with LogContext(logger).duplicate_filter():
+            for plan in stages:
+                stage_tasks = plan(args, index)
+                for estimated_hist in run_sequential(output_file, stage_tasks):
+                    estimated_hist.Write()
+                    index.add(estimated_hist.GetName())
+                    telemetry.count("histograms", 1)
+                tasks += stage_tasks
 
+    telemetry.count("tasks", len(tasks))
     logger.info("Successfully finished estimations.")
-    input_file.Close()
+    telemetry.start_phase("writing")
+    output_file.Close()
+    # Store the index including the estimated histograms for subsequent runs on the same file.
+    index.save(args.input)
     return
 
 
 if __name__ == "__main__":
     args = parse_args()
     logger = setup_logging(logger=logging.getLogger(__name__))
-    main(args)
+    with StageTelemetry(
+        "do_estimations",
+        era=args.era,
+        input=args.input,
+        num_processes=args.num_processes,
+        numpy_histograms=args.numpy_histograms,
+    ) as telemetry:
+        main(args, telemetry)
@@ -0,0 +1,147 @@
+import logging
+import multiprocessing as mp
+from collections import namedtuple
+
+import ROOT
+
+from config.logging_setup_configs import LogQueue, setup_logging
+from shapes.estimations.histogram import Histogram
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+# shard: (channel, category, variation) the estimation belongs to
+# function: estimation function, called as function(rootfile=..., **kwargs)
+EstimationTask = namedtuple("EstimationTask", ["shard", "function", "kwargs"])
+
+
+class HistogramStore:
+    """
+    In-memory stand-in for the shapes TFile.
+
+    Holds detached copies of the histograms and provides the Get method used
+    by the estimation functions, so that the inputs are read from disk once
+    and shared by all workers of the process pool.
+
+    Args:
+        histograms (dict): histogram name -> TH1 or Histogram
+    """
+
+    def __init__(self, histograms):
+        self.histograms = histograms
+
+    def Get(self, name):
+        return self.histograms.get(name)
+
+    def add(self, hist):
+        """Add an estimated histogram, i.e. as input of later estimations."""
+        self.histograms[hist.GetName()] = hist
+
+    def load(self, rootfile, names, as_arrays=False):
+        """Read the given histograms that are not in the store yet, optionally converted to numpy-backed Histograms."""
+        loaded = 0
+        for name in names:
+            if name in self.histograms:
+                continue
+            hist = rootfile.Get(name)
+            if not hist:
+                logger.warning(f"Could not read histogram {name}")
+                continue
+            if as_arrays:
+                hist = Histogram.from_th1(hist)
+            else:
+                hist.SetDirectory(0)
+            self.histograms[name] = hist
+            loaded += 1
+        logger.info(f"Loaded {loaded} histograms into memory")
+
+    @classmethod
+    def from_rootfile(cls, rootfile, names, as_arrays=False):
+        """Read the given histograms, optionally converted to numpy-backed Histograms."""
+        store = cls({})
+        store.load(rootfile, names, as_arrays=as_arrays)
+        return store
+
+
+def input_keys(index, tasks):
+    """
+    Names of the histograms the tasks may read. An estimation only combines histograms of
+    its own channel, category and variable, all histograms of these are selected.
+    """
+    groups = {
+        (task.shard[0], task.kwargs.get("selection", task.kwargs.get("category")), task.kwargs["variable"])
+        for task in tasks
+    }
+    return [
+        key
+        for key, channel, category, variable in zip(
+            index.columns["key"], index.columns["channel"], index.columns["category"], index.columns["variable"]
+        )
+        if (channel, category, variable) in groups
+    ]
+
+
+# Set before the pool is forked, the workers access them without pickling.
+_STORE = None
+_SHARDS = None
+
+
+def _init_worker():
+    # Estimated histograms must not be attached to any file inherited from the parent.
+    ROOT.TH1.AddDirectory(False)
+    ROOT.gROOT.cd()
+
+
+def _run_shard(shard_index):
+    results = []
+    for position, task in _SHARDS[shard_index]:
+        results.append((position, task.function(rootfile=_STORE, **task.kwargs)))
+    return results
+
+
+def shard_tasks(tasks):
+    """Group the tasks by their shard, keeping the shards in order of their first appearance.
+
+    Returns:
+        list: list of shards, each a list of (position, task) tuples
+    """
+    shards = {}
+    for position, task in enumerate(tasks):
+        shards.setdefault(task.shard, []).append((position, task))
+    return list(shards.values())
+
+
+def run_sequential(rootfile, tasks):
+    """Run the estimations one after another on the given file. Yields the histograms in task order."""
+    for task in tasks:
+        yield task.function(rootfile=rootfile, **task.kwargs)
+
+
+def run_parallel(store, tasks, num_processes):
+    """Run the estimations sharded by (channel, category, variation) in a process pool.
+
+    Args:
+        store (HistogramStore): input histograms
+        tasks (list): list of EstimationTask
+        num_processes (int): number of worker processes
+
+    Returns:
+        list: estimated histograms in task order, identical to the order of run_sequential
+    """
+    global _STORE, _SHARDS
+    _STORE, _SHARDS = store, shard_tasks(tasks)
+    logger.info(f"Running {len(tasks)} estimations in {len(_SHARDS)} shards on {num_processes} processes")
+    results = [None] * len(tasks)
+    try:
+        context = mp.get_context("fork")
+        with LogQueue(context) as log_queue, context.Pool(
+            num_processes, initializer=log_queue.initializer(_init_worker)
+        ) as pool:
+            for shard_results in pool.imap_unordered(_run_shard, range(len(_SHARDS))):
+                for position, hist in shard_results:
+                    results[position] = hist
+            # let the workers exit normally to flush their pending log records
+            pool.close()
+            pool.join()
+    finally:
+        _STORE, _SHARDS = None, None
+    return results
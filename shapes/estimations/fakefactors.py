@@ -20,6 +20,7 @@ def fake_factor_estimation(
     special="",
     doTauES=False,
     selection_option="CR",
+    index=None,
 ):
 
     if is_embedding:
@@ -64,7 +65,10 @@ def fake_factor_estimation(
         procs_to_subtract += ff_processes_covered_by_mc
         logger.info(f"DR;ff selection, subtracting {procs_to_subtract}")
 
-        processes_in_root_file = set([str(key.GetName()).split("#")[0] for key in rootfile.GetListOfKeys()])
+        if index is not None:
+            processes_in_root_file = set(index.unique("dataset"))
+        else:
+            processes_in_root_file = set([str(key.GetName()).split("#")[0] for key in rootfile.GetListOfKeys()])
 
         if _QCD in processes_in_root_file and _QCD in procs_to_subtract:
             logger.info("QCD process found in root file, will be used for fake factor estimation.")
@@ -0,0 +1,146 @@
+import numpy as np
+
+
+def _buffer_view(buffer, size):
+    # PyROOT returns pointers as views of unknown length, the shape has to be set explicitly.
+    buffer.reshape((size,))
+    return np.asarray(buffer)
+
+
+def th1_contents_view(th1):
+    """Return a numpy view on the bin contents of a TH1, including under- and overflow.
+
+    Changes to the returned array are directly applied to the histogram.
+    """
+    return _buffer_view(th1.GetArray(), th1.GetNbinsX() + 2)
+
+
+class Histogram:
+    """
+    Lightweight one-dimensional histogram backed by numpy arrays.
+
+    Implements the subset of the TH1 interface used by the estimations
+    (Get/SetName, SetTitle, Clone, Add, Scale, Integral, bin access), so the
+    estimation functions can be run on it unchanged, but all arithmetic is
+    done vectorized instead of through PyROOT calls. Contents and sumw2
+    include the under- and overflow bin, following the TH1 bin numbering.
+
+    Args:
+        name (str): name of the histogram
+        edges (array): bin edges, length nbins + 1
+        contents (array): bin contents, length nbins + 2
+        sumw2 (array): sum of squared weights per bin, length nbins + 2
+        title (str): title of the histogram, defaults to the name
+        entries (float): number of entries
+        th1_class (str): ROOT class used when converting back to a TH1
+    """
+
+    def __init__(self, name, edges, contents, sumw2=None, title=None, entries=0.0, th1_class="TH1D"):
+        self.name = name
+        self.title = name if title is None else title
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.contents = np.asarray(contents, dtype=np.float64)
+        self.sumw2 = np.abs(self.contents) if sumw2 is None else np.asarray(sumw2, dtype=np.float64)
+        self.entries = entries
+        self.th1_class = th1_class
+        if not (len(self.edges) + 1 == len(self.contents) == len(self.sumw2)):
+            raise ValueError(f"Inconsistent array lengths for histogram {name}")
+
+    def __repr__(self):
+        return f"Histogram({self.name!r}, nbins={self.GetNbinsX()}, integral={self.Integral()})"
+
+    @property
+    def values(self):
+        """View on the contents without under- and overflow."""
+        return self.contents[1:-1]
+
+    # TH1 compatible interface
+
+    def GetName(self):
+        return self.name
+
+    def SetName(self, name):
+        self.name = name
+
+    def GetTitle(self):
+        return self.title
+
+    def SetTitle(self, title):
+        self.title = title
+
+    def GetNbinsX(self):
+        return len(self.edges) - 1
+
+    def GetBinContent(self, i_bin):
+        return float(self.contents[i_bin])
+
+    def SetBinContent(self, i_bin, value):
+        self.contents[i_bin] = value
+
+    def GetBinError(self, i_bin):
+        return float(np.sqrt(self.sumw2[i_bin]))
+
+    def Clone(self, name=None):
+        return Histogram(
+            self.name if name is None else name,
+            self.edges.copy(),
+            self.contents.copy(),
+            self.sumw2.copy(),
+            title=self.title,
+            entries=self.entries,
+            th1_class=self.th1_class,
+        )
+
+    def Add(self, other, scale=1.0):
+        if not isinstance(other, Histogram):
+            other = Histogram.from_th1(other)
+        if len(other.contents) != len(self.contents):
+            raise ValueError(f"Cannot add histograms {other.GetName()} and {self.name} with different binning")
+        self.contents += scale * other.contents
+        self.sumw2 += scale * scale * other.sumw2
+        self.entries = abs(self.entries + scale * other.entries)
+        return True
+
+    def Scale(self, scale):
+        self.contents *= scale
+        self.sumw2 *= scale * scale
+
+    def Integral(self):
+        return float(self.values.sum())
+
+    # Conversion from and to ROOT
+
+    @classmethod
+    def from_th1(cls, th1, name=None):
+        nbins = th1.GetNbinsX()
+        axis = th1.GetXaxis()
+        if axis.GetXbins().GetSize() == nbins + 1:
+            edges = np.array(_buffer_view(axis.GetXbins().GetArray(), nbins + 1), dtype=np.float64)
+        else:
+            edges = np.linspace(axis.GetXmin(), axis.GetXmax(), nbins + 1)
+        contents = np.array(th1_contents_view(th1), dtype=np.float64)
+        if th1.GetSumw2N() == nbins + 2:
+            sumw2 = np.array(_buffer_view(th1.GetSumw2().GetArray(), nbins + 2), dtype=np.float64)
+        else:
+            # Without stored weights ROOT uses the bin content as squared error.
+            sumw2 = np.abs(contents)
+        return cls(
+            th1.GetName() if name is None else name,
+            edges,
+            contents,
+            sumw2,
+            title=th1.GetTitle(),
+            entries=th1.GetEntries(),
+            th1_class=th1.ClassName(),
+        )
+
+    def to_th1(self):
+        import ROOT
+
+        th1 = getattr(ROOT, self.th1_class)(self.name, self.title, self.GetNbinsX(), self.edges)
+        th1.SetDirectory(0)
+        th1.Sumw2()
+        th1_contents_view(th1)[:] = self.contents
+        _buffer_view(th1.GetSumw2().GetArray(), self.GetNbinsX() + 2)[:] = self.sumw2
+        th1.SetEntries(self.entries)
+        return th1
@@ -1,25 +1,30 @@
 import logging
 from functools import partial
+import numpy as np
 import ROOT
 from .defaults import _name_string, _process_map, _dataset_map
+from .histogram import Histogram, th1_contents_view
 from config.logging_setup_configs import setup_logging
 
 logger = setup_logging(logger=logging.getLogger(__name__))
 
 
+def _bin_values(histogram):
+    # Writable view on the bin contents without under- and overflow.
+    if isinstance(histogram, Histogram):
+        return histogram.values
+    return th1_contents_view(histogram)[1:-1]
+
+
 def replace_negative_entries_and_renormalize(histogram, tolerance):
     # This function is taken from https://github.com/KIT-CMS/shape-producer/blob/beddc4a43e2e326018d804e58d612d8688ec33b6/shape_producer/histogram.py#L189
 
     # Find negative entries and calculate norm.
-    norm_all = 0.0
-    norm_positive = 0.0
-    for i_bin in range(1, histogram.GetNbinsX() + 1):
-        this_bin = histogram.GetBinContent(i_bin)
-        if this_bin < 0.0:
-            histogram.SetBinContent(i_bin, 0.0)
-        else:
-            norm_positive += this_bin
-        norm_all += this_bin
+    values = _bin_values(histogram)
+    negative = values < 0.0
+    norm_all = float(values.sum(dtype=np.float64))
+    norm_positive = float(values[~negative].sum(dtype=np.float64))
+    values[negative] = 0.0
 
     if norm_all == 0.0 and norm_positive != 0.0:
         logger.fatal(
@@ -51,9 +56,7 @@ def replace_negative_entries_and_renormalize(histogram, tolerance):
                 "Renormalization failed because all bins have negative entries."
             )
             raise Exception
-        for i_bin in range(1, histogram.GetNbinsX() + 1):
-            this_bin = histogram.GetBinContent(i_bin)
-            histogram.SetBinContent(i_bin, this_bin * norm_all / norm_positive)
+        values *= norm_all / norm_positive
 
     return histogram
 
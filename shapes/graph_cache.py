@@ -0,0 +1,242 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import types
+
+from ntuple_processor import GraphManager, UnitManager
+
+import shapes.utils as shape_utils
+from config.logging_setup_configs import setup_logging
+from config.ntuple_processor_config_helper import stable_hash_key
+from config.shapes.variations import LazyVariable
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+# Bump whenever the layout of the cached graphs or the key payload changes.
+CACHE_VERSION = 2
+
+
+class CanonicalizationError(TypeError):
+    """Raised for objects without a deterministic representation, which must not be cached."""
+
+
+def _code_digest(code):
+    """Digest of the bytecode, constants and names of a code object, nested code objects included."""
+    digest = hashlib.sha256(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            digest.update(_code_digest(const).encode("utf-8"))
+        elif isinstance(const, (bytes, complex, type(Ellipsis))):
+            digest.update(repr(const).encode("utf-8"))
+        else:
+            digest.update(json.dumps(canonical(const), sort_keys=True).encode("utf-8"))
+    digest.update(json.dumps([code.co_names, code.co_varnames, code.co_freevars]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _qualified_name(obj):
+    return f"{getattr(obj, '__module__', None)}.{getattr(obj, '__qualname__', getattr(obj, '__name__', None))}"
+
+
+def canonical(obj, _path=None):
+    """Convert (nested) ntuple_processor objects into a JSON-serializable structure.
+
+    Objects are represented by their type and their attributes, containers
+    are converted recursively and sets are sorted, so that the result does not
+    depend on memory addresses or iteration order. Reference cycles are cut.
+    Functions are represented by their qualified name, the digest of their code
+    and their default and closure values, lazy variables by their resolved value.
+
+    Args:
+        obj (any): object to be converted, i.e. a Unit, Selection, Dataset or variation
+
+    Returns:
+        any: JSON-serializable representation of obj
+
+    Raises:
+        CanonicalizationError: if obj contains an object without a deterministic representation
+    """
+    if isinstance(obj, (str, int, float, bool, type(None))):
+        return obj
+    _path = _path or set()
+    if id(obj) in _path:
+        return "<cycle>"
+    _path = _path | {id(obj)}
+    if isinstance(obj, dict):
+        return {str(k): canonical(v, _path) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [canonical(it, _path) for it in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((canonical(it, _path) for it in obj), key=repr)
+    if hasattr(obj, "tolist"):  # numpy arrays, i.e. binning edges
+        return obj.tolist()
+    if isinstance(obj, LazyVariable):  # the factory may depend on the runtime variables
+        return {"__type__": "LazyVariable", "value": canonical(obj.resolve(), _path)}
+    if isinstance(obj, (type, types.ModuleType, types.BuiltinFunctionType)):
+        return {"__type__": type(obj).__name__, "name": _qualified_name(obj)}
+    if isinstance(obj, types.MethodType):
+        return {"__type__": "method", "self": canonical(obj.__self__, _path), "function": canonical(obj.__func__, _path)}
+    if isinstance(obj, functools.partial):
+        return {
+            "__type__": "partial",
+            "function": canonical(obj.func, _path),
+            "args": canonical(obj.args, _path),
+            "keywords": canonical(obj.keywords, _path),
+        }
+    if isinstance(obj, types.FunctionType):
+        return {
+            "__type__": "function",
+            "name": _qualified_name(obj),
+            "code": _code_digest(obj.__code__),
+            "defaults": canonical(obj.__defaults__, _path),
+            "kwdefaults": canonical(obj.__kwdefaults__, _path),
+            "closure": [canonical(cell.cell_contents, _path) for cell in obj.__closure__ or ()],
+        }
+    if hasattr(obj, "__dict__"):
+        return {
+            "__type__": _qualified_name(type(obj)),
+            **{k: canonical(v, _path) for k, v in sorted(vars(obj).items())},
+        }
+    raise CanonicalizationError(f"No deterministic representation of {type(obj).__qualname__} object {obj!r}")
+
+
+class GraphCache:
+    """
+    Content-addressed on-disk cache of optimized computation graphs.
+
+    Graphs are stored per channel and dataset, since the optimization never
+    merges graphs of different datasets. The key is a hash over the resolved
+    units (dataset file lists, selections and binning), the booked variations
+    and the optimization level, so any change in one of these leads to a
+    rebuild of only the affected graphs.
+
+    Args:
+        directory (str): directory the cached graphs are written to
+        optimization_level (int): optimization level passed to GraphManager.optimize
+    """
+
+    def __init__(self, directory, optimization_level):
+        self.directory = directory
+        self.optimization_level = optimization_level
+        self.hits, self.misses = 0, 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *payload):
+        content = json.dumps(
+            [CACHE_VERSION, self.optimization_level, canonical(payload)],
+            sort_keys=True,
+        )
+        return f"{stable_hash_key(content, num_bytes=16):032x}"
+
+    def path(self, name, key):
+        return os.path.join(self.directory, f"{name}-{key}.pkl")
+
+    def load(self, name, key):
+        path = self.path(name, key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as f:
+                graphs = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError) as e:
+            logger.warning(f"Ignoring corrupted graph cache entry {path}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return graphs
+
+    def store(self, name, key, graphs):
+        # Write to a temporary file first, so that an interrupted run never leaves a truncated entry behind.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(graphs, f)
+        os.replace(tmp_path, self.path(name, key))
+
+
+def group_bookings_by_dataset(units, bookings):
+    """Split the recorded bookings of one channel by the dataset of the booked processes.
+
+    Args:
+        units (dict): process name -> list of Units, as returned by get_analysis_units
+        bookings (list): list of (processes, variations) tuples in booking order
+
+    Returns:
+        dict: dataset name -> list of (processes, variations) tuples
+    """
+    groups = {}
+    for processes, variations in bookings:
+        by_dataset = {}
+        for process in sorted(processes):
+            if not units.get(process):
+                continue
+            by_dataset.setdefault(units[process][0].dataset.name, set()).add(process)
+        for dataset, _processes in by_dataset.items():
+            groups.setdefault(dataset, []).append((_processes, variations))
+    return groups
+
+
+def build_graphs(channel, units, bookings, cache, enable_check=False, telemetry=None):
+    """Build the optimized graphs of one channel, reusing cached graphs where possible.
+
+    Args:
+        channel (str): channel the units belong to
+        units (dict): process name -> list of Units
+        bookings (list): list of (processes, variations) tuples in booking order
+        cache (GraphCache): cache used to load and store the graphs
+        enable_check (bool): enables the check for double actions during booking
+        telemetry (StageTelemetry): if given, the deferred booking of uncached datasets is
+            recorded in the "booking" phase, the optimization in the "optimization" phase
+
+    Returns:
+        list: optimized graphs of all datasets of the channel
+    """
+    memo, keys = {}, {}
+    groups = group_bookings_by_dataset(units, bookings)
+    # All keys are computed before anything is booked, since booking may modify the units.
+    for dataset, _bookings in sorted(groups.items()):
+        try:
+            payload = []
+            for processes, variations in _bookings:
+                for process in sorted(processes):
+                    if process not in memo:
+                        memo[process] = canonical(units[process])
+                payload.append([[memo[process] for process in sorted(processes)], canonical(variations)])
+            keys[dataset] = cache.key(channel, dataset, payload)
+        except CanonicalizationError as e:
+            logger.warning(f"Graphs of {channel}-{dataset} are not cached: {e}")
+            keys[dataset] = None
+
+    graphs = []
+    for dataset, _bookings in sorted(groups.items()):
+        name, key = f"{channel}-{dataset}", keys[dataset]
+        cached = cache.load(name, key) if key is not None else None
+        if cached is not None:
+            logger.info(f"Loaded {len(cached)} graph(s) for {name} from cache")
+            graphs.extend(cached)
+            continue
+
+        logger.info(f"Booking and optimizing graphs for {name}")
+        if telemetry is not None:
+            telemetry.start_phase("booking")
+        unit_manager = UnitManager()
+        for processes, variations in _bookings:
+            shape_utils.book_histograms(
+                processes=processes,
+                variations=variations,
+                manager=unit_manager,
+                datasets=units,
+                enable_check=enable_check,
+            )
+        if telemetry is not None:
+            telemetry.start_phase("optimization")
+        g_manager = GraphManager(unit_manager.booked_units, True)
+        g_manager.optimize(cache.optimization_level)
+        if key is not None:
+            cache.store(name, key, g_manager.graphs)
+        graphs.extend(g_manager.graphs)
+    return graphs
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+
+from config.logging_setup_configs import setup_logging
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+FIELDS = ("key", "dataset", "selection", "channel", "process", "category", "variation", "variable")
+
+
+def split_histogram_name(name):
+    """Split a histogram name of the form dataset#selection#variation#variable into its fields.
+
+    The interpretation of the selection follows the naming used by the shape
+    production: the first part is the channel, followed by the process and,
+    if present, the analysis category.
+
+    Args:
+        name (str): name of the histogram
+
+    Returns:
+        tuple: (dataset, selection, channel, process, category, variation, variable)
+    """
+    dataset, selection, variation, variable = name.split("#")
+    sel_split = selection.split("-", maxsplit=1)
+    channel = sel_split[0]
+    # Set category to default since not present in control plots.
+    category = ""
+    # Treat data hists seperately because only channel selection is applied to data.
+    if "data" in dataset:
+        # Set category label for analysis categories.
+        if len(sel_split) > 1:
+            category = sel_split[1]
+        process = "data"
+    elif len(sel_split) == 1:
+        process = ""
+    elif (
+        len(sel_split[1].split("-")) > 2
+        or ("Embedded" in sel_split[1] and len(sel_split[1].split("-")) > 1)
+        or ("W" in sel_split[1] and len(sel_split[1].split("-")) > 1)
+        or ("H125" in sel_split[1] and len(sel_split[1].split("-")) > 1)
+        or ("qqHComb125" in sel_split[1])
+    ):
+        #  Analysis category present in root file.
+        process = "-".join(sel_split[1].split("-")[:-1])
+        category = sel_split[1].split("-")[-1]
+    else:
+        # Set only process if no categorization applied.
+        process = sel_split[1]
+    return dataset, selection, channel, process, category, variation, variable
+
+
+class HistogramIndex:
+    """
+    Columnar index of the histograms stored in a shapes file.
+
+    Every histogram name is split once into its fields, which are kept as one
+    list per field. Lookup tables per field allow to select histograms by value
+    without touching the names again. The index can be stored as a JSON sidecar
+    next to the ROOT file and is reused as long as the file is unchanged.
+
+    Args:
+        names (iterable): histogram names in the order of the keys in the file
+    """
+
+    def __init__(self, names=()):
+        self.columns = {field: [] for field in FIELDS}
+        self._lookup = {field: {} for field in FIELDS}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.columns["key"])
+
+    def __contains__(self, name):
+        return name in self._lookup["key"]
+
+    def add(self, name):
+        """Add a histogram to the index. Names already present (i.e. further cycles) are skipped."""
+        if name not in self._lookup["key"]:
+            self._append((name, *split_histogram_name(name)))
+
+    def _append(self, values):
+        row = len(self)
+        for field, value in zip(FIELDS, values):
+            self.columns[field].append(value)
+            self._lookup[field].setdefault(value, []).append(row)
+
+    def query(self, **conditions):
+        """Select histograms by field.
+
+        Each condition is either a value the field has to be equal to or a
+        callable returning True for accepted values.
+
+        Returns:
+            list: dicts with all fields of the selected histograms, in key order
+        """
+        unknown = set(conditions) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields {unknown}, available are {FIELDS}")
+        rows = None
+        predicates = {}
+        for field, condition in conditions.items():
+            if callable(condition):
+                predicates[field] = condition
+                continue
+            _rows = set(self._lookup[field].get(condition, ()))
+            rows = _rows if rows is None else rows & _rows
+        rows = range(len(self)) if rows is None else sorted(rows)
+        return [
+            {field: self.columns[field][row] for field in FIELDS}
+            for row in rows
+            if all(predicate(self.columns[field][row]) for field, predicate in predicates.items())
+        ]
+
+    def unique(self, field, **conditions):
+        """Return the distinct values of a field among the selected histograms, in key order."""
+        if not conditions:
+            return list(self._lookup[field])
+        return list(dict.fromkeys(row[field] for row in self.query(**conditions)))
+
+    @staticmethod
+    def sidecar_path(rootfile_path):
+        return f"{rootfile_path}.index.json"
+
+    @staticmethod
+    def _file_stamp(rootfile_path):
+        stat = os.stat(rootfile_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def save(self, rootfile_path):
+        """Write the index next to the given ROOT file, stamped with the current file size and mtime."""
+        with open(self.sidecar_path(rootfile_path), "w") as f:
+            json.dump({"source": self._file_stamp(rootfile_path), "columns": self.columns}, f)
+
+    @classmethod
+    def load(cls, rootfile_path):
+        """Load the sidecar index of the given ROOT file, if it exists and the file is unchanged.
+
+        Returns:
+            HistogramIndex or None: the index or None if no valid sidecar is available
+        """
+        path = cls.sidecar_path(rootfile_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable histogram index {path}: {e}")
+            return None
+        if content.get("source") != cls._file_stamp(rootfile_path) or "columns" not in content:
+            logger.info(f"Histogram index {path} is outdated and will be rebuilt.")
+            return None
+        index = cls()
+        for values in zip(*(content["columns"][field] for field in FIELDS)):
+            index._append(values)
+        return index
+
+    @classmethod
+    def from_rootfile(cls, rootfile, rootfile_path=None):
+        """Load the sidecar index or build it from a single pass over the keys of an open TFile."""
+        if rootfile_path is not None:
+            index = cls.load(rootfile_path)
+            if index is not None:
+                logger.info(f"Loaded index of {len(index)} histograms from {cls.sidecar_path(rootfile_path)}")
+                return index
+        index = cls(key.GetName() for key in rootfile.GetListOfKeys())
+        logger.info(f"Built index of {len(index)} histograms")
+        return index
@@ -0,0 +1,123 @@
+"""
+Parametrized shifts of the input quantities, i.e. the tau energy scale scans.
+
+Each point of a scan reads the quantities affected by the shift from the
+branches '<quantity>__<shiftstring>_<point>'. Instead of deep copying and
+rewriting all selections, actions and variations for every point, every
+expression is compiled once into a template in which the affected quantities
+are followed by a placeholder for the shift. Instantiating a point only creates
+new objects for expressions that actually depend on the shift, all other
+selections, cuts, weights and actions are shared between the points.
+"""
+import logging
+import re
+from copy import copy
+from functools import lru_cache
+
+from ntuple_processor.variations import (
+    get_quantities_from_expression,
+    ReplaceCut,
+    ReplaceWeight,
+    ReplaceCutAndAddWeight,
+)
+
+from config.logging_setup_configs import setup_logging
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+
+def shift_label(value):
+    """Label of a scan point used in dataset and shift names, e.g. -0.3 -> 'minus0p3'."""
+    return str(round(value, 2)).replace("-", "minus").replace(".", "p")
+
+
+@lru_cache(maxsize=None)
+def _template(expression, quantities):
+    found = quantities & get_quantities_from_expression(expression)
+    if not found:
+        return None
+    pattern = re.compile(r"\b(" + "|".join(re.escape(quant) for quant in sorted(found)) + r")\b")
+    return pattern.sub(r"\1__{shift}", expression.replace("{", "{{").replace("}", "}}"))
+
+
+class ParametrizedShift:
+    """
+    Instantiates selections, actions and variations for one point of a shift scan.
+
+    Args:
+        shiftname (str): name of the shift point, e.g. 'EMBtauESshift_0p1'
+        quantities (iterable): quantities with a shifted version for this point
+    """
+
+    def __init__(self, shiftname, quantities):
+        self.shiftname = shiftname
+        self.quantities = frozenset(quantities)
+
+    @classmethod
+    def from_dataset(cls, dataset, shiftname):
+        """Shift of the given point with the quantities known to the dataset, None if the shift is unknown."""
+        if shiftname not in dataset.quantities_per_vars:
+            logger.critical(f"{shiftname} not in list_of_quants.keys()")
+            return None
+        return cls(shiftname, dataset.quantities_per_vars[shiftname])
+
+    def expression(self, expression):
+        template = _template(expression, self.quantities)
+        if template is None:
+            return expression
+        shifted = template.format(shift=self.shiftname)
+        logger.debug(f"Replaced {expression} with {shifted} (var: {self.shiftname})")
+        return shifted
+
+    def _with_expression(self, obj, attr="expression"):
+        # Shallow copy only if the expression changes, otherwise the object is shared.
+        expression = getattr(obj, attr)
+        shifted = self.expression(expression)
+        if shifted == expression:
+            return obj
+        obj = copy(obj)
+        setattr(obj, attr, shifted)
+        return obj
+
+    def selection(self, selection):
+        cuts = [self._with_expression(cut) for cut in selection.cuts]
+        weights = [self._with_expression(weight) for weight in selection.weights]
+        if all(a is b for a, b in zip(cuts + weights, selection.cuts + selection.weights)):
+            return selection
+        selection = copy(selection)
+        selection.cuts, selection.weights = cuts, weights
+        return selection
+
+    def selections(self, selections):
+        return [self.selection(selection) for selection in selections]
+
+    def actions(self, actions):
+        return [self._with_expression(action, "variable") for action in actions]
+
+    def variation(self, variation):
+        if isinstance(variation, ReplaceCut):
+            cut = self._with_expression(variation.cut)
+            if cut is not variation.cut:
+                variation = copy(variation)
+                variation.cut = cut
+        elif isinstance(variation, ReplaceWeight):
+            weight = self._with_expression(variation.weight)
+            if weight is not variation.weight:
+                variation = copy(variation)
+                variation.weight = weight
+        elif isinstance(variation, ReplaceCutAndAddWeight):
+            replace_cut = copy(variation.replace_cut)
+            replace_cut.cut = self._with_expression(variation.replace_cut.cut)
+            add_weight = copy(variation.add_weight)
+            add_weight.weight = self._with_expression(variation.add_weight.weight)
+            if replace_cut.cut is not variation.replace_cut.cut or add_weight.weight is not variation.add_weight.weight:
+                variation = copy(variation)
+                variation.replace_cut, variation.add_weight = replace_cut, add_weight
+        return variation
+
+    def variations(self, variations):
+        """Instantiate a list of variations, nested lists of variations are flattened."""
+        variationlist = []
+        for variation in variations:
+            variationlist.extend(variation if isinstance(variation, list) else [variation])
+        return [self.variation(variation) for variation in variationlist]
@@ -2,7 +2,6 @@
 import argparse
 import logging
 import os
-import pickle
 from functools import partial
 from itertools import combinations
 
@@ -11,9 +10,11 @@ import yaml
 import config.shapes.process_selection as selection
 import config.shapes.variations as variations
 import shapes.utils as shape_utils
+from shapes.graph_cache import GraphCache, build_graphs
 import config.ntuple_processor_config_helper as ntuple_processor_config_helper
 from config.helper_collection import PreserveROOTPathsAsStrings
 from config.logging_setup_configs import setup_logging
+from config.telemetry import StageTelemetry, count_events_enabled, graph_entries
 from config.shapes.category_selection import categorization as default_categorization
 from config.shapes.channel_selection import channel_selection
 from config.shapes.control_binning import control_binning as default_control_binning
@@ -21,6 +22,7 @@ from config.shapes.file_names import files
 from config.shapes.gof_binning import load_gof_binning
 from ntuple_processor import GraphManager, RunManager, UnitManager
 from ntuple_processor.utils import Selection
+from submit.graph_store import write_graph_store
 
 
 def parse_arguments():
@@ -154,6 +156,12 @@ def parse_arguments():
         type=str,
         help="Directory the graph file is written to.",
     )
+    parser.add_argument(
+        "--graph-cache-dir",
+        default=None,
+        type=str,
+        help="Directory of the on-disk cache of optimized graphs. Unchanged graphs are loaded instead of rebuilt.",
+    )
     parser.add_argument(
         "--collect-config-only",
         action="store_true",
@@ -225,11 +233,13 @@ def get_select_function(
     selection_kwargs: dict,
     selection_memo: dict,
 ) -> callable:
+    channel_selection = shape_utils.canonical_selection(channel_selection)
+
     def _function(*args):
         _selection = [channel_selection]
         for _process in args:
             if _process.__name__ not in selection_memo:
-                selection_memo[_process.__name__] = _process(**selection_kwargs)
+                selection_memo[_process.__name__] = shape_utils.canonical_selection(_process(**selection_kwargs))
             _selection.append(selection_memo[_process.__name__])
         return _selection
 
@@ -389,7 +399,8 @@ def collect_config(
     logger.info("Due to a bug in ROOT/xrd the script won't exit properly. Please kill it manually. (i.e. Ctrl+z && kill %1)")
 
 
-def main(args):
+def main(args, telemetry):
+    telemetry.start_phase("booking")
     # Parse given arguments.
     friend_directories = {
         "et": args.et_friend_directory,
@@ -520,7 +531,12 @@ def main(args):
     logger.info(f"True tau bkg processes: {trueTauBkgS}")
     logger.info(f"signals: {signalsS}")
 
+    bookings = {channel: [] for channel in args.channels}
+
     def _book(processes, variations):  # helper wrapper
+        if args.graph_cache_dir is not None:  # booking is deferred until the cache was checked
+            bookings[channel].append((set(processes), list(variations)))
+            return
         shape_utils.book_histograms(
             processes=processes,
             variations=variations,
@@ -600,10 +616,30 @@ def main(args):
             if "2018" in args.era:
                 _book(simulatedProcsDS[channel], [variations.jet_es_hem])
 
+    logger.info(f"Variation resolution: {variations.resolution_stats()}")
+
     # Step 2: convert units to graphs and merge them
-    g_manager = GraphManager(unit_manager.booked_units, True)
-    g_manager.optimize(args.optimization_level)
-    graphs = g_manager.graphs
+    telemetry.start_phase("optimization")
+    if args.graph_cache_dir is not None:
+        cache = GraphCache(args.graph_cache_dir, args.optimization_level)
+        graphs = []
+        for channel in args.channels:
+            graphs.extend(
+                build_graphs(
+                    channel=channel,
+                    units=nominals[args.era]["units"][channel],
+                    bookings=bookings[channel],
+                    cache=cache,
+                    enable_check=args.enable_booking_check,
+                    telemetry=telemetry,
+                )
+            )
+        logger.info(f"Graph cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+    else:
+        g_manager = GraphManager(unit_manager.booked_units, True)
+        g_manager.optimize(args.optimization_level)
+        graphs = g_manager.graphs
+    telemetry.count("graphs", len(graphs))
     for graph in graphs:
         print(f"{graph}")
 
@@ -630,11 +666,16 @@ def main(args):
         else:
             graph_file = graph_file_name
         logger.info(f"Writing created graphs to file {graph_file}")
-        with open(graph_file, "wb") as file:
-            pickle.dump(graphs, file)
+        telemetry.start_phase("writing")
+        write_graph_store(graph_file, graphs)
     else:
+        # the histograms are written by the RunManager at the end of the event loop
+        telemetry.start_phase("event_loop")
         r_manager = RunManager(graphs)
         r_manager.run_locally(output_file, args.num_processes, args.num_threads)
+        if count_events_enabled():
+            telemetry.start_phase("counting_events")
+            telemetry.count("events", graph_entries(graphs))
 
 
 if __name__ == "__main__":
@@ -645,4 +686,13 @@ if __name__ == "__main__":
         log_file = f"{args.output_file}.log"
     logger = setup_logging(logger=logging.getLogger(__name__))
     variations.set_ff_type(args.ff_type)
-    main(args)
+    with StageTelemetry(
+        "produce_shapes",
+        era=args.era,
+        channels=args.channels,
+        only_create_graphs=args.only_create_graphs,
+        skip_systematic_variations=args.skip_systematic_variations,
+        num_processes=args.num_processes,
+        num_threads=args.num_threads,
+    ) as telemetry:
+        main(args, telemetry)
@@ -2,7 +2,6 @@
 import argparse
 import logging
 import os
-import pickle
 import re
 import yaml
 from itertools import combinations
@@ -25,6 +24,7 @@ from ntuple_processor import (
     RunManager,
 )
 from ntuple_processor.utils import Selection
+from submit.graph_store import write_graph_store
 
 from config.shapes.channel_selection import channel_selection
 from config.shapes.file_names import files
@@ -56,14 +56,7 @@ from config.shapes.process_selection import (
     ttH_process_selection,
 )
 
-# from config.shapes.category_selection import categorization
-from config.shapes.category_selection import categorization as default_categorization
-from config.shapes.tauid_measurement_binning import (
-    categorization as tauid_categorization,
-)
-from config.shapes.taues_measurement_binning import (
-    categorization as taues_categorization,
-)
+from config.shapes.measurements import MEASUREMENTS, get_measurement
 
 # Variations for estimation of fake processes
 from config.shapes.variations import (
@@ -191,9 +184,9 @@ def setup_logging(output_file, level=logging.DEBUG):
     logger.addHandler(file_handler)
 
 
-def parse_arguments():
+def parse_arguments(default_special_analysis=None):
     parser = argparse.ArgumentParser(
-        description="Produce shapes for the legacy MSSM analysis."
+        description="Produce shapes for the tau ID, tau ES and electron ES measurements."
     )
     parser.add_argument("--era", required=True, type=str, help="Experiment era.")
     parser.add_argument(
@@ -330,8 +323,8 @@ def parse_arguments():
     parser.add_argument(
         "--special-analysis",
         help="Can be set to a special analysis name to only run that analysis.",
-        choices=["TauID", "TauES"],
-        default=None,
+        choices=["TauID", "TauES", "EleES"],
+        default=default_special_analysis,
     )
     parser.add_argument(
         "--xrootd",
@@ -347,13 +340,13 @@ def parse_arguments():
     parser.add_argument(
         "--es",
         action="store_true",
-        help="Add tau ES variations.",
+        help="Add the tau ES scan to the TauID measurement.",
     )
     return parser.parse_args()
 
 
 def get_analysis_units(
-    channel, era, datasets, categorization, special_analysis, apply_tauid, vs_jet_wp, vs_ele_wp, nn_shapes=False, 
+    channel, era, datasets, categorization, special_analysis, apply_tauid, vs_jet_wp, vs_ele_wp, nn_shapes=False, signals=(),
 ):
     analysis_units = {}
 
@@ -525,6 +518,32 @@ def get_analysis_units(
             categorization=categorization,
             channel=channel,
         )
+    if channel not in ["mm", "ee"]:
+        # SM Higgs signals, only created if they are booked since the ggH and qqH
+        # selections need the STXS stitching weights
+        for name, dataset, process_selection in [
+            ("ggh", "ggH", ggH125_process_selection),
+            ("qqh", "qqH", qqH125_process_selection),
+            ("wh", "WH", WH_process_selection),
+            ("zh", "ZH", ZH_process_selection),
+            ("tth", "ttH", ttH_process_selection),
+        ]:
+            if name not in signals:
+                continue
+            if dataset not in datasets:
+                # not all eras provide all signal samples
+                continue
+            add_process(
+                analysis_units,
+                name=name,
+                dataset=datasets[dataset],
+                selections=[
+                    channel_selection(channel, era, special_analysis,  vs_jet_wp, vs_ele_wp),
+                    process_selection(channel, era, vs_jet_wp, vs_ele_wp),
+                ],
+                categorization=categorization,
+                channel=channel,
+            )
     # "gghww"  : [Unit(
     #             datasets["ggHWW"], [
     #                 channel_selection(channel, era, special_analysis,  vs_jet_wp, vs_ele_wp),
@@ -820,18 +839,7 @@ def get_control_units(
     return control_units
 
 
-def prepare_special_analysis(special):
-    if special is None:
-        return default_categorization
-    elif special and special == "TauID":
-        return tauid_categorization
-    elif special and special == "TauES":
-        return taues_categorization
-    else:
-        raise ValueError("Unknown special analysis: {}".format(special))
-
-
-def main(args):
+def main(args, measurements=MEASUREMENTS):
     # Parse given arguments.
     friend_directories = {
         "et": args.et_friend_directory,
@@ -845,9 +853,10 @@ def main(args):
         output_file = args.output_file
     else:
         output_file = "{}.root".format(args.output_file)
-    # setup categories depending on the selected anayses
-    special_analysis = args.special_analysis
-    categorization = prepare_special_analysis(special_analysis)
+    # setup categories, scans and working points depending on the selected measurement
+    measurement = get_measurement(args.special_analysis, args.es, measurements)
+    special_analysis = measurement.special_analysis
+    categorization = measurement.categorization
     um = UnitManager()
     do_check = args.enable_booking_check
     era = args.era
@@ -855,6 +864,55 @@ def main(args):
     print("#### Apply tau ID", apply_tauid)
     vs_jet_wp = args.vs_jet_wp
     vs_ele_wp = args.vs_ele_wp
+    # The tau systematics are not booked with --es, as before the measurements were unified.
+    book_tau_systematics = measurement.book_tau_systematics and not args.es
+    # Processes of the scan points per scan
+    scan_processes = {scan.shiftstring: set() for scan in measurement.scans}
+
+    if args.process_selection is None:
+        procS = {
+            "data",
+            "emb",
+            "ztt",
+            "zl",
+            "zj",
+            "ztt_nlo",
+            "zl_nlo",
+            "zj_nlo",
+            "ttt",
+            "ttl",
+            "ttj",
+            "vvt",
+            "vvl",
+            "vvj",
+            "w",
+            "w_nlo",
+        } | measurement.additional_processes
+        # if "et" in args.channels:
+        #     procS = procS - {"w"}
+        # procS = {"data", "emb", "ztt", "zl", "zj", "ttt", "ttl", "ttj", "vvt", "vvl", "vvj", "w",
+        #          "ggh", "qqh", "tth", "zh", "wh", "gghww", "qqhww", "zhww", "whww"} \
+        #         | set("ggh{}".format(mass) for mass in susy_masses[era]["ggH"]) \
+        #         | set("bbh{}".format(mass) for mass in susy_masses[era]["bbH"])
+    else:
+        procS = args.process_selection
+    if any(channel in measurement.processes for channel in args.channels):
+        # fixed selection of the measurement, an explicit --process-selection is used as given
+        if args.process_selection is None:
+            procS = set().union(
+                *(measurement.processes[channel] for channel in args.channels if channel in measurement.processes)
+            )
+    elif "mm" in args.channels or "ee" in args.channels:
+        procS = {
+            "data",
+            "zl",
+            "zl_nlo",
+            "ttl",
+            "vvl",
+            "w",
+            # "w_nlo",
+            "emb",
+        } & procS
 
     nominals = {}
     nominals[era] = {}
@@ -902,30 +960,9 @@ def main(args):
                 apply_tauid,
                 vs_jet_wp,
                 vs_ele_wp,
+                signals=procS,
             )
-        if special_analysis == "TauES":
-            additional_emb_procS = set()
-            tauESvariations = [-2.5 + 0.1 * i for i in range(0, 51)]
-            add_tauES_datasets(
-                era,
-                channel,
-                friend_directories,
-                files,
-                args.directory,
-                nominals,
-                tauESvariations,
-                [
-                    channel_selection(channel, era, special_analysis,  vs_jet_wp, vs_ele_wp),
-                    ZTT_embedded_process_selection(channel, era, apply_tauid, vs_jet_wp),
-                ],
-                categorization,
-                additional_emb_procS,
-                xrootd=args.xrootd,
-                validation_tag=args.validation_tag,
-            )
-        if special_analysis == "TauID" and args.es:
-            additional_emb_procS = set()
-            tauESvariations = [-4.0 + 0.1 * i for i in range(0, 81)]
+        for scan in measurement.scans_for(channel):
             add_tauES_datasets(
                 era,
                 channel,
@@ -933,56 +970,18 @@ def main(args):
                 files,
                 args.directory,
                 nominals,
-                tauESvariations,
+                scan.points,
                 [
                     channel_selection(channel, era, special_analysis,  vs_jet_wp, vs_ele_wp),
                     ZTT_embedded_process_selection(channel, era, apply_tauid, vs_jet_wp),
                 ],
                 categorization,
-                additional_emb_procS,
+                scan_processes[scan.shiftstring],
                 xrootd=args.xrootd,
                 validation_tag=args.validation_tag,
+                shiftstring=scan.shiftstring,
             )
 
-    if args.process_selection is None:
-        procS = {
-            "data",
-            "emb",
-            "ztt",
-            "zl",
-            "zj",
-            "ztt_nlo",
-            "zl_nlo",
-            "zj_nlo",
-            "ttt",
-            "ttl",
-            "ttj",
-            "vvt",
-            "vvl",
-            "vvj",
-            "w",
-            "w_nlo",
-        }
-        # if "et" in args.channels:
-        #     procS = procS - {"w"}
-        # procS = {"data", "emb", "ztt", "zl", "zj", "ttt", "ttl", "ttj", "vvt", "vvl", "vvj", "w",
-        #          "ggh", "qqh", "tth", "zh", "wh", "gghww", "qqhww", "zhww", "whww"} \
-        #         | set("ggh{}".format(mass) for mass in susy_masses[era]["ggH"]) \
-        #         | set("bbh{}".format(mass) for mass in susy_masses[era]["bbH"])
-    else:
-        procS = args.process_selection
-    if "mm" in args.channels or "ee" in args.channels:
-        procS = {
-            "data",
-            "zl",
-            "zl_nlo",
-            "ttl",
-            "vvl",
-            "w",
-            # "w_nlo",
-            "emb",
-        } & procS
-
     dataS = {"data"} & procS
     embS = {"emb"} & procS
     jetFakesDS = {
@@ -1027,39 +1026,17 @@ def main(args):
             datasets=nominals[era]["units"][channel],
             enable_check=do_check,
         )
-        if channel == "mt" and special_analysis == "TauES":
-            logger.info("Booking TauES")
-            book_tauES_histograms(
-                um,
-                additional_emb_procS,
-                nominals[era]["units"][channel],
-                [same_sign, anti_iso_lt],
-                do_check,
-            )
-        if channel == "mt" and args.es and special_analysis == "TauID":
-            logger.info("Booking TauES")
+        for scan in measurement.scans_for(channel):
+            logger.info(f"Booking {scan.shiftstring} scan")
             book_tauES_histograms(
                 um,
-                additional_emb_procS,
+                scan_processes[scan.shiftstring],
                 nominals[era]["units"][channel],
-                [same_sign, anti_iso_lt_no_ff],
+                list(scan.variations),
                 do_check,
+                shiftstring=scan.shiftstring,
             )
-            # book_tauES_histograms(
-            #     um,
-            #     additional_emb_procS,
-            #     nominals[era]["units"][channel],
-            #     [trigger_eff_mt_emb],
-            #     do_check,
-            # )
-            # book_histograms(
-            #     um,
-            #     additional_emb_procS,
-            #     datasets=nominals[era]["units"][channel],
-            #     variations=[trigger_eff_mt_emb],
-            #     enable_check=do_check,
-            # )
-        elif channel == "mt" and special_analysis != "TauID":
+        if channel == "mt" and special_analysis != "TauID":
             book_histograms(
                 um,
                 processes=embS,
@@ -1131,6 +1108,14 @@ def main(args):
                 variations=[same_sign_em],
                 enable_check=do_check,
             )
+        elif channel == "ee" and special_analysis == "EleES":
+            book_histograms(
+                um,
+                processes={"ttt", "vvl", "vvt", "data", "emb", "zl", "ttl", "ztt", "w"} & procS,
+                datasets=nominals[era]["units"][channel],
+                variations=[same_sign],
+                enable_check=do_check,
+            )
         elif channel == "mm" and special_analysis == "TauES":
             book_histograms(
                 um,
@@ -1171,7 +1156,21 @@ def main(args):
             # Book variations common to all channels.
             # um.book([unit for d in {"ggh"} & procS for unit in nominals[era]['units'][channel][d]], [*ggh_acceptance], enable_check=args.enable_booking_check)
             # um.book([unit for d in {"qqh"} & procS for unit in nominals[era]['units'][channel][d]], [*qqh_acceptance], enable_check=args.enable_booking_check)
-            # TODO add signal uncertainties
+            if measurement.signal_acceptance and channel not in ["mm", "ee"]:
+                book_histograms(
+                    um,
+                    processes={"ggh"} & procS,
+                    datasets=nominals[era]["units"][channel],
+                    variations=[ggh_acceptance],
+                    enable_check=do_check,
+                )
+                book_histograms(
+                    um,
+                    processes={"qqh"} & procS,
+                    datasets=nominals[era]["units"][channel],
+                    variations=[qqh_acceptance],
+                    enable_check=do_check,
+                )
             book_histograms(
                 um,
                 processes=simulatedProcsDS[channel],
@@ -1218,7 +1217,7 @@ def main(args):
             )
             # Book variations common to multiple channels.
             if channel in ["et", "mt", "tt"]:
-                if not args.es and special_analysis != "TauID":
+                if book_tau_systematics:
                     book_histograms(
                         um,
                         processes=(trueTauBkgS | leptonFakesS | signalsS) - {"zl"},
@@ -1257,7 +1256,7 @@ def main(args):
                     enable_check=do_check,
                 )
             if channel in ["et", "mt"]:
-                if not args.es and special_analysis != "TauID":
+                if book_tau_systematics:
                     book_histograms(
                         um,
                         processes=(trueTauBkgS | leptonFakesS | signalsS) - {"zl"},
@@ -1471,8 +1470,7 @@ def main(args):
         else:
             graph_file = graph_file_name
         logger.info("Writing created graphs to file %s.", graph_file)
-        with open(graph_file, "wb") as f:
-            pickle.dump(graphs, f)
+        write_graph_store(graph_file, graphs)
     else:
         # Step 3: convert to RDataFrame and run the event loop
         r_manager = RunManager(graphs)
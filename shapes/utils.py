@@ -1,17 +1,13 @@
 from ntuple_processor import dataset_from_crownoutput, Unit
-from ntuple_processor.variations import (
-    get_quantities_from_expression,
-    ReplaceCut,
-    ReplaceWeight,
-    ReplaceCutAndAddWeight,
-    ReplaceVariable,
-)
+from ntuple_processor.utils import Selection
 import re
-from copy import deepcopy
+from copy import copy
 import logging
 import itertools
 
 from config.logging_setup_configs import setup_logging
+from config.shapes.expressions import canonical
+from shapes.parametrized_shift import ParametrizedShift, shift_label
 
 logger = setup_logging(logger=logging.getLogger(__name__))
 
@@ -29,6 +25,18 @@ logger = setup_logging(logger=logging.getLogger(__name__))
 #     analysis_unit[name] = unitlist
 
 
+def canonical_selection(selection):
+    """
+    Copy of a selection with canonical cut and weight expressions. Equal expressions of
+    different processes become identical strings, which RDataFrame compiles only once.
+    """
+    return Selection(
+        name=selection.name,
+        cuts=[(canonical(cut.expression), cut.name) for cut in selection.cuts],
+        weights=[(canonical(weight.expression), weight.name) for weight in selection.weights],
+    )
+
+
 def add_process(
     analysis_unit,
     name,
@@ -177,80 +185,42 @@ def add_tauES_datasets(
     xrootd=False,
     shiftstring="EMBtauESshift",
 ):
+    # The embedded dataset is read once, the shift points only differ in name.
+    base_dataset = dataset_from_crownoutput(
+        "emb",
+        files[era][channel]["EMB"],
+        era,
+        channel,
+        channel + "_nominal",
+        directory,
+        [
+            fdir
+            for fdir in friend_directories[channel]
+            if filter_friends("EMB", fdir)
+        ],
+        validate_samples=False,
+        validation_tag=validation_tag,
+        xrootd=xrootd,
+    )
     for variation in tauESvariations:
-        name = str(round(variation, 2)).replace("-", "minus").replace(".", "p")
+        name = shift_label(variation)
         processname = f"emb{name}"
         logger.info(f"Adding {processname}")
-        dataset = dataset_from_crownoutput(
-            processname,
-            files[era][channel]["EMB"],
-            era,
-            channel,
-            channel + "_nominal",
-            directory,
-            [
-                fdir
-                for fdir in friend_directories[channel]
-                if filter_friends("EMB", fdir)
-            ],
-            validate_samples=False,
-            validation_tag=validation_tag,
-            xrootd=xrootd,
-        )
+        dataset = copy(base_dataset)
+        dataset.name = processname
         nominals[era]["datasets"][channel][processname] = dataset
-        updated_unit = []
-        additional_emb_procS.add(f"emb{name}")
-        shiftname = f"{shiftstring}_{name}"
-        for category_selection, actions in categorization[channel]:
-            full_selection = selections + [category_selection]
-            new_selections = deepcopy(full_selection)
-            new_actions = deepcopy(actions)
-            list_of_quants = dataset.quantities_per_vars
-            quants = set(list_of_quants[shiftname])
-            if shiftname not in list_of_quants.keys():
-                logger.critical(f"{shiftname} not in list_of_quants.keys()")
-            else:
-                # for quant in :
-                for sel_obj in new_selections:
-                    for cut in sel_obj.cuts:
-                        # now find the intersection between quants and the expression set
-                        for quant in quants & get_quantities_from_expression(
-                            cut.expression
-                        ):
-                            # cut.expression = cut.expression.replace(
-                            #     quant,
-                            #     "{quant}__{var}".format(quant=quant, var=shiftname),
-                            # )
-                            cut.expression = re.sub(
-                                rf"\b({quant})\b",
-                                f"{quant}__{shiftname}",
-                                cut.expression,
-                        )
-                            logger.debug(
-                                f"Replaced {quant} in {cut.expression} ( quant: {quant}, var: {shiftname})"
-                            )
-                    for weight in sel_obj.weights:
-                        for quant in quants & get_quantities_from_expression(
-                            weight.expression
-                        ):
-                            weight.expression = weight.expression.replace(
-                                quant,
-                                "{quant}__{var}".format(quant=quant, var=shiftname),
-                            )
-                            logger.debug(
-                                f"Replaced weight {quant} with {weight.expression} ( quant: {quant}, var: {shiftname})"
-                            )
-                for act in new_actions:
-                    for quant in quants & get_quantities_from_expression(act.variable):
-                        act.variable = act.variable.replace(
-                            quant,
-                            "{quant}__{var}".format(quant=act.variable, var=shiftname),
-                        )
-                        logger.debug(
-                            f"Replaced action {quant} with {act.variable} ( quant: {quant}, var: {shiftname})"
-                        )
-                updated_unit.append(Unit(dataset, new_selections, new_actions))
-            nominals[era]["units"][channel][processname] = updated_unit
+        additional_emb_procS.add(processname)
+        shift = ParametrizedShift.from_dataset(dataset, f"{shiftstring}_{name}")
+        if shift is None:
+            continue
+        nominals[era]["units"][channel][processname] = [
+            Unit(
+                dataset,
+                shift.selections(selections + [category_selection]),
+                shift.actions(actions),
+            )
+            for category_selection, actions in categorization[channel]
+        ]
 
 
 def book_tauES_histograms(
@@ -261,66 +231,18 @@ def book_tauES_histograms(
     enable_check=False,
     shiftstring="EMBtauESshift",
 ):
-    # def replace_expression(exp, quants):
-    #     for quant in quants[shiftname]:
-    #         if quant in exp:
-    #             exp = exp.replace(
-    #                 quant,
-    #                 "{quant}__{var}".format(quant=quant, var=shiftname),
-    #             )
-    #             logger.debug(
-    #                 f"Replaced {quant} in {exp} ( quant: {quant}, var: {shiftname}"
-    #             )
-    #     return exp
-    
-    def replace_expression(exp, quants):
-        quant_string = set(quants[shiftname])
-        for quant in quant_string & get_quantities_from_expression(exp):
-                exp = re.sub(
-                rf"\b({exp})\b",
-                f"{quant}__{shiftname}",
-                exp
-                )
-                logger.debug(
-                    f"Replaced {quant} in {exp} ( quant: {quant}, var: {shiftname}"
-                )
-        return exp
     for tau_es_shift in additional_emb_procS:
         logger.debug(f"Booking {tau_es_shift}")
-        shiftname = f"{shiftstring}_{tau_es_shift.replace('emb', '')}"
-        updated_variations = deepcopy(variations)
-        final_variations = []
-        unitlist = datasets[tau_es_shift]
+        unitlist = datasets.get(tau_es_shift, [])
         if len(unitlist) == 0:
             continue
-        quants = unitlist[0].dataset.quantities_per_vars
-        for variation in updated_variations:
-            if isinstance(variation, list):
-                variationlist = variation
-            else:
-                variationlist = [variation]
-            for subvariation in variationlist:
-                if isinstance(subvariation, ReplaceCut):
-                    subvariation.cut.expression = replace_expression(
-                        subvariation.cut.expression, quants
-                    )
-                elif isinstance(subvariation, ReplaceWeight):
-                    subvariation.weight.expression = replace_expression(
-                        subvariation.weight.expression, quants
-                    )
-                elif isinstance(subvariation, ReplaceCutAndAddWeight):
-                    subvariation.replace_cut.cut.expression = replace_expression(
-                        subvariation.replace_cut.cut.expression, quants
-                    )
-                    subvariation.add_weight.weight.expression = replace_expression(
-                        subvariation.add_weight.weight.expression, quants
-                    )
-                else:
-                    # logger.critical(f"Unknown variation {subvariation}")
-                    # raise ValueError(f"Unknown variation {subvariation}")
-                    pass
-                final_variations.append(subvariation)
-        logger.warning(f"final_variations: {final_variations}")
+        shift = ParametrizedShift.from_dataset(
+            unitlist[0].dataset, f"{shiftstring}_{tau_es_shift.replace('emb', '')}"
+        )
+        if shift is None:
+            continue
+        final_variations = shift.variations(variations)
+        logger.debug(f"final_variations: {final_variations}")
         manager.book(
             unitlist,
             final_variations,
@@ -2,7 +2,8 @@
 
 import os
 import argparse
-import pickle
+
+from submit.graph_store import count_graphs, parse_graph_number
 
 
 def parse_args():
@@ -24,37 +25,29 @@ def parse_args():
     return parser.parse_args()
 
 
-def calculate_range(range_str):
-    ran = list(map(int, range_str.split("_")))
-    ran[-1] += 1
-    return ran
+def covered_graphs(output_dir):
+    """Indices of the graphs covered by the output files in the given directory."""
+    # Packed jobs cover ranges 'N_M' or several of them joined by '+'.
+    output_nums = []
+    for fi in os.listdir(output_dir):
+        if fi.endswith(".root"):
+            output_nums.extend(parse_graph_number(fi.split("-")[-1].split(".root")[0]))
+    return output_nums
+
+
+def missing_outputs(graph_file, output_dir):
+    """Sorted indices of the graphs of the graph file without output file in the output directory."""
+    output_nums = covered_graphs(output_dir) if os.path.isdir(output_dir) else []
+    return sorted(set(range(count_graphs(graph_file))) - set(output_nums))
 
 
 def check_output_files(era, channel, process_string, control_arg):
-    out_graph_ranges = list(
-        fi.split("-")[-1].split(".root")[0]
-        for fi in os.listdir(
-            os.path.join(
-                "output/shapes",
-                "{}_unit_graphs-{}-{}-{}".format(
-                    control_arg, era, channel, process_string
-                ),
-            )
+    output_nums = covered_graphs(
+        os.path.join(
+            "output/shapes",
+            "{}_unit_graphs-{}-{}-{}".format(control_arg, era, channel, process_string),
         )
     )
-    out_nums = [
-        list(range(*calculate_range(out_graphs)))
-        if "_" in out_graphs
-        else int(out_graphs)
-        for out_graphs in out_graph_ranges
-    ]
-    # Flatten the ouput list
-    output_nums = []
-    for entry in out_nums:
-        if isinstance(entry, list):
-            output_nums.extend(entry)
-        else:
-            output_nums.append(entry)
     return len(output_nums), set(output_nums)
 
 
@@ -82,12 +75,12 @@ def main(args):
                 continue
             if ch not in ["et", "mt"] and proc == "bkg":
                 proc_splits.append("w")
-            # Read number of graphs that should have been processed from pickled graph list.
+            # Read number of graphs that should have been processed from the header of the graph file.
             c_arg = "control" if args.control else "analysis"
             for proc_str in proc_splits:
                 # Sort proc string for correct matching
                 proc_str = ",".join(sorted(proc_str.split(",")))
-                with open(
+                num_graphs = count_graphs(
                     os.path.join(
                         "output/submit_files",
                         "{}-{}-{}-{}-{}".format(
@@ -96,10 +89,8 @@ def main(args):
                         "{}_unit_graphs-{}-{}-{}.pkl".format(
                             c_arg, args.era, ch, proc_str
                         ),
-                    ),
-                    "rb",
-                ) as f:
-                    num_graphs = len(pickle.load(f))
+                    )
+                )
                 # Check number of output files.
                 num_outputs, output_nums = check_output_files(
                     args.era, ch, proc_str, c_arg
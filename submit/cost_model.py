@@ -0,0 +1,145 @@
+import glob
+import heapq
+import json
+import statistics
+
+# Seconds per cost unit used as long as no runtimes of previous jobs are available.
+DEFAULT_SECONDS_PER_UNIT = 0.05
+# Number of threads of the multicore jobs and the assumed parallel efficiency.
+MULTICORE_THREADS = 8
+MULTICORE_EFFICIENCY = 0.7
+
+
+def cost_units(metadata):
+    """Relative cost of a graph derived from its metadata.
+
+    The event loop scales with the number of input files (as proxy of the
+    number of events), every friend tree adds I/O and every booked histogram
+    and evaluated expression adds work per event.
+
+    Args:
+        metadata (dict): graph metadata as stored in the graph file
+
+    Returns:
+        float: cost in arbitrary units
+    """
+    n_ntuples = max(metadata.get("n_ntuples", 1), 1)
+    io_factor = 1.0 + 0.25 * metadata.get("n_friends", 0)
+    work = (
+        metadata.get("n_histograms", metadata.get("cost", 1))
+        + 0.5 * metadata.get("n_variations", 0)
+        + metadata.get("expression_length", 0) / 1000.0
+    )
+    return n_ntuples * io_factor * max(work, 1.0)
+
+
+def record_runtime(path, graph_file, graph_number, metadata, walltime, num_threads):
+    """Write the runtime of a finished job to a JSON file used to calibrate the cost model."""
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "graph_file": graph_file,
+                "graph_number": graph_number,
+                "graphs": metadata,
+                "walltime": walltime,
+                "num_threads": num_threads,
+            },
+            f,
+        )
+
+
+class CostModel:
+    """
+    Predicts the walltime of graphs from their metadata.
+
+    The conversion from cost units to seconds is calibrated per dataset (graph
+    name) from the recorded runtimes of previous single core jobs. Datasets
+    without history use the median over all recorded jobs.
+
+    Args:
+        seconds_per_unit (dict): dataset name -> seconds per cost unit
+        default (float): seconds per cost unit for unknown datasets
+    """
+
+    def __init__(self, seconds_per_unit=None, default=DEFAULT_SECONDS_PER_UNIT):
+        self.seconds_per_unit = seconds_per_unit or {}
+        self.default = default
+
+    @classmethod
+    def from_history(cls, patterns):
+        """Calibrate the model from runtime records matching the given glob patterns."""
+        ratios = {}
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                with open(path) as f:
+                    record = json.load(f)
+                if record.get("num_threads", 1) != 1 or not record.get("graphs"):
+                    continue
+                units = sum(cost_units(md) for md in record["graphs"])
+                for md in record["graphs"]:
+                    ratios.setdefault(md["name"], []).append(record["walltime"] / units)
+        if not ratios:
+            return cls()
+        return cls(
+            {name: statistics.median(values) for name, values in ratios.items()},
+            default=statistics.median(value for values in ratios.values() for value in values),
+        )
+
+    def predict(self, metadata, num_threads=1):
+        seconds = cost_units(metadata) * self.seconds_per_unit.get(metadata["name"], self.default)
+        if num_threads > 1:
+            seconds /= num_threads * MULTICORE_EFFICIENCY
+        return seconds
+
+
+def pack_jobs(metadata, model, target_walltime):
+    """Pack graphs into jobs balanced to a target walltime per slot.
+
+    Graphs that do not fit into a single core job on their own are run as
+    multicore jobs. All others are distributed with first-fit decreasing.
+
+    Args:
+        metadata (list): metadata of all graphs of the graph file
+        model (CostModel): model predicting the walltime per graph
+        target_walltime (float): target walltime per job in seconds
+
+    Returns:
+        tuple: (list of lists of graph indices for single core jobs, list of graph indices for multicore jobs)
+    """
+    predictions = [model.predict(md) for md in metadata]
+    multicore = [i for i, seconds in enumerate(predictions) if seconds > target_walltime]
+    remaining = sorted(
+        (i for i in range(len(metadata)) if predictions[i] <= target_walltime),
+        key=lambda i: (-predictions[i], i),
+    )
+    jobs, loads = [], []
+    for i in remaining:
+        for j, load in enumerate(loads):
+            if load + predictions[i] <= target_walltime:
+                jobs[j].append(i)
+                loads[j] += predictions[i]
+                break
+        else:
+            jobs.append([i])
+            loads.append(predictions[i])
+    return [sorted(job) for job in jobs], multicore
+
+
+def exceeding_walltime(metadata, model, indices, target_walltime, num_threads=1):
+    """Graphs predicted to exceed the target walltime even when run on the given number of threads.
+
+    A graph is the smallest unit of a job, such graphs can not be split any further.
+
+    Returns:
+        list: (graph index, predicted walltime in seconds) of the exceeding graphs
+    """
+    predictions = [(i, model.predict(metadata[i], num_threads=num_threads)) for i in indices]
+    return [(i, seconds) for i, seconds in predictions if seconds > target_walltime]
+
+
+def simulate_makespan(job_times, slots):
+    """Predicted makespan of jobs scheduled longest first onto the given number of slots."""
+    finish_times = [0.0] * slots
+    for seconds in sorted(job_times, reverse=True):
+        heapq.heapreplace(finish_times, finish_times[0] + seconds)
+    return max(finish_times)
@@ -0,0 +1,182 @@
+"""
+Random-access storage of the computational graphs created with --only-create-graphs.
+
+Layout of a graph file:
+    MAGIC | footer offset (8 bytes, little endian) | record 0 | record 1 | ... | footer
+
+Each record is a single pickled graph. The footer is a JSON document holding
+offset, size and metadata (name, channel, processes, number of histograms and
+variations, estimated cost) of every record. Jobs deserialize only the graphs
+they process and bookkeeping tools read only the footer. Files written as a
+plain pickled list of graphs are still readable.
+"""
+import json
+import pickle
+import struct
+
+from shapes.histogram_index import split_histogram_name
+
+MAGIC = b"GRAPHSTORE\x01\n"
+_OFFSET = struct.Struct("<Q")
+
+
+def _leaves(node):
+    children = getattr(node, "children", None) or []
+    if not children:
+        yield node
+        return
+    for child in children:
+        yield from _leaves(child)
+
+
+def _nodes(node):
+    yield node
+    for child in getattr(node, "children", None) or []:
+        yield from _nodes(child)
+
+
+def _expression_length(node):
+    # Cuts and weights are either attached to the node itself or to its unit block.
+    length = 0
+    for obj in (node, getattr(node, "unit_block", None)):
+        for attr in ("cuts", "weights"):
+            for item in getattr(obj, attr, None) or []:
+                length += len(str(getattr(item, "expression", "")))
+    return length
+
+
+def graph_metadata(graph):
+    """Collect the bookkeeping information of a single graph.
+
+    The channel, processes and variations are taken from the names of the
+    booked histograms (dataset#channel-process-category#variation#variable).
+
+    Args:
+        graph (Graph): ntuple_processor graph
+
+    Returns:
+        dict: metadata of the graph
+    """
+    channels, processes, variations = set(), set(), set()
+    n_histograms = 0
+    for leaf in _leaves(graph):
+        n_histograms += 1
+        name = str(getattr(leaf, "name", ""))
+        if name.count("#") != 3:
+            continue
+        _, _, channel, process, _, variation, _ = split_histogram_name(name)
+        channels.add(channel)
+        processes.add(process)
+        variations.add(variation)
+    nodes = list(_nodes(graph))
+    ntuples = getattr(getattr(graph, "unit_block", None), "ntuples", None) or []
+    return {
+        "name": graph.name,
+        "channel": ",".join(sorted(channels)),
+        "processes": sorted(processes),
+        "n_children": len(getattr(graph, "children", [])),
+        "n_histograms": n_histograms,
+        "n_nodes": len(nodes),
+        "expression_length": sum(_expression_length(node) for node in nodes),
+        "n_variations": len(variations),
+        "n_ntuples": len(ntuples),
+        "n_friends": len(ntuples[0].friends) if ntuples else 0,
+        # Number of booked histograms as a first, relative estimate of the runtime.
+        "cost": n_histograms,
+    }
+
+
+def write_graph_store(path, graphs):
+    """Write the graphs record by record, followed by the footer with offsets and metadata."""
+    records = []
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_OFFSET.pack(0))  # placeholder for the footer offset
+        for graph in graphs:
+            offset = f.tell()
+            pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+            records.append({"offset": offset, "size": f.tell() - offset, **graph_metadata(graph)})
+        footer_offset = f.tell()
+        f.write(json.dumps({"version": 1, "records": records}).encode("utf-8"))
+        f.seek(len(MAGIC))
+        f.write(_OFFSET.pack(footer_offset))
+
+
+class GraphStore:
+    """
+    Read access to a graph file written by write_graph_store or as a plain pickled list.
+
+    Args:
+        path (str): path of the graph file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._graphs = None  # only used for legacy files
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) == MAGIC:
+                (footer_offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+                f.seek(footer_offset)
+                self.records = json.loads(f.read().decode("utf-8"))["records"]
+            else:
+                f.seek(0)
+                self._graphs = pickle.load(f)
+                self.records = [graph_metadata(graph) for graph in self._graphs]
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def metadata(self):
+        return [{k: v for k, v in record.items() if k not in ("offset", "size")} for record in self.records]
+
+    def load(self, index):
+        if self._graphs is not None:
+            return self._graphs[index]
+        record = self.records[index]
+        with open(self.path, "rb") as f:
+            f.seek(record["offset"])
+            return pickle.loads(f.read(record["size"]))
+
+    def load_range(self, first, last):
+        """Load the graphs with indices first to last, both included."""
+        return [self.load(index) for index in range(first, last + 1)]
+
+    def select(self, graph_number):
+        """Load the graphs for a job argument, see parse_graph_number."""
+        return [self.load(index) for index in parse_graph_number(graph_number)]
+
+
+def parse_graph_number(graph_number):
+    """Indices of the graphs of a job argument.
+
+    The argument is a single index 'N', a range 'N-M' (both included) or several
+    of them joined by '+', i.e. '3+7+12-14'. In output file names '-' is replaced
+    by '_', which is accepted as well.
+    """
+    indices = []
+    for part in graph_number.replace("_", "-").split("+"):
+        if "-" in part:
+            first, last = map(int, part.split("-"))
+            indices.extend(range(first, last + 1))
+        else:
+            indices.append(int(part))
+    return indices
+
+
+def format_graph_number(indices):
+    """Inverse of parse_graph_number, contiguous indices are joined to ranges."""
+    parts, indices = [], sorted(indices)
+    start = previous = indices[0]
+    for index in indices[1:] + [None]:
+        if index is not None and index == previous + 1:
+            previous = index
+            continue
+        parts.append(str(start) if start == previous else f"{start}-{previous}")
+        start = previous = index
+    return "+".join(parts)
+
+
+def count_graphs(path):
+    """Number of graphs in a graph file, without deserializing any graph for new-style files."""
+    return len(GraphStore(path))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Incremental merging of the per-graph outputs of the shape production jobs.
+
+The input files are merged in a tree of at most --fan-in files per merge. A node
+holding more than --fan-in files splits them into --fan-in buckets by the hash of
+their names, one digit of the hash per depth of the tree, and merges the partial
+files of the buckets. The bucket of a file therefore does not depend on the other
+files, and adding or removing an output only changes the nodes on its own path.
+Input files are identified by the hash of their content and every partial merge
+by the hash of the hashes of its inputs. Partial merges are kept in a state
+directory next to the output file, so when some jobs are resubmitted only the
+partial merges on the path from the changed outputs to the final file are redone.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from config.logging_setup_configs import setup_logging
+from submit.check_outputs import missing_outputs
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+STATE_FILE = "state.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o", "--output", required=True, help="Merged output root file."
+    )
+    parser.add_argument(
+        "-i",
+        "--inputs",
+        nargs="+",
+        required=True,
+        help="Root files or directories whose root files are merged.",
+    )
+    parser.add_argument(
+        "--check",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("OUTPUT_DIR", "GRAPH_FILE"),
+        help="Check that the job outputs in OUTPUT_DIR cover all graphs of GRAPH_FILE before merging. "
+        "Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--allow-missing",
+        action="store_true",
+        help="Merge the available outputs even if outputs are missing.",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=None,
+        help="Directory holding the partial merges, defaults to <output>.merge.",
+    )
+    parser.add_argument(
+        "-n", "--fan-in", type=int, default=100, help="Maximal number of files merged at once."
+    )
+    parser.add_argument(
+        "-j", "--num-processes", type=int, default=5, help="Number of merges run in parallel."
+    )
+    return parser.parse_args()
+
+
+def collect_inputs(inputs):
+    files = []
+    for inp in inputs:
+        if os.path.isdir(inp):
+            files.extend(os.path.join(inp, fi) for fi in os.listdir(inp) if fi.endswith(".root"))
+        else:
+            files.append(inp)
+    return sorted(set(files))
+
+
+def file_hash(path, cache):
+    """Content hash of a file. Hashes are reused from the cache as long as size and mtime are unchanged."""
+    stat = os.stat(path)
+    entry = cache.get(path)
+    if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry["hash"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    cache[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": digest.hexdigest()}
+    return cache[path]["hash"]
+
+
+def bucket(name, depth, fan_in):
+    """Bucket of a file at a depth of the merge tree, the depth-th digit in base fan_in of the hash of its name."""
+    digest = int(hashlib.sha256(name.encode("utf-8")).hexdigest(), 16)
+    return digest // fan_in**depth % fan_in
+
+
+def build_tree(names, hashes, fan_in):
+    """Plan the merge tree.
+
+    Args:
+        names (list): paths of the sorted input files
+        hashes (list): content hashes of the input files
+        fan_in (int): maximal number of files per merge, at least two
+
+    Returns:
+        list: nodes of the tree as (key, height, children) tuples, children before their
+            parents and the root last. The children are ("input", index of the input file) or
+            ("node", index of the node) tuples, the height is the length of the longest path
+            to an input file minus one.
+    """
+    nodes = []
+
+    def _node(items, depth):
+        if len(items) <= fan_in:
+            children = [("input", i) for i in items]
+        else:
+            buckets = {}
+            for i in items:
+                buckets.setdefault(bucket(names[i], depth, fan_in), []).append(i)
+            if len(buckets) == 1:
+                return _node(items, depth + 1)
+            # single files of a bucket are merged directly
+            children = [
+                ("input", group[0]) if len(group) == 1 else ("node", _node(group, depth + 1))
+                for _, group in sorted(buckets.items())
+            ]
+        keys = [hashes[index] if kind == "input" else nodes[index][0] for kind, index in children]
+        key = hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
+        height = max([nodes[index][1] + 1 for kind, index in children if kind == "node"], default=0)
+        nodes.append((key, height, children))
+        return len(nodes) - 1
+
+    _node(list(range(len(names))), 0)
+    return nodes
+
+
+def hadd(target, sources):
+    # Write to a temporary file first, so that an interrupted merge never leaves a valid looking partial file.
+    tmp_target = f"{target}.tmp.root"
+    result = subprocess.run(
+        ["hadd", "-f", tmp_target, *sources], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    if result.returncode != 0:
+        logger.error(result.stdout)
+        raise RuntimeError(f"hadd failed for {target}")
+    os.replace(tmp_target, target)
+    return target
+
+
+def merge_tree(files, output, state_dir, fan_in, num_processes):
+    os.makedirs(state_dir, exist_ok=True)
+    state_path = os.path.join(state_dir, STATE_FILE)
+    state = {"inputs": {}, "tree": []}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    cache = {path: entry for path, entry in state["inputs"].items() if path in files}
+    hashes = [file_hash(path, cache) for path in files]
+    nodes = build_tree(files, hashes, fan_in)
+
+    targets = [os.path.join(state_dir, f"{key}.root") for key, _, _ in nodes]
+    merged, reused = 0, 0
+    with ThreadPoolExecutor(num_processes) as pool:
+        # the merges of one height only depend on merges of lower heights and run in parallel
+        for height in range(nodes[-1][1] + 1):
+            level = [(target, children) for target, (_, h, children) in zip(targets, nodes) if h == height]
+            todo = [
+                (target, [files[index] if kind == "input" else targets[index] for kind, index in children])
+                for target, children in level
+                if not os.path.exists(target)
+            ]
+            logger.info(
+                f"Level {height}: {len(level)} merges, {len(level) - len(todo)} up to date, {len(todo)} to be redone"
+            )
+            list(pool.map(lambda job: hadd(*job), todo))
+            merged += len(todo)
+            reused += len(level) - len(todo)
+
+    # Remove partial merges which are not part of the current tree anymore.
+    current = {f"{key}.root" for key, _, _ in nodes}
+    for fi in os.listdir(state_dir):
+        if fi.endswith(".root") and fi not in current:
+            os.remove(os.path.join(state_dir, fi))
+    with open(state_path, "w") as f:
+        json.dump(
+            {
+                "inputs": cache,
+                "tree": [{"key": key, "children": children} for key, _, children in nodes],
+            },
+            f,
+        )
+
+    tmp_output = f"{output}.tmp.root"
+    shutil.copyfile(targets[-1], tmp_output)
+    os.replace(tmp_output, output)
+    logger.info(f"Merged {len(files)} files into {output}: {merged} merges redone, {reused} reused")
+
+
+def main(args):
+    missing = {}
+    for output_dir, graph_file in args.check:
+        missing_graphs = missing_outputs(graph_file, output_dir)
+        if missing_graphs:
+            missing[output_dir] = missing_graphs
+            logger.warning(f"Outputs missing in {output_dir} for graphs {missing_graphs}")
+    if missing and not args.allow_missing:
+        raise SystemExit("[ERROR] Outputs are missing, resubmit the jobs or run with --allow-missing.")
+
+    if args.fan_in < 2:
+        raise SystemExit("[ERROR] --fan-in has to be at least 2.")
+    files = collect_inputs(args.inputs)
+    if not files:
+        raise SystemExit(f"[ERROR] No input files found in {args.inputs}.")
+    state_dir = args.state_dir if args.state_dir is not None else f"{args.output}.merge"
+    merge_tree(files, args.output, state_dir, args.fan_in, args.num_processes)
+    return
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
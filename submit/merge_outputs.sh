@@ -15,21 +15,38 @@ source utils/setup_susy_samples.sh $ERA
 source utils/bashFunctionCollection.sh
 
 BASE="output/shapes"
+CONTROL=0
+[[ "$PREFIX" == "control" ]] && CONTROL=1
+
+# Merge the job outputs of the given process strings incrementally after checking that no outputs are missing.
+function merge_outputs () {
+    OUTFILE=$1
+    INPUTS=()
+    CHECKS=()
+    for PROCS in ${@:2}
+    do
+        PROCS=$(sort_string $PROCS)
+        INPUTS+=(output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-${PROCS})
+        CHECKS+=(--check output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-${PROCS} \
+                 output/submit_files/${ERA}-${CH}-${PROCS}-${CONTROL}-${TAG}/${PREFIX}_unit_graphs-${ERA}-${CH}-${PROCS}.pkl)
+    done
+    python submit/merge_outputs.py -o $OUTFILE -i ${INPUTS[@]} ${CHECKS[@]} -n 100 -j 5
+}
 
 for CH in ${CHANNELS[@]}
 do
     DIRNAME=${BASE}/${ERA}-${CH}-${PREFIX}-shapes-${TAG}
     echo "[INFO] Creating output dir $DIRNAME..."
-    mkdir $DIRNAME
+    mkdir -p $DIRNAME
     if [[ "$PREFIX" =~ "analysis" ]]
     then 
         echo "[INFO] Adding outputs of background and sm signal jobs..."
         # hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string data,emb,ttj,ttl,ttt,vvj,vvl,vvt,w,zj,zl,ztt,ggh,gghww,qqh,qqhww,tth,wh,whww,zh,zhww)/*.root
-        if [[ "$CH" == "et" -o "$CH" == "mt" ]]
+        if [[ "$CH" == "et" || "$CH" == "mt" ]]
         then
-            hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string data,emb,ttl,ttt,vvl,zl,ggh,qqh,wh,zh)/*.root
+            merge_outputs ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root data,emb,ttl,ttt,vvl,zl,ggh,qqh,wh,zh
         else
-            hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string data,emb,ttl,ttt,vvl,w,zl,ggh,qqh,wh,zh)/*.root
+            merge_outputs ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root data,emb,ttl,ttt,vvl,w,zl,ggh,qqh,wh,zh
         fi
         # echo "[INFO] Adding outputs of background jobs..."
         # hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-data,emb,ttj,ttl,ttt,vvj,vvl,vvt,w,zj,zl,ztt/*.root
@@ -41,13 +58,11 @@ do
         # hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_ggh.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string ${GGH_SAMPLES_SPLIT1})/*.root \
         #                                                                          output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string ${GGH_SAMPLES_SPLIT2})/*.root \
         #                                                                          output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string ${GGH_SAMPLES_SPLIT3})/*.root
-        hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_bbhpowheg.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-bbhpowheg*/*.root
+        merge_outputs ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_bbhpowheg.root ${BBH_POWHEG_SPLIT1} ${BBH_POWHEG_SPLIT2}
         echo "[INFO] Adding outputs of mssm ggh signal jobs..."
-        hadd -j 5 -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_gghpowheg.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string ${GGH_POWHEG_SPLIT1})/*.root \
-                                                                                 output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string ${GGH_POWHEG_SPLIT2})/*.root \
-                                                                                 output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string ${GGH_POWHEG_SPLIT3})/*.root
+        merge_outputs ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_gghpowheg.root ${GGH_POWHEG_SPLIT1} ${GGH_POWHEG_SPLIT2} ${GGH_POWHEG_SPLIT3}
         echo "[INFO] Adding intermediate merge files to final merged file..."
-        hadd ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}.root ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root \
+        python submit/merge_outputs.py -o ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}.root -i ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root \
                                                            ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_gghpowheg.root \
                                                            ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_bbhpowheg.root
         #                                                    ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-mssm_ggh.root \
@@ -55,7 +70,7 @@ do
                                                            # ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-sm_signals.root \
     else
         echo "[INFO] Adding outputs of background and sm signal jobs..."
-        hadd -n 600 ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root output/shapes/${PREFIX}_unit_graphs-${ERA}-${CH}-$(sort_string data,emb,ttj,ttl,ttt,vvj,vvl,vvt,w,zj,zl,ztt,ggh,gghww,qqh,qqhww,tth,wh,whww,zh,zhww)/*.root
+        merge_outputs ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root data,emb,ttj,ttl,ttt,vvj,vvl,vvt,w,zj,zl,ztt,ggh,gghww,qqh,qqhww,tth,wh,whww,zh,zhww
         mv ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}-bkg_sm.root ${DIRNAME}/shapes-${PREFIX}-${ERA}-${CH}.root
     fi
 done
@@ -2,7 +2,9 @@
 
 import os
 import argparse
-import pickle
+
+from submit.cost_model import MULTICORE_THREADS, CostModel, exceeding_walltime, pack_jobs, simulate_makespan
+from submit.graph_store import GraphStore, format_graph_number, parse_graph_number
 
 
 def parse_args():
@@ -23,6 +25,24 @@ def parse_args():
         type=int,
         help="Run given number of pipelines in one job.",
     )
+    parser.add_argument(
+        "--target-walltime",
+        default=None,
+        type=float,
+        help="Pack graphs into jobs balanced to this walltime in seconds, using the cost model.",
+    )
+    parser.add_argument(
+        "--runtime-history",
+        default=["log/*/*.runtime.json"],
+        nargs="*",
+        help="Glob patterns of runtime records of previous jobs used to calibrate the cost model.",
+    )
+    parser.add_argument(
+        "--simulate-slots",
+        default=None,
+        type=int,
+        help="Only report the predicted makespan for the given number of slots, no files are written.",
+    )
     return parser.parse_args()
 
 
@@ -46,20 +66,20 @@ def write_file_multicore(output_dir, graph_file, num_jobs, workdir):
     return
 
 
-def split_multicore_jobs(graphs):
+def split_multicore_jobs(graph_metadata):
     # Split jobs in mulitcore and singlecore jobs in dependence of their number of children
     max_indices = {}
-    for i, graph in enumerate(graphs):
+    for i, graph in enumerate(graph_metadata):
         # Check if dataset has already been parsed
-        if graph.name in max_indices:
+        if graph["name"] in max_indices:
             # Check if number of children is largest processed so far.
-            if len(graph.children) > max_indices[graph.name]["val"]:
-                max_indices[graph.name]["index"] = i
-                max_indices[graph.name]["val"] = len(graph.children)
+            if graph["n_children"] > max_indices[graph["name"]]["val"]:
+                max_indices[graph["name"]]["index"] = i
+                max_indices[graph["name"]]["val"] = graph["n_children"]
         else:
-            max_indices[graph.name] = {"index": i, "val": len(graph.children)}
+            max_indices[graph["name"]] = {"index": i, "val": graph["n_children"]}
     mult_ind = [ind_dict["index"] for ind_dict in max_indices.values()]
-    single_ind = set(range(len(graphs))) - set(mult_ind)
+    single_ind = set(range(len(graph_metadata))) - set(mult_ind)
     return single_ind, mult_ind
 
 
@@ -86,16 +106,47 @@ def prepare_multigraph_jobs(graph_inds, group_size):
 
 
 def main(args):
-    with open(args.graph_file, "rb") as f:
-        graphs = pickle.load(f)
+    graph_metadata = GraphStore(args.graph_file).metadata
     workdir = os.getcwd()
-    num_singles, num_multi = split_multicore_jobs(graphs)
-    if args.pack_multiple_pipelines is None:
-        pass
+    model = CostModel.from_history(args.runtime_history)
+    if args.target_walltime is None:
+        num_singles, num_multi = split_multicore_jobs(graph_metadata)
+        if args.pack_multiple_pipelines is None:
+            num_singles = sorted(num_singles)
+        else:
+            num_singles = prepare_multigraph_jobs(
+                sorted(num_singles), args.pack_multiple_pipelines
+            )
     else:
-        num_singles = prepare_multigraph_jobs(
-            list(num_singles), args.pack_multiple_pipelines
+        single_jobs, num_multi = pack_jobs(graph_metadata, model, args.target_walltime)
+        num_singles = [format_graph_number(job) for job in single_jobs]
+        for i, seconds in exceeding_walltime(
+            graph_metadata, model, num_multi, args.target_walltime, num_threads=MULTICORE_THREADS
+        ):
+            print(
+                "[WARNING] Graph {} ({}) is predicted to run {:.0f} s on {} threads, exceeding the target walltime of {:.0f} s".format(
+                    i, graph_metadata[i]["name"], seconds, MULTICORE_THREADS, args.target_walltime
+                )
+            )
+
+    if args.simulate_slots is not None:
+        job_times = [
+            sum(model.predict(graph_metadata[i]) for i in parse_graph_number(str(job)))
+            for job in num_singles
+        ]
+        job_times += [model.predict(graph_metadata[i], num_threads=MULTICORE_THREADS) for i in num_multi]
+        print("[INFO] {} single core and {} multicore jobs".format(len(num_singles), len(num_multi)))
+        print(
+            "[INFO] Predicted total walltime: {:.0f} s, longest job: {:.0f} s".format(
+                sum(job_times), max(job_times, default=0.0)
+            )
+        )
+        print(
+            "[INFO] Predicted makespan on {} slots: {:.0f} s".format(
+                args.simulate_slots, simulate_makespan(job_times, args.simulate_slots)
+            )
         )
+        return
     write_file(args.output_dir, args.graph_file, num_singles, workdir)
     write_file_multicore(args.output_dir, args.graph_file, num_multi, workdir)
     return
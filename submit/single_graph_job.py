@@ -2,10 +2,13 @@
 
 import os
 import argparse
-import pickle
 import logging
+import time
 
+from config.telemetry import StageTelemetry, count_events_enabled, graph_entries
 from ntuple_processor import RunManager
+from submit.cost_model import record_runtime
+from submit.graph_store import GraphStore, parse_graph_number
 
 logger = logging.getLogger("")
 
@@ -43,25 +46,17 @@ def setup_logging(output_file, level=logging.DEBUG):
     logger.addHandler(file_handler)
 
 
-def main(args):
-
-    with open(args.input, "rb") as f:
-        graphs = pickle.load(f)
-        if "-" in args.graph_number:
-            graph_ind = list(map(int, args.graph_number.split("-")))
-            graph_to_process = graphs[graph_ind[0] : graph_ind[1] + 1]
-        else:
-            graph_to_process = [graphs[int(args.graph_number)]]
+def main(args, telemetry):
+    telemetry.start_phase("loading")
+    store = GraphStore(args.input)
+    graph_to_process = store.select(args.graph_number)
     logger.info(
         "Processing graph number {} out of {} graphs.".format(
-            args.graph_number, len(graphs)
+            args.graph_number, len(store)
         )
     )
-
-    if "-" in args.graph_number:
-        logger.info(graphs[graph_ind[0] : graph_ind[1] + 1])
-    else:
-        logger.info(graphs[int(args.graph_number)])
+    for graph in graph_to_process:
+        logger.info(graph)
     if args.output is None:
         output_file = os.path.join(
             "output/condor_shapes",
@@ -76,9 +71,25 @@ def main(args):
     # create the output directory if it doesn't exist
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     # Step 3: convert to RDataFrame and run the event loop
+    telemetry.start_phase("event_loop")
+    start = time.time()
     r_manager = RunManager(graph_to_process)
     r_manager.run_locally(output_file, 1, args.num_threads)
 
+    # Keep the runtime next to the job log, it is used to calibrate the cost model of the job packing.
+    graph_id = os.path.basename(args.input).replace(".pkl", "")
+    record_runtime(
+        os.path.join("log", graph_id, "{}-{}.runtime.json".format(graph_id, args.graph_number)),
+        graph_file=args.input,
+        graph_number=args.graph_number,
+        metadata=[store.records[index] for index in parse_graph_number(args.graph_number)],
+        walltime=time.time() - start,
+        num_threads=args.num_threads,
+    )
+    telemetry.count("graphs", len(graph_to_process))
+    if count_events_enabled():
+        telemetry.start_phase("counting_events")
+        telemetry.count("events", graph_entries(graph_to_process))
 
     return
 
@@ -97,4 +108,10 @@ if __name__ == "__main__":
         ),
         level=logging.INFO,
     )
-    main(args)
+    with StageTelemetry(
+        "single_graph_job",
+        graph_file=os.path.basename(args.input),
+        graph_number=args.graph_number,
+        num_threads=args.num_threads,
+    ) as telemetry:
+        main(args, telemetry)
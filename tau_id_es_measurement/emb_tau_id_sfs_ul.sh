@@ -212,19 +212,15 @@ if [[ $MODE == "SYNC" ]]; then
         -i ${shapes_rootfile} \
         -o ${shapes_output_synced} \
         --variable-selection ${VARIABLES} \
-        -n 1
+        --output-name "htt_{channel}.inputs-sm-Run{era}${POSTFIX}.root" \
+        -n 4
 
     python shapes/convert_to_synced_shapes.py -e ${datacard_era} \
         -i "${shapes_rootfile_mm}" \
-        -o "${shapes_output_synced}_mm" \
+        -o ${shapes_output_synced} \
         --variable-selection ${VARIABLES} \
-        -n 1
-
-    inputfile="htt_${CHANNEL}.inputs-sm-Run${datacard_era}${POSTFIX}.root"
-    hadd -f $shapes_output_synced/$inputfile $shapes_output_synced/${datacard_era}-${CHANNEL}*.root
-
-    inputfile="htt_mm.inputs-sm-Run${datacard_era}${POSTFIX}.root"
-    hadd -f $shapes_output_synced/$inputfile ${shapes_output_synced}_mm/${datacard_era}-mm-*.root
+        --output-name "htt_{channel}.inputs-sm-Run{era}${POSTFIX}.root" \
+        -n 4
 
     exit 0
 fi
@@ -235,14 +231,12 @@ if [[ $MODE == "PLOT-CONTROL-ES" ]]; then
     echo "#     plotting                                      #"
     echo "##############################################################################################"
 
-        for CATEGORY in "${dm_categories[@]}"
-    do
-        for es_sh in "${es_shifts4_0[@]}"
-        do 
-            python3 plotting/plot_shapes_control_es_shifts.py -l --era Run${ERA} --input ${shapes_rootfile} \
-            --variables ${VARIABLES} --channels ${CHANNEL} --embedding --category $CATEGORY --energy_scale --es_shift $es_sh
-        done
-    done
+    # all categories and shifts are plotted from a single read of the shapes file
+    CATEGORIES=$(IFS=,; echo "${dm_categories[*]}")
+    ES_SHIFTS=$(IFS=,; echo "${es_shifts4_0[*]}")
+    python3 plotting/plot_shapes_control_es_shifts.py -l --era Run${ERA} --input ${shapes_rootfile} \
+        --variables ${VARIABLES} --channels ${CHANNEL} --embedding --category ${CATEGORIES} --energy_scale --es_shift ${ES_SHIFTS} \
+        --num-processes 8
 fi
 
 if [[ $MODE == "INST_COMB" ]]; then
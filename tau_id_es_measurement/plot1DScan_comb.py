@@ -10,6 +10,10 @@ import json
 import argparse
 import os.path
 from six.moves import range
+import sys
+
+sys.path.extend([".", ".."])  # if executed within smhtt_ul or smhtt_ul/tau_id_es_measurement
+from fitting.scan_results import evaluator, find_crossings, read_scan, to_tgraph, uncertainties
 
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
@@ -22,14 +26,10 @@ NAMECOUNTER = 0
 
 def read(scan, param, files, ycut):
     goodfiles = [f for f in files if plot.TFileIsGood(f)]
-    limit = plot.MakeTChain(goodfiles, 'limit')
-    graph = plot.TGraphFromTree(limit, param, '2*deltaNLL', 'quantileExpected > -1.5')
-    graph.SetName(scan)
-    graph.Sort()
-    plot.RemoveGraphXDuplicates(graph)
-    plot.RemoveGraphYAbove(graph, ycut)
+    x, y = read_scan(goodfiles, param, min_quantile=-1.5, y_cut=ycut)
+    graph = to_tgraph(x, y, scan)
     # graph.Print()
-    return graph
+    return x, y, graph
 
 
 def Eval(obj, x, params):
@@ -37,14 +37,12 @@ def Eval(obj, x, params):
 
 
 def BuildScan(scan, param, files, color, yvals, ycut):
-    graph = read(scan, param, files, ycut)
+    x, y, graph = read(scan, param, files, ycut)
     if graph.GetN() <= 1:
         graph.Print()
         raise RuntimeError('Attempting to build %s scan from TGraph with zero or one point (see above)' % files)
-    bestfit = None
-    for i in range(graph.GetN()):
-        if graph.GetY()[i] == 0.:
-            bestfit = graph.GetX()[i]
+    at_zero = x[y == 0.]
+    bestfit = at_zero[-1] if len(at_zero) else None
     graph.SetMarkerColor(color)
     spline = ROOT.TSpline3("spline3", graph)
     global NAMECOUNTER
@@ -56,32 +54,16 @@ def BuildScan(scan, param, files, color, yvals, ycut):
     func.SetLineWidth(3)
     assert(bestfit is not None)
     crossings = {}
-    cross_1sig = None
-    cross_2sig = None
-    other_1sig = []
-    other_2sig = []
-    val = None
-    val_2sig = None
     for yval in yvals:
-        crossings[yval] = plot.FindCrossingsWithSpline(graph, func, yval)
-        for cr in crossings[yval]:
-            cr["contains_bf"] = cr["lo"] <= bestfit and cr["hi"] >= bestfit
-    for cr in crossings[yvals[0]]:
-        if cr['contains_bf']:
-            val = (bestfit, cr['hi'] - bestfit, cr['lo'] - bestfit)
-            cross_1sig = cr
-        else:
-            other_1sig.append(cr)
+        # crossings of the drawn spline
+        crossings[yval] = find_crossings(x, y, yval, function=evaluator(spline))
+    val, cross_1sig, other_1sig = uncertainties(crossings[yvals[0]], bestfit)
     if len(yvals) > 1:
-        for cr in crossings[yvals[1]]:
-            if cr['contains_bf']:
-                val_2sig = (bestfit, cr['hi'] - bestfit, cr['lo'] - bestfit)
-                cross_2sig = cr
-            else:
-                other_2sig.append(cr)
+        val_2sig, cross_2sig, other_2sig = uncertainties(crossings[yvals[1]], bestfit)
     else:
         val_2sig = (0., 0., 0.)
         cross_2sig = cross_1sig
+        other_2sig = []
     return {
         "graph"     : graph,
         "spline"    : spline,
@@ -1,8 +1,10 @@
 import ROOT
-from scipy.interpolate import griddata
-import numpy as np
 
 import argparse
+import sys
+
+sys.path.extend([".", ".."])  # if executed within smhtt_ul or smhtt_ul/tau_id_es_measurement
+from fitting.scan_results import bin_average_2d, interpolate_2d, minimum_2d, read_limit_tree
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--name',type=str, help='Name of the file')
@@ -16,8 +18,6 @@ ROOT.gROOT.SetBatch(True)
 ROOT.gStyle.SetOptStat(0)
 
 file_name = args.in_path+"higgsCombine."+args.name+".MultiDimFit.mH120.root"
-f = ROOT.TFile(file_name)
-t = f.Get("limit")
 
 # Number of points in interpolation
 n_points = 400
@@ -27,42 +27,19 @@ y_range = [-3.8, 4]
 # Number of bins in plot
 n_bins = 40
 
-x, y, deltaNLL = [], [], []
-for ev in t:
-    x.append(getattr(ev, "r"))
-    y.append(getattr(ev, args.tau_es_poi))
-    deltaNLL.append(getattr(ev, "deltaNLL"))
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Do interpolation
-# Convert to numpy arrays as required for interpolation
-dnll = np.asarray(deltaNLL)
-points = np.array([x, y]).transpose()
-# Set up grid
-grid_x, grid_y = np.mgrid[x_range[0] : x_range[1] : n_points * 1j, y_range[0] : y_range[1] : n_points * 1j]
-grid_vals = griddata(points, dnll, (grid_x, grid_y), "cubic")
-
-# Remove NANS
-grid_x = grid_x[grid_vals == grid_vals]
-grid_y = grid_y[grid_vals == grid_vals]
-grid_vals = grid_vals[grid_vals == grid_vals]
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-# Define Profile2D histogram
-# h2D = ROOT.TProfile2D("h", "h", n_bins, x_range[0], x_range[1], n_bins, y_range[0], y_range[1], -10, 400, "h")
-h2D = ROOT.TProfile2D("h", "h", n_bins, x_range[0], x_range[1], n_bins, y_range[0], y_range[1])
-
-for i in range(len(grid_vals)):
-    # Factor of 2 comes from 2*NLL
-    h2D.Fill(grid_x[i], grid_y[i], 2 * grid_vals[i])
-
-# Loop over bins: if content = 0 then set 999
-for ibin in range(1, h2D.GetNbinsX() + 1):
-    for jbin in range(1, h2D.GetNbinsY() + 1):
-        if h2D.GetBinContent(ibin, jbin) == 0:
-            xc = h2D.GetXaxis().GetBinCenter(ibin)
-            yc = h2D.GetYaxis().GetBinCenter(jbin)
-            h2D.Fill(xc, yc, 999)
+scan = read_limit_tree(file_name, ["r", args.tau_es_poi, "deltaNLL"])
+
+# Interpolate on the grid, points outside of the scanned area are removed
+grid_x, grid_y, grid_vals = interpolate_2d(
+    scan["r"], scan[args.tau_es_poi], scan["deltaNLL"], x_range, y_range, n_points
+)
+
+# Average of the grid points in the bins of the plot, factor of 2 comes from 2*NLL, bins with content 0 are filled with 999
+h2D = ROOT.TH2D("h", "h", n_bins, x_range[0], x_range[1], n_bins, y_range[0], y_range[1])
+contents = bin_average_2d(grid_x, grid_y, 2 * grid_vals, x_range, y_range, n_bins)
+for ibin in range(n_bins):
+    for jbin in range(n_bins):
+        h2D.SetBinContent(ibin + 1, jbin + 1, contents[ibin, jbin])
 
 # Set up canvas
 canv = ROOT.TCanvas("canv", "canv", 600, 600)
@@ -125,7 +102,7 @@ c95.Draw("cont3same")
 
 # Make best fit and sm points
 gBF = ROOT.TGraph()
-gBF.SetPoint(0, grid_x[np.argmin(grid_vals)], grid_y[np.argmin(grid_vals)])
+gBF.SetPoint(0, *minimum_2d(grid_x, grid_y, grid_vals))
 gBF.SetMarkerStyle(34)
 gBF.SetMarkerSize(2)
 gBF.SetMarkerColor(ROOT.kBlack)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ROOT")
+pytest.importorskip("ntuple_processor")
+
+from gof.build_binning import weighted_percentile  # noqa: E402
+
+
+def test_equal_weights_match_np_percentile():
+    values = np.array([3.0, 1.0, 4.0, 1.5, 5.0, 9.0, 2.0, 6.0])
+    percentiles = [0, 10, 25, 50, 75, 90, 100]
+    np.testing.assert_allclose(
+        weighted_percentile(values, np.full(len(values), 0.3), percentiles),
+        np.percentile(values, percentiles),
+    )
+
+
+def test_negative_weights_are_clipped():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    weights = np.array([1.0, -2.0, 1.0, -0.5, 1.0])
+    percentiles = [0, 25, 50, 75, 100]
+    borders = weighted_percentile(values, weights, percentiles)
+    assert np.all(np.diff(borders) >= 0)
+    np.testing.assert_allclose(borders, np.percentile([1.0, 3.0, 5.0], percentiles))
+
+
+def test_only_negative_weights_fall_back_to_np_percentile():
+    values = np.array([2.0, 1.0, 3.0])
+    np.testing.assert_allclose(
+        weighted_percentile(values, np.array([-1.0, -1.0, -2.0]), [0, 50, 100]),
+        [1.0, 2.0, 3.0],
+    )
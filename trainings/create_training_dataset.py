@@ -9,16 +9,18 @@ from typing import Iterable, Tuple
 import numpy as np
 import pandas as pd
 import yaml
+from src.arrow_export import dataframe_to_tables, write_table
 from src.dataset_manipulation import CombinedDataFrameManipulation, ProcessDataFrameManipulation, ROOTToPlain, tuple_column
-from src.helper import Iterate, Keys, PipeDict, RuntimeVariables, optional_process_pool
-from tqdm import tqdm
+from src.helper import Iterate, Keys, optional_process_pool
 
 try:
     from config.logging_setup_configs import setup_logging
+    from config.telemetry import StageTelemetry
 except ModuleNotFoundError:
     import sys
     sys.path.extend([".", ".."])
     from config.logging_setup_configs import setup_logging
+    from config.telemetry import StageTelemetry
 
 
 def parse_args():
@@ -37,37 +39,6 @@ def parse_args():
     return parser.parse_args()
 
 
-def tiled_mask(
-    df: pd.DataFrame,
-    pattern: Iterable[bool],
-) -> np.ndarray:
-    """
-    Helper to create a mask for the training and validation folds.
-    The pattern is repeated to cover the length of the dataframe.
-
-    Args:
-        df (pd.DataFrame): The dataframe to create the mask for.
-        pattern (Iterable[bool]): The pattern to repeat, i.e. [True, True, False, False].
-
-    Returns:
-        np.ndarray: A boolean mask of the same length as the dataframe.
-    """
-    return np.tile(pattern, int(np.ceil(len(df) / len(pattern))))[:len(df)].astype(bool)
-
-
-def odd_id(df: pd.DataFrame, key: str = "event") -> np.ndarray:
-    """
-    Helper to create a mask for odd IDs.
-
-    Args:
-        df (pd.DataFrame): The dataframe to create the mask for.
-
-    Returns:
-        np.ndarray: A boolean mask of the same length as the dataframe.
-    """
-    return (df[Keys.EVENT][key] % 2).astype(bool)
-
-
 def exemplary_remove_cut_regions(df: pd.DataFrame, regions: Iterable[str]) -> pd.DataFrame:
     """
     Exemplary function.
@@ -137,6 +108,8 @@ def collect_filtered_plain_dataframes(arguments: Tuple[dict, str, str, str, str,
     """
     Function to collect filtered plain dataframes. It creates raw and filtered dataframes
     and stores them if not present applying basic filter, collecting any cuts.
+    Both are cached per input file, keyed by the file stamps, columns and selection. Unchanged
+    subprocesses are loaded from the cache without opening any ROOT file.
 
     Args:
         arguments (Tuple[dict, str, str, str, str, dict]): A tuple containing the config,
@@ -152,8 +125,8 @@ def collect_filtered_plain_dataframes(arguments: Tuple[dict, str, str, str, str,
     """
     config, channel, era, process, subprocess, subprocess_dict = arguments
 
-    def _path(directory, extension="feather"):
-        name = f"{channel}_{era}_{process}_{subprocess}.{extension}"
+    def _path(directory):
+        name = f"{channel}_{era}_{process}_{subprocess}"
         return (Path(args.base_dataset_directory) / Path(directory)).joinpath(name)
 
     def any_cut(df):
@@ -197,7 +170,7 @@ def collect_folds(arguments: Tuple[dict, str, str, str, str, dict, pd.DataFrame]
     Function to collect folds for the training dataset. It creates a dataframe
     for each process and subprocess, applies the necessary manipulations, adding
     labels, event quantities, nominal variables, weights and cuts, and additional
-    nominal cuts. It also handles uncertainties and splits the dataframe into folds.
+    nominal cuts. It also handles uncertainties and assigns the events to folds.
 
     Args:
         arguments (Tuple[dict, str, str, str, str, dict, pd.DataFrame]): A tuple containing the config,
@@ -210,7 +183,8 @@ def collect_folds(arguments: Tuple[dict, str, str, str, str, dict, pd.DataFrame]
             plain_subprocess_dataframe: pd.DataFrame: The plain subprocess dataframe.
 
     Returns:
-        dict: A dictionary containing the folds for the training dataset.
+        dict: A dictionary containing the process dataframe ("data") and the fold index
+            of each of its rows ("fold_indices"), see CombinedDataFrameManipulation.fold_indices.
     """
     add = ProcessDataFrameManipulation(
         config=config,
@@ -266,20 +240,13 @@ def collect_folds(arguments: Tuple[dict, str, str, str, str, dict, pd.DataFrame]
         .pipe(exemplary_custom_selection, optimize_selection=True)
     )
 
-    msg = f"Creating folds for {channel} {era} {process} - {subprocess}"
-
-    _folds_splitted = {k: {"data": []} for k in folds_splitted.keys()}
-    for fold_name, fold in tqdm(_folds_splitted.items()):
-        fold["data"].append(
-            CombinedDataFrameManipulation.split_folds(
-                df=process_df,
-                condition=folds_splitted[fold_name]["condition"],
-            ),
-        )
-        msg += f"\n\t{fold_name}: {fold['data'][-1].shape}"
-    logger.info(msg)
+    fold_indices = CombinedDataFrameManipulation.fold_indices(process_df, subfold_pattern=SUBFOLD_PATTERN)
+    logger.info(
+        f"Assigned folds for {channel} {era} {process} - {subprocess}: {process_df.shape}, "
+        f"events per fold index {np.bincount(fold_indices, minlength=4).tolist()}"
+    )
 
-    return _folds_splitted
+    return {"data": process_df, "fold_indices": fold_indices}
 
 
 if __name__ == "__main__":
@@ -298,61 +265,51 @@ if __name__ == "__main__":
     # TODO: individually select for each analysis if needed
     SUBPROCESSES_TO_SKIP = {"DY-ZJ", "DY-ZTT", "TT-TTJ", "TT-TTT", "VV-VVJ", "VV-VVT"}
 
-    filtered_plain_dataframes = {}
-    for result in optional_process_pool(
-        args_list=[
-            tuple(map(deepcopy, [config] + list(it)))
-            for it in Iterate.subprocesses(config)
-            if it[-2] not in SUBPROCESSES_TO_SKIP
-        ],
-        function=collect_filtered_plain_dataframes,
-        max_workers=1,
-    ):
-        filtered_plain_dataframes.update(result)
-
-    subfold_pattern = [True, True, False, False]
-    folds_splitted = {
-        key: {"data": [], "condition": condition}
-        for key, condition in [
-            ("fold0", lambda df: odd_id(df)),
-            ("fold0_training", lambda df: odd_id(df) & tiled_mask(df, subfold_pattern)),
-            ("fold0_validation", lambda df: odd_id(df) & ~tiled_mask(df, subfold_pattern)),
-            ("fold1", lambda df: ~odd_id(df)),
-            ("fold1_training", lambda df: ~odd_id(df) & tiled_mask(df, subfold_pattern)),
-            ("fold1_validation", lambda df: ~odd_id(df) & ~tiled_mask(df, subfold_pattern)),
-        ]
-    }
-
-    # RuntimeVariables.USE_MULTIPROCESSING = False
-    for result in optional_process_pool(
-        args_list=[
-            tuple(map(deepcopy, [config] + list(it) + [filtered_plain_dataframes[it[:-1]]]))
-            for it in Iterate.subprocesses(config)
-            if it[-2] not in SUBPROCESSES_TO_SKIP
-        ],
-        function=collect_folds,
-    ):
-        for fold_name, fold in result.items():
-            folds_splitted[fold_name]["data"].extend(fold["data"])
-
-    logger.info("Merging folds and adjusting")
-    folds = PipeDict(
-        {
-            k: pd.concat(v["data"], ignore_index=True).reset_index(drop=True)
-            for k, v in tqdm(folds_splitted.items())
-        }
-    )
-
-    folds = (
-        folds
-        .pipe(CombinedDataFrameManipulation.fill_nans_in_weight_like)
-        .pipe(CombinedDataFrameManipulation.fill_nans_in_shift_like)
-        .pipe(CombinedDataFrameManipulation.fill_nans_in_nominal_additional, default_value=0.0)
-    )
-
-    (Path(args.base_dataset_directory) / Path("folds")).mkdir(parents=True, exist_ok=True)
-
-    for fold_name, fold in folds.items():
-        fold_path = (Path(args.base_dataset_directory) / Path("folds")).joinpath(f"{fold_name}.feather")
-        fold.to_feather(fold_path)
-        logger.info(f"Created {fold_name} with shape {fold.shape} at {fold_path}")
+    # Events with odd IDs form fold0, even IDs fold1. Training/validation subfolds repeat this pattern.
+    SUBFOLD_PATTERN = [True, True, False, False]
+
+    with StageTelemetry("create_training_dataset", config=args.config) as telemetry:
+        telemetry.start_phase("conversion")
+        filtered_plain_dataframes = {}
+        for result in optional_process_pool(
+            args_list=[
+                tuple(map(deepcopy, [config] + list(it)))
+                for it in Iterate.subprocesses(config)
+                if it[-2] not in SUBPROCESSES_TO_SKIP
+            ],
+            function=collect_filtered_plain_dataframes,
+            max_workers=1,
+        ):
+            filtered_plain_dataframes.update(result)
+        telemetry.count("events", sum(len(it) for it in filtered_plain_dataframes.values()))
+
+        telemetry.start_phase("folds")
+        # RuntimeVariables.USE_MULTIPROCESSING = False
+        process_dfs, fold_indices = [], []
+        for result in optional_process_pool(
+            args_list=[
+                tuple(map(deepcopy, [config] + list(it) + [filtered_plain_dataframes[it[:-1]]]))
+                for it in Iterate.subprocesses(config)
+                if it[-2] not in SUBPROCESSES_TO_SKIP
+            ],
+            function=collect_folds,
+        ):
+            process_dfs.append(result["data"])
+            fold_indices.append(result["fold_indices"])
+
+        telemetry.start_phase("merging")
+        logger.info("Merging processes, filling NaNs and splitting folds")
+        combined = pd.concat(process_dfs, ignore_index=True)
+        del process_dfs
+        combined = CombinedDataFrameManipulation.fill_nans(combined, default_value=0.0)
+        folds = CombinedDataFrameManipulation.split_folds_by_indices(combined, np.concatenate(fold_indices))
+        del combined
+
+        telemetry.start_phase("writing")
+        (Path(args.base_dataset_directory) / Path("folds")).mkdir(parents=True, exist_ok=True)
+
+        # Flat Arrow schema, the column levels are kept in the schema metadata, see src.arrow_export.read_dataframe
+        for fold_name, fold in folds.items():
+            fold_path = (Path(args.base_dataset_directory) / Path("folds")).joinpath(f"{fold_name}.feather")
+            rows, batches = write_table(fold_path, dataframe_to_tables(fold, metadata={"fold": fold_name}))
+            logger.info(f"Created {fold_name} with shape {fold.shape} at {fold_path} ({batches} record batches)")
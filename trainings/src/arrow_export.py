@@ -0,0 +1,175 @@
+import itertools
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+COLUMN_SEPARATOR = "::"
+COLUMNS_METADATA_KEY = b"columns"
+
+
+def flat_name(column: Union[str, Tuple[str, ...]]) -> str:
+    """
+    Flat name of a (tuple) column, joining the non-empty levels with COLUMN_SEPARATOR,
+    i.e. ("Nominal", "variables", "pt_1", "", "") -> "Nominal::variables::pt_1".
+
+    Args:
+        column (Union[str, Tuple[str, ...]]): The column name.
+
+    Returns:
+        str: The flat column name.
+    """
+    if isinstance(column, tuple):
+        return COLUMN_SEPARATOR.join(it for it in column if it)
+    return str(column)
+
+
+def table_from_arrays(
+    arrays: Dict[Union[str, Tuple[str, ...]], np.ndarray],
+    metadata: Union[Dict[str, str], None] = None,
+) -> pa.Table:
+    """
+    Creates an Arrow table with a flat schema from numpy arrays without copying
+    numerical data. The original column names are kept in the schema metadata,
+    together with the additional metadata.
+
+    Args:
+        arrays (Dict[Union[str, Tuple[str, ...]], np.ndarray]): The columns.
+        metadata (Dict[str, str], optional): Additional metadata of the table. Defaults to None.
+
+    Returns:
+        pa.Table: The Arrow table.
+    """
+    names = [flat_name(it) for it in arrays]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Column names are not unique after flattening: {names}")
+
+    schema_metadata = {str(k).encode(): str(v).encode() for k, v in (metadata or {}).items()}
+    schema_metadata[COLUMNS_METADATA_KEY] = json.dumps(
+        [[name, list(column) if isinstance(column, tuple) else column] for name, column in zip(names, arrays)]
+    ).encode()
+
+    columns = [pa.array(np.asarray(it)) for it in arrays.values()]
+    return pa.Table.from_arrays(columns, names=names, metadata=schema_metadata)
+
+
+def dataframe_to_table(df: pd.DataFrame, metadata: Union[Dict[str, str], None] = None) -> pa.Table:
+    """
+    Converts a pandas DataFrame with (MultiIndex) tuple columns into an Arrow table with a flat schema.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to convert.
+        metadata (Dict[str, str], optional): Additional metadata of the table. Defaults to None.
+
+    Returns:
+        pa.Table: The Arrow table.
+    """
+    return table_from_arrays({column: df[column].to_numpy() for column in df.columns}, metadata=metadata)
+
+
+def dataframe_to_tables(
+    df: pd.DataFrame,
+    metadata: Union[Dict[str, str], None] = None,
+    batch_size: int = 500_000,
+) -> Iterator[pa.Table]:
+    """
+    Lazily converts a pandas DataFrame into Arrow tables of at most batch_size rows
+    (see dataframe_to_table), so only one batch is held as Arrow table at a time, i.e.
+    while it is written by write_table. All tables are cast to the schema of the first one.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to convert.
+        metadata (Dict[str, str], optional): Additional metadata of the tables. Defaults to None.
+        batch_size (int, optional): Maximal number of rows per table. Defaults to 500_000.
+
+    Yields:
+        pa.Table: The Arrow tables of consecutive row slices.
+    """
+    schema = None
+    for start in range(0, len(df), batch_size) if len(df) else [0]:
+        table = dataframe_to_table(df.iloc[start:start + batch_size], metadata=metadata)
+        if schema is None:
+            schema = table.schema
+        elif table.schema != schema:
+            table = table.cast(schema)
+        yield table
+
+
+def table_to_dataframe(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow table created by table_from_arrays back into a pandas DataFrame,
+    restoring the (MultiIndex) tuple columns from the schema metadata.
+
+    Args:
+        table (pa.Table): The Arrow table.
+
+    Returns:
+        pd.DataFrame: The DataFrame.
+    """
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    if COLUMNS_METADATA_KEY in metadata:
+        columns = dict(json.loads(metadata[COLUMNS_METADATA_KEY]))
+        columns = [tuple(columns[it]) if isinstance(columns[it], list) else columns[it] for it in df.columns]
+        if all(isinstance(it, tuple) for it in columns):
+            df.columns = pd.MultiIndex.from_tuples(columns)
+        else:
+            df.columns = columns
+    return df
+
+
+def table_metadata(table: pa.Table) -> Dict[str, str]:
+    """
+    Returns the additional metadata of an Arrow table created by table_from_arrays.
+    """
+    return {
+        k.decode(): v.decode()
+        for k, v in (table.schema.metadata or {}).items()
+        if k != COLUMNS_METADATA_KEY and not k.startswith(b"pandas")
+    }
+
+
+def write_table(
+    path: Union[str, Path],
+    tables: Union[pa.Table, Iterable[pa.Table]],
+    batch_size: int = 500_000,
+) -> Tuple[int, int]:
+    """
+    Streams one or multiple Arrow tables with the same schema in record batches of at most
+    batch_size rows into an Arrow IPC (feather v2) file.
+
+    Args:
+        path (Union[str, Path]): The output file.
+        tables (Union[pa.Table, Iterable[pa.Table]]): The table(s) to write.
+        batch_size (int, optional): Maximal number of rows per record batch. Defaults to 500_000.
+
+    Returns:
+        Tuple[int, int]: The number of written rows and record batches.
+    """
+    tables = iter([tables] if isinstance(tables, pa.Table) else tables)
+    first = next(tables)
+    rows, batches = 0, 0
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, first.schema) as writer:
+        for table in itertools.chain([first], tables):
+            for batch in table.to_batches(max_chunksize=batch_size):
+                writer.write_batch(batch)
+                rows, batches = rows + batch.num_rows, batches + 1
+    return rows, batches
+
+
+def read_table(path: Union[str, Path]) -> pa.Table:
+    """
+    Reads an Arrow IPC file, memory mapped, i.e. without copying uncompressed data.
+    """
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def read_dataframe(path: Union[str, Path]) -> pd.DataFrame:
+    """
+    Reads an Arrow IPC file written by write_table into a pandas DataFrame with the original columns.
+    """
+    return table_to_dataframe(read_table(path))
@@ -0,0 +1,203 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+try:
+    from config.logging_setup_configs import setup_logging
+except ModuleNotFoundError:
+    sys.path.extend([".", ".."])
+    from config.logging_setup_configs import setup_logging
+
+
+logger = setup_logging(logger=logging.getLogger(__name__))
+
+
+def file_stamp(path: str) -> Tuple[str, Union[int, None], Union[float, None]]:
+    """
+    Stamp of an input file used to detect changes without opening it.
+    Remote files (i.e. root://) are identified by their path only.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        Tuple[str, Union[int, None], Union[float, None]]: path, size and modification time of the file.
+    """
+    if "://" in path:
+        return path, None, None
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+
+def normalize_expression(expression: str) -> str:
+    """
+    Normalizes the whitespace of a selection or definition expression, such that
+    formatting differences do not change the cache key.
+
+    Args:
+        expression (str): The expression to normalize.
+
+    Returns:
+        str: The normalized expression.
+    """
+    expression = re.sub(r"\s+", " ", str(expression)).strip()
+    return re.sub(r"\s*([()&|!<>=+\-*/,?:])\s*", r"\1", expression)
+
+
+def normalize_selection(
+    selection: Union[Iterable[Tuple[str, str]], Dict[str, str], Iterable[str], None],
+) -> List[List[str]]:
+    """
+    Normalizes definitions or filters given in any of the forms accepted by ROOTToPlain
+    into a list of [name, normalized expression] pairs, keeping their order.
+
+    Args:
+        selection (Union[Iterable[Tuple[str, str]], Dict[str, str], Iterable[str], None]): The definitions or filters.
+
+    Returns:
+        List[List[str]]: The normalized selection.
+    """
+    if selection is None:
+        return []
+    if isinstance(selection, dict):
+        selection = selection.items()
+    return [
+        [f"filter_{i}", normalize_expression(it)] if isinstance(it, str) else [it[0], normalize_expression(it[1])]
+        for i, it in enumerate(selection)
+    ]
+
+
+def function_identity(function: Union[Callable, str, Iterable, dict]) -> Any:
+    """
+    Identity of a filter function used in the cache key. Callables are identified by
+    their qualified name and source code, strings by their normalized expression.
+
+    Args:
+        function (Union[Callable, str, Iterable, dict]): The filter function(s).
+
+    Returns:
+        Any: A JSON serializable identity of the filter function(s).
+    """
+    if isinstance(function, str):
+        return normalize_expression(function)
+    if isinstance(function, dict):
+        return {k: function_identity(v) for k, v in function.items()}
+    if isinstance(function, (list, tuple)):
+        return [function_identity(it) for it in function]
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        source = ""
+    return [getattr(function, "__qualname__", repr(function)), source]
+
+
+def content_key(*parts: Any) -> str:
+    """
+    Content key of JSON serializable parts.
+
+    Returns:
+        str: The sha256 hex digest of the parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ChunkedFrameCache(object):
+    """
+    Directory holding Arrow tables (or pandas DataFrames) in feather files of at most chunk_size rows.
+
+    The data is organized in parts, each identified by a content key. A part is stored in
+    the chunks '<key>.<i>.feather' and is complete once its marker '<key>.json' exists, so
+    an interrupted write never leaves a valid looking part. The index file lists the keys
+    of the last complete dataset in order and allows loading it without knowing the keys.
+    """
+    INDEX = "index.json"
+
+    def __init__(self, directory: Union[str, Path], chunk_size: int = 500_000) -> None:
+        self.directory = Path(directory)
+        self.chunk_size = chunk_size
+
+    def _marker(self, key: str) -> Path:
+        return self.directory.joinpath(f"{key}.json")
+
+    def _chunk(self, key: str, index: int) -> Path:
+        return self.directory.joinpath(f"{key}.{index}.feather")
+
+    def has(self, key: str) -> bool:
+        return self._marker(key).exists()
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        return [key for key in keys if not self.has(key)]
+
+    def write(self, key: str, data: Union[pa.Table, pd.DataFrame]) -> None:
+        """
+        Writes a part in chunks of at most chunk_size rows. Slicing the table does not
+        copy any data. Empty parts are stored as a single chunk to keep the columns.
+
+        Args:
+            key (str): The content key of the part.
+            data (Union[pa.Table, pd.DataFrame]): The data of the part.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data.reset_index(drop=True), preserve_index=False)
+        starts = range(0, data.num_rows, self.chunk_size) if data.num_rows else [0]
+        for index, start in enumerate(starts):
+            path = self._chunk(key, index)
+            tmp_path = path.with_suffix(".tmp")
+            feather.write_feather(data.slice(start, self.chunk_size), str(tmp_path))
+            os.replace(tmp_path, path)
+        with open(self._marker(key), "w") as f:
+            json.dump({"chunks": len(starts), "rows": data.num_rows}, f)
+
+    def read_table(self, key: str) -> pa.Table:
+        with open(self._marker(key)) as f:
+            n_chunks = json.load(f)["chunks"]
+        return pa.concat_tables([feather.read_table(self._chunk(key, index)) for index in range(n_chunks)])
+
+    def read(self, key: str) -> pd.DataFrame:
+        return self.read_table(key).to_pandas()
+
+    def read_all_tables(self, keys: Union[Iterable[str], None] = None) -> pa.Table:
+        """
+        Reads and concatenates the given parts, defaults to the parts of the index.
+        """
+        keys = self.index() if keys is None else list(keys)
+        return pa.concat_tables([self.read_table(key) for key in keys], promote_options="default")
+
+    def read_all(self, keys: Union[Iterable[str], None] = None) -> pd.DataFrame:
+        return self.read_all_tables(keys).to_pandas()
+
+    def index(self) -> List[str]:
+        with open(self.directory.joinpath(self.INDEX)) as f:
+            return json.load(f)
+
+    def has_index(self) -> bool:
+        return self.directory.joinpath(self.INDEX).exists()
+
+    def set_index(self, keys: Iterable[str]) -> None:
+        """
+        Stores the keys of the current dataset and removes all parts not belonging to it.
+
+        Args:
+            keys (Iterable[str]): The ordered keys of the current dataset.
+        """
+        keys = list(keys)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory.joinpath(self.INDEX), "w") as f:
+            json.dump(keys, f)
+
+        current = set(keys)
+        for path in self.directory.iterdir():
+            if path.name != self.INDEX and path.name.split(".")[0] not in current:
+                logger.debug(f"Removing stale cache file {path}")
+                path.unlink()
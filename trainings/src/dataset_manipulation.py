@@ -6,8 +6,12 @@ from pathlib import Path
 from typing import Callable, Dict, Iterable, List, Literal, Tuple, Union
 from warnings import simplefilter
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import ROOT
+from src.arrow_export import table_from_arrays
+from src.dataset_cache import ChunkedFrameCache, content_key, file_stamp, function_identity, normalize_selection
 from src.helper import Iterate, Keys, optional_process_pool
 from tqdm import tqdm
 
@@ -16,6 +20,7 @@ try:
 except ModuleNotFoundError:
     sys.path.extend([".", ".."])
     from config.logging_setup_configs import LogContext, setup_logging
+from config.shapes.expressions import SharedDefinitions
 
 
 logger = setup_logging(logger=logging.getLogger(__name__))
@@ -43,44 +48,80 @@ class ROOTToPlain(object):
     Generic converter class handling conversion of multiple ROOT files including friends
     into a single ROOT or pandas DataFrame containing definitions, filter operations and
     column collections simultaneously using multiprocessing.
+
+    For the pandas and arrow dtypes, raw_path and filtered_path are cache directories (see ChunkedFrameCache).
+    Every input file (including its friends) is a separate part of the cache, keyed by the
+    path, size and modification time of the files, the collected columns and the normalized
+    definitions and filters. The filtered parts are additionally keyed by the filter function.
+    Only parts with changed inputs are rebuilt and unchanged datasets are loaded without
+    opening any ROOT file. The columns of each input file are moved from the RDataFrame
+    into an Arrow table without copying and written in chunks by the worker that built it,
+    so memory is bounded by a single input file per worker. The dataframe is kept as Arrow
+    table (arrow dtype) or converted to pandas once on access (pandas dtype). For the ROOT dtype, raw_path and filtered_path are ROOT files.
     """
 
     def __init__(
         self,
         raw_path: Union[str, None],
         filtered_path: Union[str, None] = None,
-        dtype: Literal["pandas", "ROOT"] = "pandas",
+        dtype: Literal["pandas", "arrow", "ROOT"] = "pandas",
         tree_name: Union[str, None] = None,
+        chunk_size: int = 500_000,
     ) -> None:
-        self.raw_path = Path(raw_path)
-        self.filtered_path = Path(filtered_path)
+        self.raw_path = Path(raw_path) if raw_path is not None else None
+        self.filtered_path = Path(filtered_path) if filtered_path is not None else None
         self._dataframe = None
+        self._table = None
         self.dataframe_path = None
         self.dtype = dtype
         self.tree_name = tree_name
         self.columns = None
 
+        self._raw_cache = ChunkedFrameCache(self.raw_path, chunk_size) if self.raw_path is not None else None
+        self._filtered_cache = ChunkedFrameCache(self.filtered_path, chunk_size) if self.filtered_path is not None else None
+        self._parts = None  # raw key -> arguments for _single_ArrowTable
+        self._stage = None  # (cache, keys) of the current dataframe
+        self._max_workers, self._description = 16, ""
+
     @property
-    def _pandas_dataframe(self) -> pd.DataFrame:
+    def _arrow_dataframe(self) -> pa.Table:
         """
-        Returns a dataframe. If the dataframe is None, it tries to load it from the raw_path or filtered_path,
-        where the filtered_path is preferred.
+        Returns an Arrow table. If the table is None, it is loaded from the cache parts of the last
+        setup_raw_dataframe/filter_dataframe call, building missing raw parts if needed. Without a
+        previous call, the last complete filtered or raw dataset is loaded, where the filtered one is preferred.
 
-        If both paths are None or do not exist, it raises a FileNotFoundError.
+        If both caches are None or empty, it raises a FileNotFoundError.
         (execute setup_raw_dataframe at least once before calling this method)
 
         Returns:
-            pd.DataFrame: The loaded plain dataframe.
+            pa.Table: The loaded plain table.
         """
-        if self._dataframe is None:
-            if self.filtered_path is not None and self.filtered_path.exists():
+        if self._table is None:
+            if self._stage is not None:
+                cache, keys = self._stage
+                if cache is self._raw_cache:
+                    self._build_raw_parts(keys)
+                self._table = cache.read_all_tables(keys)
+            elif self._filtered_cache is not None and self._filtered_cache.has_index():
                 logger.info(f"Loading filtered dataframe from {self.filtered_path}")
-                self._dataframe = pd.read_feather(self.filtered_path)
-            elif self.raw_path is not None and self.raw_path.exists():
+                self._table = self._filtered_cache.read_all_tables()
+            elif self._raw_cache is not None and self._raw_cache.has_index():
                 logger.info(f"Loading raw dataframe from {self.raw_path}")
-                self._dataframe = pd.read_feather(self.raw_path)
+                self._table = self._raw_cache.read_all_tables()
             else:
                 raise FileNotFoundError("No raw or filtered dataframe found.")
+        return self._table
+
+    @property
+    def _pandas_dataframe(self) -> pd.DataFrame:
+        """
+        Returns a dataframe, converted once from the Arrow table (see _arrow_dataframe).
+
+        Returns:
+            pd.DataFrame: The loaded plain dataframe.
+        """
+        if self._dataframe is None:
+            self._dataframe = self._arrow_dataframe.to_pandas()
         return self._dataframe
 
     @property
@@ -113,14 +154,15 @@ class ROOTToPlain(object):
         return self._dataframe
 
     @property
-    def dataframe(self) -> Union[pd.DataFrame, ROOT.RDataFrame]:
+    def dataframe(self) -> Union[pd.DataFrame, pa.Table, ROOT.RDataFrame]:
         """
         Returns the dataframe based on the specified dtype.
         If dtype is "pandas", it returns a pandas DataFrame.
+        If dtype is "arrow", it returns an Arrow table.
         If dtype is "ROOT", it returns a ROOT RDataFrame.
 
         Returns:
-            Union[pd.DataFrame, ROOT.RDataFrame]: The loaded dataframe.
+            Union[pd.DataFrame, pa.Table, ROOT.RDataFrame]: The loaded dataframe.
         """
         try:
             return getattr(self, f"_{self.dtype}_dataframe")
@@ -176,31 +218,39 @@ class ROOTToPlain(object):
             Tuple[ROOT.RDataFrame, list]: A tuple containing the modified RDataFrame and a list of collected columns.
         """
         columns = []
+        definition_items, filter_items = [], []
 
         if definitions is not None:
             if isinstance(definitions, dict):
-                iterator = definitions.items()
+                definition_items = list(definitions.items())
             elif isinstance(definitions, (list, tuple)) and all(isinstance(it, tuple) for it in definitions):
-                iterator = definitions
+                definition_items = list(definitions)
             else:
                 raise ValueError("Definitions must be a dictionary or a list/tuple of list/tuple pairs.")
 
-            for k, v in iterator:
-                rdf = rdf.Define(k, v)
-                columns.append(k)
-
         if filters is not None:
             if isinstance(filters, dict):
-                iterator = filters.items()
+                filter_items = list(filters.items())
             elif isinstance(filters, (list, tuple)) and all(isinstance(it, tuple) for it in filters):
-                iterator = filters
+                filter_items = list(filters)
             elif isinstance(filters, (list, tuple)) and all(isinstance(it, str) for it in filters):
-                iterator = [(f"filter_{i}", it) for i, it in enumerate(filters)]
+                filter_items = [(f"filter_{i}", it) for i, it in enumerate(filters)]
             else:
                 raise ValueError("Filters must be a dictionary or a list/tuple of list/tuple pairs. or a list/tuple of strings.")
 
-            for k, v in iterator:
-                rdf = rdf.Filter(v, k)
+        # sub-expressions repeated across the cuts and weights of all shifts are defined (and jitted) once
+        shared = SharedDefinitions(exclude=[k for k, _ in definition_items])
+        for _, v in definition_items + filter_items:
+            shared.add(v)
+        for k, v in shared.definitions():
+            rdf = rdf.Define(k, v)
+
+        for k, v in definition_items:
+            rdf = rdf.Define(k, shared.rewrite(v))
+            columns.append(k)
+
+        for k, v in filter_items:
+            rdf = rdf.Filter(shared.rewrite(v), k)
 
         if additional_columns is not None:
             if not (isinstance(additional_columns, (list, tuple)) and all(isinstance(it, str) for it in additional_columns)):
@@ -210,15 +260,16 @@ class ROOTToPlain(object):
 
         logger.debug(f"Columns: {columns}")
 
-        return rdf, list(set(columns))
+        return rdf, sorted(set(columns))
 
     @staticmethod
-    def _single_pandasDataFrame(
+    def _single_ArrowTable(
         args: Tuple[str, str, str, dict, str, str, list[str]],
-    ) -> pd.DataFrame:
+    ) -> pa.Table:
         """
-        Creates a pandas DataFrame from a ROOT RDataFrame, applying filters and definitions
-        and collecting the columns.
+        Creates an Arrow table from a ROOT RDataFrame, applying filters and definitions
+        and collecting the columns. The numpy arrays of AsNumpy are moved into the
+        table without copying numerical data.
 
         Args:
             args (Tuple[str, str, str, dict, str, str, list[str]]): A tuple containing
@@ -226,7 +277,7 @@ class ROOTToPlain(object):
             directory and index not used in this function.
 
         Returns:
-            pd.DataFrame: A pandas DataFrame with the collected columns.
+            pa.Table: An Arrow table with the collected columns.
         """
         _, _, filters, definitions, additional_columns, *paths = args
 
@@ -238,7 +289,24 @@ class ROOTToPlain(object):
             additional_columns=additional_columns,
         )
 
-        return pd.DataFrame(rdf.AsNumpy(columns))
+        return table_from_arrays(dict(rdf.AsNumpy(columns)))
+
+    @staticmethod
+    def _write_raw_part(args: Tuple[ChunkedFrameCache, str, tuple]) -> str:
+        """
+        Creates the Arrow table of a raw part (see _single_ArrowTable) and writes it to the
+        cache in the worker, so only the key is returned to the main process.
+
+        Args:
+            args (Tuple[ChunkedFrameCache, str, tuple]): The cache, the key of the part and
+            the arguments of _single_ArrowTable.
+
+        Returns:
+            str: The key of the written part.
+        """
+        cache, key, part = args
+        cache.write(key, ROOTToPlain._single_ArrowTable(part))
+        return key
 
     @staticmethod
     def _single_ROOTDataFrame(
@@ -284,6 +352,10 @@ class ROOTToPlain(object):
         and collects the columns to create a ROOT RDataFrame that are eighter kept as
         RDataFrame or saved to a pandas DataFrame in feather format.
 
+        For the pandas and arrow dtypes, only the cache keys of the parts are computed here. Parts
+        are built when they are needed, i.e. by filter_dataframe for changed inputs or
+        when the raw dataframe is accessed.
+
         Args:
             tree_and_filepaths (Iterable[Tuple[str, ...]]): A list of tuples containing
             the elements of (tree name, file paths, friend paths).
@@ -296,6 +368,16 @@ class ROOTToPlain(object):
         Returns:
             ROOTToRaw: The current instance of the ROOTToRaw class.
         """
+        if self.dtype in ("pandas", "arrow"):
+            return self._setup_raw_parts(
+                tree_and_filepaths=tree_and_filepaths,
+                filters=filters,
+                definitions=definitions,
+                additional_columns=additional_columns,
+                max_workers=max_workers,
+                description=description,
+            )
+
         if self.raw_path is not None and self.raw_path.exists():
             logger.info(f"Raw dataframe already exists at {self.raw_path}")
             self.dataframe_path = self.raw_path
@@ -318,37 +400,97 @@ class ROOTToPlain(object):
                     )
                     for idx, tree_and_filepaths in enumerate(tree_and_filepaths)
                 ],
-                function=(
-                    ROOTToPlain._single_pandasDataFrame if self.dtype == "pandas"
-                    else ROOTToPlain._single_ROOTDataFrame
-                ),
+                function=ROOTToPlain._single_ROOTDataFrame,
                 max_workers=max_workers,
                 description=description,
             )
 
-            if self.dtype == "ROOT":
-                self.tree_name, self.columns = tree_and_filepaths[0][0], results[0]
-                self._dataframe = ROOT.RDataFrame(
-                    self.tree_name,
-                    [str(tmpdir.joinpath(f"{i}.root")) for i, _ in enumerate(results)],
-                )
-
-            if self.dtype == "pandas":
-                self._dataframe = pd.concat(results, axis=0, ignore_index=True, sort=False)
+            self.tree_name, self.columns = tree_and_filepaths[0][0], results[0]
+            self._dataframe = ROOT.RDataFrame(
+                self.tree_name,
+                [str(tmpdir.joinpath(f"{i}.root")) for i, _ in enumerate(results)],
+            )
 
             if self.raw_path is not None:
                 logger.info(f"Saving raw dataframe to {self.raw_path}")
                 self.raw_path.parent.mkdir(parents=True, exist_ok=True)
+                self._dataframe.Snapshot(self.tree_name, str(self.raw_path), self.columns)
+                self.dataframe_path = self.raw_path
+
+        return self
 
-                if self.dtype == "pandas":
-                    self._dataframe.to_feather(str(self.raw_path))
+    def _setup_raw_parts(
+        self,
+        tree_and_filepaths: Iterable[Tuple[str, ...]],
+        filters: Union[Iterable[Tuple[str, str]], Dict[str, str], Iterable[str], None],
+        definitions: Union[Iterable[Tuple[str, str]], Dict[str, str], None],
+        additional_columns: Union[None, Iterable[str]],
+        max_workers: int,
+        description: str,
+    ) -> "ROOTToPlain":
+        """
+        Computes the cache keys of the raw parts from the file stamps of each input
+        (ntuple and friends), the collected columns and the normalized definitions and filters.
+        """
+        assert self._raw_cache is not None, f"raw_path is required for the {self.dtype} dtype."
+        normalized_definitions = normalize_selection(definitions)
+        selection = {
+            "definitions": normalized_definitions,
+            "filters": normalize_selection(filters),
+            "columns": sorted(set(additional_columns or []) | {name for name, _ in normalized_definitions}),
+        }
+
+        self._parts = {}
+        for idx, files in enumerate(tree_and_filepaths):
+            tree_name, *paths = files
+            key = content_key(tree_name, [file_stamp(path) for path in paths], selection)
+            self._parts[key] = (None, idx, filters, definitions, additional_columns, *files)
+
+        self._max_workers, self._description = max_workers, description
+        self._stage = (self._raw_cache, list(self._parts))
+        self._dataframe, self._table = None, None
+        self.dataframe_path = self.raw_path
+        return self
 
-                if self.dtype == "ROOT":
-                    self._dataframe.Snapshot(self.tree_name, str(self.raw_path), self.columns)
+    def _build_raw_parts(self, keys: Iterable[str]) -> None:
+        """
+        Builds the raw parts with the given keys that are not cached yet.
 
-                self.dataframe_path = self.raw_path
+        Args:
+            keys (Iterable[str]): The keys of the needed raw parts.
+        """
+        keys = list(keys)
+        missing = self._raw_cache.missing(keys)
+        if missing:
+            logger.info(f"Creating {len(missing)} of {len(keys)} raw parts in {self.raw_path}")
+            # every part is written by its worker, only one table per worker is held in memory
+            optional_process_pool(
+                args_list=[(self._raw_cache, key, self._parts[key]) for key in missing],
+                function=ROOTToPlain._write_raw_part,
+                max_workers=self._max_workers,
+                description=self._description,
+            )
+        else:
+            logger.info(f"All {len(keys)} raw parts in {self.raw_path} are up to date")
+        self._raw_cache.set_index(self._parts)
 
-        return self
+    @staticmethod
+    def _pandas_mask(
+        df: pd.DataFrame,
+        filter_function: Union[Iterable[Callable], Callable, Dict[str, Callable]],
+    ) -> Union[pd.Series, bool]:
+        mask = True
+        if isinstance(filter_function, (list, tuple)):
+            assert all(callable(it) for it in filter_function), "filter_funciton must be a callable function"
+            for _filter_function in filter_function:
+                mask &= _filter_function(df)
+        elif isinstance(filter_function, dict):
+            assert all(callable(it) for it in filter_function.values()), "filter_funciton must be a callable function"
+            for _filter_function in filter_function.values():
+                mask &= _filter_function(df)
+        elif callable(filter_function):
+            mask = filter_function(df)
+        return mask
 
     def filter_dataframe(
         self,
@@ -359,66 +501,98 @@ class ROOTToPlain(object):
         (pandas) or a (list of) string(s) (ROOT). The function modifies the dataframe in place
         and saves it to the filtered_path if provided.
 
+        For the pandas and arrow dtypes, the filter is applied part by part and has to act row-wise.
+        Only filtered parts whose raw part or filter function changed are rebuilt.
+
         Args:
             filter_function (Union[Iterable[Callable], Callable, str, Iterable[str]]): The filter function(s) to be applied.
 
         Returns:
             ROOTToPlain: The current instance of the ROOTToPlain class.
         """
+        if self.dtype in ("pandas", "arrow"):
+            return self._filter_parts(filter_function)
+
         if self.filtered_path is not None and self.filtered_path.exists():
             logger.info(f"Filtered dataframe already exists at {self.filtered_path}")
-            self.dataframe_path = self.filtered_path            
+            self.dataframe_path = self.filtered_path
             return self
 
         assert self._dataframe is not None or self.raw_path.exists(), "Dataframe is None. Please call setup_raw_dataframe first."
         logger.info(f"Filtering dataframe with {filter_function}")
 
-        if self.dtype == "pandas":
-            initial_shape, mask = self.dataframe.shape, True
-
-            if isinstance(filter_function, (list, tuple)):
-                assert all(callable(it) for it in filter_function), "filter_funciton must be a callable function"
-                for _filter_function in filter_function:
-                    mask &= _filter_function(self._dataframe)
-            elif isinstance(filter_function, dict):
-                assert all(callable(it) for it in filter_function.values()), "filter_funciton must be a callable function"
-                for _filter_function in filter_function.values():
-                    mask &= _filter_function(self._dataframe)
-            elif callable(filter_function):
-                mask = filter_function(self._dataframe)
-
-            self._dataframe = self._dataframe[mask]
-            logger.info(f"Filtered dataframe shape: {initial_shape} -> {self._dataframe.shape}")
-
-        if self.dtype == "ROOT":
-            initial_shape = self.dataframe.Count()
-
-            if isinstance(filter_function, (list, tuple)):
-                assert all(isinstance(it, str) for it in filter_function), "filter_funciton must be a string"
-                filter_function = " && ".join([f"({it})" for it in filter_function])
-            elif isinstance(filter_function, dict):
-                assert all(isinstance(it, str) for it in filter_function.values()), "filter_funciton must be a string"
-                filter_function = " && ".join([f"({it})" for it in filter_function.values()])
-            elif isinstance(filter_function, str):
-                pass
-
-            self._dataframe = self._dataframe.Filter(filter_function)
-            logger.info(f"Filtered dataframe shape: {initial_shape} -> {self._dataframe.Count()}")
+        initial_shape = self.dataframe.Count()
+
+        if isinstance(filter_function, (list, tuple)):
+            assert all(isinstance(it, str) for it in filter_function), "filter_funciton must be a string"
+            filter_function = " && ".join([f"({it})" for it in filter_function])
+        elif isinstance(filter_function, dict):
+            assert all(isinstance(it, str) for it in filter_function.values()), "filter_funciton must be a string"
+            filter_function = " && ".join([f"({it})" for it in filter_function.values()])
+        elif isinstance(filter_function, str):
+            pass
+
+        self._dataframe = self._dataframe.Filter(filter_function)
+        logger.info(f"Filtered dataframe shape: {initial_shape} -> {self._dataframe.Count()}")
 
         if self.filtered_path is not None:
             logger.info(f"Saving filtered dataframe to {self.filtered_path}")
             self.filtered_path.parent.mkdir(parents=True, exist_ok=True)
+            self._dataframe.Snapshot(
+                self.tree_name,
+                str(self.filtered_path),
+                [it for it in self._dataframe.GetColumnNames()],
+            )
+            self.dataframe_path = self.filtered_path
 
-            if self.dtype == "pandas":
-                self._dataframe.to_feather(str(self.filtered_path))
-            if self.dtype == "ROOT":
-                self._dataframe.Snapshot(
-                    self.tree_name,
-                    str(self.filtered_path),
-                    [it for it in self._dataframe.GetColumnNames()],
-                )
+        return self
+
+    def _filter_parts(
+        self,
+        filter_function: Union[Iterable[Callable], Callable, Dict[str, Callable]],
+    ) -> "ROOTToPlain":
+        """
+        Filters the raw parts, caching the filtered parts in the filtered cache if provided.
+        """
+        if self._parts is None:  # no inputs given, filter the last complete raw dataset
+            self._parts = {key: None for key in self._raw_cache.index()}
+        identity = function_identity(filter_function)
+        keys = {raw_key: content_key(raw_key, identity) for raw_key in self._parts}
+
+        if self._filtered_cache is not None and not self._filtered_cache.missing(keys.values()):
+            logger.info(f"All {len(keys)} filtered parts in {self.filtered_path} are up to date")
+            self._filtered_cache.set_index(keys.values())
+            self._stage, self._dataframe, self._table = (self._filtered_cache, list(keys.values())), None, None
+            self.dataframe_path = self.filtered_path
+            return self
 
+        todo = [
+            raw_key for raw_key, key in keys.items()
+            if self._filtered_cache is None or not self._filtered_cache.has(key)
+        ]
+        self._build_raw_parts(todo)
+        logger.info(f"Filtering {len(todo)} of {len(keys)} parts with {filter_function}")
+
+        tables, initial_rows, final_rows = [], 0, 0
+        for raw_key in todo:
+            table = self._raw_cache.read_table(raw_key)
+            initial_rows += table.num_rows
+            mask = self._pandas_mask(table.to_pandas(), filter_function)
+            table = table.filter(pa.array(np.asarray(mask, dtype=bool)))
+            final_rows += table.num_rows
+            if self._filtered_cache is not None:
+                self._filtered_cache.write(keys[raw_key], table)
+            else:
+                tables.append(table)
+        logger.info(f"Filtered rows of rebuilt parts: {initial_rows} -> {final_rows}")
+
+        if self._filtered_cache is not None:
+            self._filtered_cache.set_index(keys.values())
+            self._stage, self._dataframe, self._table = (self._filtered_cache, list(keys.values())), None, None
             self.dataframe_path = self.filtered_path
+        else:
+            self._stage, self._dataframe = None, None
+            self._table = pa.concat_tables(tables, promote_options="default")
 
         return self
 
@@ -791,48 +965,147 @@ class ProcessDataFrameManipulation:
 class CombinedDataFrameManipulation:
     """
     Helper to manipulate the dataframe for all processes combined, handling mainly
-    NaN values in the dataframe that arise from process stacking into a single dataframe.
+    NaN values in the dataframe that arise from process stacking into a single dataframe
+    and the splitting into folds.
+
+    NaN values are replaced based on a fill map, assigning each affected column either
+    a source column (i.e. the corresponding nominal weight, cut or variable) or a constant.
+    The map is applied with one vectorized operation per source column or constant.
     """
+    WEIGHT_AND_CUT_NAMES = (Keys.WEIGHT, Keys.CUT, Keys.ANTI_ISO_WEIGHT, Keys.ANTI_ISO_CUT)
+
+    @staticmethod
+    def _weight_and_cut_source(column: tuple) -> Union[tuple, None]:
+        contains = [it for it in CombinedDataFrameManipulation.WEIGHT_AND_CUT_NAMES if it in column]
+        return tuple_column(Keys.NOMINAL, contains[0]) if contains else None
+
+    @staticmethod
+    def _is_additional_nominal(column: tuple) -> bool:
+        return column[0] == Keys.NOMINAL and column[1] not in {
+            Keys.VARIABLES,
+            Keys.WEIGHT,
+            Keys.CUT,
+            f"_{Keys.CUT}",
+        }
+
     @staticmethod
-    def _fill_nans_in_variables(dfs: pd.DataFrame, filter_function: callable):
+    def nan_fill_map(
+        columns: Iterable[tuple],
+        weight_like: bool = True,
+        shift_like: bool = True,
+        nominal_additional: bool = True,
+        default_value: float = 0.0,
+    ) -> Dict[tuple, Union[tuple, float]]:
         """
-        Generic function to fill NaN values in variable columns with the nominal values.
+        Creates the fill map for the given columns:
+            - weight-like uncertainty weights and cuts -> Nominal (anti_iso) weight and cut
+            - shift-like uncertainty weights and cuts -> Nominal (anti_iso) weight and cut
+            - shift-like shifted variables -> Nominal variables
+            - nominal additional weights and cuts -> default_value
 
         Args:
-            dfs (pd.DataFrame): DataFrame to fill NaNs in.
-            filter_function (callable): Function to filter columns.
+            columns (Iterable[tuple]): Columns of the dataframe.
+            weight_like (bool, optional): Include weight-like uncertainties. Defaults to True.
+            shift_like (bool, optional): Include shift-like uncertainties. Defaults to True.
+            nominal_additional (bool, optional): Include nominal additional weights and cuts. Defaults to True.
+            default_value (float, optional): Value for nominal additional weights and cuts. Defaults to 0.0.
 
         Returns:
-            pd.DataFrame: DataFrame with NaNs filled.
-
+            Dict[tuple, Union[tuple, float]]: Column -> source column or constant.
         """
-        for column in filter(filter_function, dfs.columns):
-            variable, mask = column[-1], dfs.loc[:, column].isna()
-            nominal_column = tuple_column(Keys.NOMINAL, Keys.VARIABLES, variable)
-            dfs.loc[mask, column] = dfs.loc[mask, nominal_column]
+        fill_map = {}
+        for column in columns:
+            if (weight_like and column[0] == Keys.WEIGHT_LIKE) or (shift_like and column[0] == Keys.SHIFT_LIKE):
+                if (source := CombinedDataFrameManipulation._weight_and_cut_source(column)) is not None:
+                    fill_map[column] = source
+                elif column[0] == Keys.SHIFT_LIKE and Keys.VARIABLES in column:
+                    fill_map[column] = tuple_column(Keys.NOMINAL, Keys.VARIABLES, column[-1])
+            elif nominal_additional and CombinedDataFrameManipulation._is_additional_nominal(column):
+                if Keys.WEIGHT in column or Keys.CUT in column:
+                    fill_map[column] = default_value
 
-        return dfs
+        return fill_map
 
     @staticmethod
-    def _fill_nans_in_weights_and_cuts(dfs: pd.DataFrame, filter_function: callable):
+    def apply_nan_fill_map(df: pd.DataFrame, fill_map: Dict[tuple, Union[tuple, float]]) -> pd.DataFrame:
         """
-        Generic function to fill NaN values in weight and cut columns with the nominal values.
+        Replaces NaN values according to the fill map. Columns are grouped by their source
+        column or constant and the NaN masks of a group are found in a single vectorized
+        operation. All source columns are read before any constant is filled, i.e. filling
+        does not depend on the order of the map. Only columns containing NaNs are written,
+        column by column, so that they keep the type of their values (i.e. boolean cuts).
 
         Args:
-            dfs (pd.DataFrame): DataFrame to fill NaNs in.
-            filter_function (callable): Function to filter columns.
+            df (pd.DataFrame): DataFrame to fill NaNs in, modified in place.
+            fill_map (Dict[tuple, Union[tuple, float]]): Column -> source column or constant.
 
         Returns:
-            None: The function modifies the DataFrame in place.
+            pd.DataFrame: DataFrame with NaNs filled.
+        """
+        groups = defaultdict(list)
+        for column, source in fill_map.items():
+            if column in df.columns:
+                groups[source].append(column)
+
+        updates = []
+        for source, columns in groups.items():
+            masks = df[columns].isna()
+            has_nans = masks.any(axis=0)
+            if not has_nans.any():
+                continue
+            fill = df[source].copy() if isinstance(source, tuple) else source
+            updates.extend((column, masks[column].to_numpy(), fill) for column in has_nans.index[has_nans])
+
+        for column, mask, fill in updates:
+            df.loc[mask, column] = fill[mask] if isinstance(fill, pd.Series) else fill
+
+        return df
+
+    @staticmethod
+    def _fill_nans(
+        dfs: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+        message: str,
+        **kwargs,
+    ) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
+        if isinstance(dfs, (list, tuple)):
+            return [CombinedDataFrameManipulation._fill_nans(it, message, **kwargs) for it in tqdm(dfs)]
+        elif isinstance(dfs, dict):
+            return type(dfs)({k: CombinedDataFrameManipulation._fill_nans(v, message, **kwargs) for k, v in tqdm(dfs.items())})
+        elif isinstance(dfs, pd.DataFrame):
+            with LogContext(logger).duplicate_filter():
+                logger.info(message)
+            return CombinedDataFrameManipulation.apply_nan_fill_map(
+                df=dfs,
+                fill_map=CombinedDataFrameManipulation.nan_fill_map(dfs.columns, **kwargs),
+            )
+        else:
+            raise NotImplementedError(f"Unsupported type: {type(dfs)}")
+
+    @staticmethod
+    def fill_nans(
+        dfs: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+        default_value: float = 0.0,
+    ) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
         """
-        names = {Keys.WEIGHT, Keys.CUT, Keys.ANTI_ISO_WEIGHT, Keys.ANTI_ISO_CUT}
-        for column in filter(filter_function, dfs.columns):
-            contains = [it for it in names if it in column]
-            if contains:
-                mask = dfs.loc[:, column].isna()
-                dfs.loc[mask, column] = dfs.loc[mask, tuple_column(Keys.NOMINAL, contains[0])]
+        Replaces NaN values in weight-like and shift-like uncertainty and nominal additional
+        columns at once, equivalent to fill_nans_in_weight_like, fill_nans_in_shift_like and
+        fill_nans_in_nominal_additional applied in this order.
+
+        To be applied after procecss stacking. Any NaNs before stacking are erroneous.
+
+        Args:
+            dfs (Union[pd.DataFrame, Iterable[pd.DataFrame]]): DataFrame or iterable of DataFrames to fill NaNs in.
+            default_value (float, optional): Default value for nominal additional weights and cuts. Defaults to 0.0.
 
-        return dfs
+        Returns:
+            Union[pd.DataFrame, Iterable[pd.DataFrame]]: DataFrame or iterable of DataFrames with NaNs filled.
+        """
+        return CombinedDataFrameManipulation._fill_nans(
+            dfs,
+            "Filling NaN uncertainty weights, cuts and shifted variables with Nominal ones"
+            f" and nominal additional weights and cuts with {default_value}",
+            default_value=default_value,
+        )
 
     @staticmethod
     def fill_nans_in_weight_like(
@@ -840,32 +1113,22 @@ class CombinedDataFrameManipulation:
     ) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
         """
         Replaces NaN values in weight-like uncertainties columns with Nominal weight and cut
-        values. If has_jetFakes is True, it will replace the cut NaN values for events
-        with jetFakes_identifier using anti_iso cut values.
+        values.
 
         To be applied after procecss stacking. Any NaNs before stacking are erroneous.
 
         Args:
             dfs (Union[pd.DataFrame, Iterable[pd.DataFrame]]): DataFrame or iterable of DataFrames to fill NaNs in.
-            has_jetFakes (bool, optional): Flag to indicate if jetFakes are present. Defaults to False.
-            jetFakes_identifier (str, optional): Identifier for jetFakes. Defaults to "is_jetFakes".
 
         Returns:
             Union[pd.DataFrame, Iterable[pd.DataFrame]]: DataFrame or iterable of DataFrames with NaNs filled.
         """
-        if isinstance(dfs, (list, tuple)):
-            return [CombinedDataFrameManipulation.fill_nans_in_weight_like(it) for it in tqdm(dfs)]
-        elif isinstance(dfs, dict):
-            return type(dfs)({k: CombinedDataFrameManipulation.fill_nans_in_weight_like(v) for k, v in tqdm(dfs.items())})
-        elif isinstance(dfs, pd.DataFrame):
-            with LogContext(logger).duplicate_filter():
-                logger.info("Filling NaN weight-like uncertainty weight and cut with Nominal (anti_iso) weight and cut")
-            return CombinedDataFrameManipulation._fill_nans_in_weights_and_cuts(
-                dfs=dfs,
-                filter_function=lambda it: it[0] == Keys.WEIGHT_LIKE,
-            )
-        else:
-            raise NotImplementedError(f"Unsupported type: {type(dfs)}")
+        return CombinedDataFrameManipulation._fill_nans(
+            dfs,
+            "Filling NaN weight-like uncertainty weight and cut with Nominal (anti_iso) weight and cut",
+            shift_like=False,
+            nominal_additional=False,
+        )
 
     @staticmethod
     def fill_nans_in_shift_like(
@@ -875,42 +1138,21 @@ class CombinedDataFrameManipulation:
     ) -> Union[pd.DataFrame, Iterable[pd.DataFrame]]:
         """
         Replaces NaN values in shifted variables, cut and weight columns with Nominal variable values.
-        If has_jetFakes is True, it will replace the cut NaN values for events
-        with jetFakes_identifier using anti_iso cut values.
 
         Args:
             dfs (Union[pd.DataFrame, Iterable[pd.DataFrame]]): DataFrame or iterable of DataFrames to fill NaNs in.
-            has_jetFakes (bool, optional): Flag to indicate if jetFakes are present. Defaults to False.
-            jetFakes_identifier (str, optional): Identifier for jetFakes. Defaults to "is_jetFakes".
+            has_jetFakes (bool, optional): Unused, kept for compatibility. Defaults to False.
+            jetFakes_identifier (str, optional): Unused, kept for compatibility. Defaults to "is_jetFakes".
 
         Returns:
             Union[pd.DataFrame, Iterable[pd.DataFrame]]: DataFrame or iterable of DataFrames with NaNs filled.
         """
-        kwargs = dict(has_jetFakes=has_jetFakes, jetFakes_identifier=jetFakes_identifier)
-
-        if isinstance(dfs, (list, tuple)):
-            return [CombinedDataFrameManipulation.fill_nans_in_shift_like(it, **kwargs) for it in tqdm(dfs)]
-        elif isinstance(dfs, dict):
-            return type(dfs)({k: CombinedDataFrameManipulation.fill_nans_in_shift_like(v, **kwargs) for k, v in tqdm(dfs.items())})
-        elif isinstance(dfs, pd.DataFrame):
-            with LogContext(logger).duplicate_filter():
-                logger.info("Filling NaN shift-like uncertainty weight and cut with Nominal (anti_iso) weight and cut")
-
-            dfs = CombinedDataFrameManipulation._fill_nans_in_weights_and_cuts(
-                dfs=dfs,
-                filter_function=lambda it: it[0] == Keys.SHIFT_LIKE,
-            )
-
-            with LogContext(logger).duplicate_filter():
-                logger.info("Filling NaN in shifted variables with Nominal variables")
-
-            return CombinedDataFrameManipulation._fill_nans_in_variables(
-                dfs=dfs,
-                filter_function=lambda it: it[0] == Keys.SHIFT_LIKE and Keys.VARIABLES in it
-            )
-
-        else:
-            raise NotImplementedError(f"Unsupported type: {type(dfs)}")
+        return CombinedDataFrameManipulation._fill_nans(
+            dfs,
+            "Filling NaN shift-like uncertainty weight, cut and shifted variables with Nominal ones",
+            weight_like=False,
+            nominal_additional=False,
+        )
 
     @staticmethod
     def fill_nans_in_nominal_additional(
@@ -928,30 +1170,69 @@ class CombinedDataFrameManipulation:
         Returns:
             Union[pd.DataFrame, Iterable[pd.DataFrame]]: DataFrame or iterable of DataFrames with NaNs filled.
         """
-        if isinstance(dfs, (list, tuple)):
-            return [CombinedDataFrameManipulation.fill_nans_in_nominal_additional(it) for it in tqdm(dfs)]
-        elif isinstance(dfs, dict):
-            return type(dfs)({k: CombinedDataFrameManipulation.fill_nans_in_nominal_additional(v) for k, v in tqdm(dfs.items())})
-        elif isinstance(dfs, pd.DataFrame):
-            with LogContext(logger).duplicate_filter():
-                logger.info("Filling NaNs in nominal additional with Nominal Weights")
+        return CombinedDataFrameManipulation._fill_nans(
+            dfs,
+            f"Filling NaNs in nominal additional with {default_value}",
+            weight_like=False,
+            shift_like=False,
+            default_value=default_value,
+        )
 
-            def is_additional_nominal(x):
-                return x[0] == Keys.NOMINAL and x[1] not in {
-                    Keys.VARIABLES,
-                    Keys.WEIGHT,
-                    Keys.CUT,
-                    f"_{Keys.CUT}",
-                }
+    @staticmethod
+    def fold_indices(
+        df: pd.DataFrame,
+        subfold_pattern: Iterable[bool] = (True, True, False, False),
+        event_column: tuple = tuple_column(Keys.EVENT, "event"),
+    ) -> np.ndarray:
+        """
+        Computes the fold index of each event once: events with odd IDs belong to fold0,
+        events with even IDs to fold1. Within a fold, events are assigned to the training
+        (True) or validation (False) subfold by repeating subfold_pattern over the rows.
 
-            for column in filter(is_additional_nominal, dfs.columns):
-                if Keys.WEIGHT in column or Keys.CUT in column:
-                    mask = dfs.loc[:, column].isna()
-                    dfs.loc[mask, column] = default_value
+        Args:
+            df (pd.DataFrame): DataFrame of a single process.
+            subfold_pattern (Iterable[bool], optional): Training/validation pattern. Defaults to (True, True, False, False).
+            event_column (tuple, optional): Column holding the event ID. Defaults to (Event, event).
 
-            return dfs
-        else:
-            raise NotImplementedError(f"Unsupported type: {type(dfs)}")
+        Returns:
+            np.ndarray: 2 * fold + (0 for training, 1 for validation) for each row.
+        """
+        fold = 1 - (df[event_column].to_numpy() % 2).astype(np.int8)
+        validation = ~np.resize(np.asarray(subfold_pattern, dtype=bool), len(df))
+        return 2 * fold + validation.astype(np.int8)
+
+    @staticmethod
+    def split_folds_by_indices(
+        df: pd.DataFrame,
+        indices: np.ndarray,
+        n_folds: int = 2,
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Splits the dataframe into folds using the fold indices (see fold_indices). The rows are
+        reordered once by fold and subfold, such that each fold and subfold is a slice (view) of
+        the reordered dataframe. Within each subfold the original row order is kept,
+        fold<k> holds the rows of fold<k>_training followed by those of fold<k>_validation.
+
+        Args:
+            df (pd.DataFrame): DataFrame to split.
+            indices (np.ndarray): Fold index of each row.
+            n_folds (int, optional): Number of folds. Defaults to 2.
+
+        Returns:
+            Dict[str, pd.DataFrame]: Fold name -> slice of the reordered dataframe.
+        """
+        order = np.argsort(indices, kind="stable")
+        df = df.take(order).reset_index(drop=True)
+        bounds = np.searchsorted(indices[order], np.arange(2 * n_folds + 1))
+
+        folds = {}
+        for fold in range(n_folds):
+            start, middle, stop = bounds[2 * fold], bounds[2 * fold + 1], bounds[2 * fold + 2]
+            folds[f"fold{fold}"] = df.iloc[start:stop]
+            folds[f"fold{fold}_training"] = df.iloc[start:middle]
+            folds[f"fold{fold}_validation"] = df.iloc[middle:stop]
+
+        return folds
 
     @staticmethod
     def split_folds(
@@ -1,9 +1,16 @@
 import concurrent.futures
 import re
+import sys
 from typing import Any, Callable, Generator, List, Optional, Tuple, Union
 
 from tqdm import tqdm
 
+try:
+    from config.logging_setup_configs import LogQueue
+except ModuleNotFoundError:
+    sys.path.extend([".", ".."])
+    from config.logging_setup_configs import LogQueue
+
 
 TRAINING_VARIABLES = [
     "pt_1",
@@ -167,7 +174,10 @@ def optional_process_pool(
         results = [function(args) for args in args_list]
     else:
         n = max_workers if max_workers is not None else len(args_list)
-        with concurrent.futures.ProcessPoolExecutor(max_workers=n) as executor:
+        # the workers log through a queue to the main process instead of writing themselves
+        with LogQueue() as log_queue, concurrent.futures.ProcessPoolExecutor(
+            max_workers=n, initializer=log_queue.initializer()
+        ) as executor:
             results = list(
                 tqdm(
                     executor.map(function, args_list),
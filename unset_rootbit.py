@@ -1,44 +1,155 @@
 import ROOT
 import glob
 import argparse
+import json
+import multiprocessing
 import os
 from rich.progress import Progress
 
-parser = argparse.ArgumentParser()
+parser = argparse.ArgumentParser(
+    description="Reset the kEntriesReshuffled bit of the ntuple trees in {basepath}/*/*/*.root"
+)
 parser.add_argument("--basepath", type=str, required=True)
-parser.add_argument("--check", action="store_true")
-args = parser.parse_args()
-
-# base_path = "ntuples/2018/*/*/*.root"
-# dataset = yaml.load(open("datasets.yaml"), Loader=yaml.Loader)
-base_path = os.path.join(args.basepath, "*/*/*.root")
-ntuples = glob.glob(base_path)
-with Progress() as progress:
-    task = progress.add_task("Updating Statusbit...", total=len(ntuples))
-    for ntuple in ntuples:
-        # filename = os.path.basename(ntuple)
-        # open the ntuple
-        if args.check:
-            # do a chort check if it worked
-            print("Checking", ntuple)
-            rfile = ROOT.TFile(ntuple, "READ")
-            t = rfile.Get("ntuple")
-            if t.TestBit(ROOT.TTree.EStatusBits.kEntriesReshuffled):
-                print("kEntriesReshuffled bit is true")
-            else:
-                print("kEntriesReshuffled bit is false")
-            rfile.Close()
-        else:
-            print("Updating {}".format(ntuple))
-            rfile = ROOT.TFile(ntuple, "UPDATE")
-            if "ntuple" not in [x.GetTitle() for x in rfile.GetListOfKeys()]:
-                print("ntuple tree not found, continueing")
-                rfile.Close()
-                continue
-            t = rfile.Get("ntuple")
-            if t.TestBit(ROOT.TTree.EStatusBits.kEntriesReshuffled):
-                print("Bit is set, resetting....")
-                t.ResetBit(ROOT.TTree.EStatusBits.kEntriesReshuffled)
-            rfile.Write()
-            rfile.Close()
-        progress.update(task, advance=1)
+parser.add_argument(
+    "--check",
+    "--dry-run",
+    dest="check",
+    action="store_true",
+    help="Only report the files that need to be changed, nothing is written.",
+)
+parser.add_argument("--workers", type=int, default=4, help="Number of files processed in parallel.")
+parser.add_argument(
+    "--manifest",
+    type=str,
+    default="rootbit_manifest.jsonl",
+    help="Record of the finished files, unchanged files listed in it are skipped by later runs.",
+)
+parser.add_argument("--force", action="store_true", help="Process all files, ignoring the manifest.")
+
+OPERATION = "unset_rootbit"
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class Manifest:
+    """
+    Append-only record of the files finished by a maintenance operation, one JSON object per line.
+
+    A file is skipped as long as its size and modification time match the recorded ones,
+    i.e. a file that is replaced by a new production is processed again.
+    """
+
+    def __init__(self, path, operation):
+        self.path = path
+        self.operation = operation
+        self.finished = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # last line of an interrupted run
+                        continue
+                    if record.get("operation") == operation:
+                        self.finished[record["path"]] = (record["size"], record["mtime"])
+
+    def is_finished(self, path):
+        if path not in self.finished:
+            return False
+        stamp = file_stamp(path)
+        return self.finished[path] == (stamp["size"], stamp["mtime"])
+
+    def add(self, stamp, status):
+        record = dict(stamp, operation=self.operation, status=status)
+        # flushed per file, so an interrupted run loses nothing
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.finished[stamp["path"]] = (stamp["size"], stamp["mtime"])
+
+
+def unset_rootbit(ntuple, check):
+    """
+    Reset the kEntriesReshuffled bit of the ntuple tree. The file is only opened for writing
+    if the bit is set.
+
+    Returns:
+        str: status of the file, "reset" ("needs_reset" if checking), "clean" or "no_tree"
+    """
+    rfile = ROOT.TFile(ntuple, "READ")
+    if "ntuple" not in [x.GetTitle() for x in rfile.GetListOfKeys()]:
+        rfile.Close()
+        return "no_tree"
+    bit_set = rfile.Get("ntuple").TestBit(ROOT.TTree.EStatusBits.kEntriesReshuffled)
+    rfile.Close()
+    if not bit_set:
+        return "clean"
+    if check:
+        return "needs_reset"
+
+    rfile = ROOT.TFile(ntuple, "UPDATE")
+    t = rfile.Get("ntuple")
+    t.ResetBit(ROOT.TTree.EStatusBits.kEntriesReshuffled)
+    rfile.Write()
+    rfile.Close()
+    return "reset"
+
+
+def job_wrapper(args):
+    ntuple, check = args
+    try:
+        status = unset_rootbit(ntuple, check)
+    except Exception as e:
+        return ntuple, f"error: {e}", None
+    # stamp of the file after the change, it is compared with the file in later runs
+    return ntuple, status, file_stamp(ntuple)
+
+
+def maintain(ntuples, check, manifest, workers):
+    """
+    Process the ntuples in a pool of workers, finished files are recorded in the manifest.
+    In the check mode, the manifest is only read.
+
+    Returns:
+        dict: status -> list of files
+    """
+    results = {}
+    arguments = [(ntuple, check) for ntuple in ntuples]
+    context = multiprocessing.get_context("fork")
+    with Progress() as progress, context.Pool(max(1, min(workers, len(ntuples)))) as pool:
+        task = progress.add_task(
+            "Checking Statusbit..." if check else "Updating Statusbit...", total=len(ntuples)
+        )
+        for ntuple, status, stamp in pool.imap_unordered(job_wrapper, arguments, chunksize=4):
+            results.setdefault(status, []).append(ntuple)
+            if status == "reset" or status == "needs_reset":
+                progress.console.print(f"{'Bit is set' if check else 'Bit reset'}: {ntuple}")
+            elif status.startswith("error"):
+                progress.console.print(f"[red]{ntuple}: {status}[/red]")
+            if not check and stamp is not None:
+                manifest.add(stamp, status)
+            progress.update(task, advance=1)
+    return results
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # base_path = "ntuples/2018/*/*/*.root"
+    # dataset = yaml.load(open("datasets.yaml"), Loader=yaml.Loader)
+    base_path = os.path.join(args.basepath, "*/*/*.root")
+    ntuples = sorted(os.path.abspath(ntuple) for ntuple in glob.glob(base_path))
+    manifest = Manifest(args.manifest, OPERATION)
+    todo = [ntuple for ntuple in ntuples if args.force or not manifest.is_finished(ntuple)]
+    print(f"{len(ntuples) - len(todo)} of {len(ntuples)} files already finished according to {manifest.path}")
+
+    results = maintain(todo, args.check, manifest, args.workers) if todo else {}
+    for status, files in sorted(results.items()):
+        print(f"{status}: {len(files)} files")
+    if args.check and results.get("needs_reset"):
+        print("Files with the kEntriesReshuffled bit set:")
+        for ntuple in sorted(results["needs_reset"]):
+            print(ntuple)